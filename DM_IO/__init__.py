@@ -10,6 +10,7 @@ import gettext
 
 # local libraries
 from . import dm3_image_utils
+from . import header_cache
 
 
 _ = gettext.gettext
@@ -17,14 +18,16 @@ _ = gettext.gettext
 
 class DM3IODelegate(object):
 
-    def __init__(self, api):
+    def __init__(self, api, cache=None):
         self.__api = api
+        # a header_cache.HeaderCache for the tags of files being read, or None
+        self.__cache = cache
         self.io_handler_id = "dm-io-handler"
         self.io_handler_name = _("DigitalMicrograph Files")
         self.io_handler_extensions = ["dm3", "dm4"]
 
     def read_data_and_metadata(self, extension, file_path):
-        data, calibrations, intensity, title, metadata = dm3_image_utils.load_image(file_path)
+        data, calibrations, intensity, title, metadata = dm3_image_utils.load_image(file_path, cache=self.__cache)
         dimensional_calibrations = list()
         for calibration in calibrations:
             offset, scale, units = calibration[0], calibration[1], calibration[2]
@@ -34,7 +37,7 @@ class DM3IODelegate(object):
         return self.__api.create_data_and_metadata_from_data(data, dimensional_calibrations=dimensional_calibrations, intensity_calibration=intensity_calibration, metadata=metadata)
 
     def can_write_data_and_metadata(self, data_and_metadata, extension):
-        return extension == "dm3"
+        return extension in ("dm3", "dm4")
 
     def write_data_and_metadata(self, data_and_metadata, file_path, extension):
         data = data_and_metadata.data
@@ -47,11 +50,11 @@ class DM3IODelegate(object):
         intensity_calibration = self.__api.create_calibration(offset, scale, units)
         metadata = data_and_metadata.metadata
         with open(file_path, 'wb') as f:
-            dm3_image_utils.save_image(data, dimensional_calibrations, intensity_calibration, metadata, f)
+            dm3_image_utils.save_image(data, dimensional_calibrations, intensity_calibration, metadata, f, 4 if extension == "dm4" else 3)
 
 
-def load_image(file_path):
-    return dm3_image_utils.load_image(file_path)
+def load_image(file_path, memmap=False, contiguous=False):
+    return dm3_image_utils.load_image(file_path, memmap, contiguous)
 
 
 class DM3IOExtension(object):
@@ -62,8 +65,10 @@ class DM3IOExtension(object):
     def __init__(self, api_broker):
         # grab the api object.
         api = api_broker.get_api(version="1", ui_version="1")
+        # files are often reopened (browsing, re-import), so keep their parsed tags on disk.
+        cache = header_cache.HeaderCache(header_cache.default_directory("dm_io"))
         # be sure to keep a reference or it will be closed immediately.
-        self.__io_handler_ref = api.create_data_and_metadata_io_handler(DM3IODelegate(api))
+        self.__io_handler_ref = api.create_data_and_metadata_io_handler(DM3IODelegate(api, cache))
 
     def close(self):
         # close will be called when the extension is unloaded. in turn, close any references so they get closed. this
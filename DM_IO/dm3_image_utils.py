@@ -11,7 +11,14 @@
 # from the tag file datatype. I think these are used more than the tag
 # datratypes in describing the data.
 # from .parse_dm3 import *
+import concurrent.futures
+import glob
+import io
+import itertools
 import logging
+import numbers
+import re
+import tempfile
 import numpy
 
 from . import parse_dm3
@@ -32,6 +39,13 @@ structarray_to_np_map = {
 
 np_to_structarray_map = {v: k for k, v in iter(structarray_to_np_map.items())}
 
+# image data is written to the file in chunks of at most this many bytes
+write_chunk_size = 16 * 1024 * 1024
+
+# image data that is rearranged while it is read is read in blocks of at
+# most this many bytes (or a single plane if that is bigger)
+read_chunk_size = 16 * 1024 * 1024
+
 # we want to amp any image type to a single np array type
 # but a sinlge np array type could map to more than one dm type.
 # For the moment, we won't be strict about, eg, discriminating
@@ -58,13 +72,138 @@ dm_image_dtypes = {
 }
 
 
-def imagedatadict_to_ndarray(imdict):
+def arrayref_to_dtype(arr):
+    if len(arr.typecodes) == 1:
+        return numpy.dtype(arr.typecodes[0])
+    else:
+        return numpy.dtype(structarray_to_np_map[tuple(arr.typecodes)])
+
+
+def arrayref_to_ndarray(arr, file, memmap=True):
+    """
+    Returns a 1d numpy array for the arrayref arr, which must have been
+    parsed from file. If memmap is True the array is read-only and real
+    files are memory mapped (other file-like objects are read into memory).
+    Otherwise the data is read into a new array.
+    """
+    dtype = arrayref_to_dtype(arr)
+    if not memmap:
+        im = numpy.empty((arr.length, ), dtype=dtype)
+        file.seek(arr.offset)
+        if file.readinto(memoryview(im).cast('B')) != arr.bytelen():
+            raise IOError("image data is truncated")
+        return im
+    try:
+        file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        file.seek(arr.offset)
+        return numpy.frombuffer(file.read(arr.bytelen()), dtype=dtype)
+    if arr.length == 0:  # mmap refuses empty maps
+        return numpy.frombuffer(bytes(), dtype=dtype)
+    return numpy.memmap(file, dtype=dtype, mode='r', offset=arr.offset, shape=(arr.length, ))
+
+
+def normalize_key(key, shape):
+    """
+    Returns the numpy basic index key (integers, slices and at most one
+    Ellipsis) for an array of shape as a tuple with one integer or slice per
+    axis. Raises IndexError for out of range integers and TypeError for
+    anything that would need advanced indexing.
+    """
+    key = key if isinstance(key, tuple) else (key, )
+    if any(k is Ellipsis for k in key):
+        index = next(i for i, k in enumerate(key) if k is Ellipsis)
+        key = key[:index] + (slice(None), ) * (len(shape) - len(key) + 1) + key[index + 1:]
+    if len(key) > len(shape):
+        raise IndexError("too many indices for array of shape {}".format(shape))
+    key = key + (slice(None), ) * (len(shape) - len(key))
+    normalized = list()
+    for k, n in zip(key, shape):
+        if isinstance(k, slice):
+            normalized.append(k)
+        elif isinstance(k, numbers.Integral):
+            if not -n <= k < n:
+                raise IndexError("index {} is out of bounds for axis with size {}".format(k, n))
+            normalized.append(int(k) % n)
+        else:
+            raise TypeError("only integers, slices and Ellipsis are valid indices, not {}".format(type(k)))
+    return tuple(normalized)
+
+
+def read_region(file, offset, shape, dtype, key):
+    """
+    Reads the region key (see normalize_key) of the C order array of shape
+    and dtype stored at offset in file, without reading the rest of the
+    array. Integer indices are kept as axes of length 1.
+    Real files are memory mapped and only the region is copied; other
+    file-like objects are read with one seek per contiguous run of the
+    region.
+    """
+    key = normalize_key(key, shape)
+    ranges = [range(k, k + 1) if isinstance(k, int) else range(*k.indices(n)) for k, n in zip(key, shape)]
+    region = numpy.empty([len(r) for r in ranges], dtype=dtype)
+    if region.size == 0:
+        return region
+    try:
+        file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        pass
+    else:
+        data = numpy.memmap(file, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+        region[...] = data[tuple(slice(k, k + 1) if isinstance(k, int) else k for k in key)]
+        return region
+    # merge trailing axes into longer contiguous runs wherever the region
+    # covers the whole of the inner axis
+    dims, ranges = list(shape), list(ranges)
+    while len(dims) > 1 and ranges[-1] == range(dims[-1]) and ranges[-2].step == 1:
+        n = dims.pop()
+        ranges.pop()
+        ranges[-1] = range(ranges[-1].start * n, ranges[-1].stop * n)
+        dims[-1] *= n
+    strides = [int(numpy.prod(dims[i + 1:])) for i in range(len(dims))]
+    inner = ranges[-1]
+    first, last = min(inner[0], inner[-1]), max(inner[0], inner[-1])
+    take = numpy.array(inner) - first if inner != range(first, last + 1) else slice(None)
+    itemsize = numpy.dtype(dtype).itemsize
+    out = region.reshape(-1)
+    for index, outer in enumerate(itertools.product(*ranges[:-1])):
+        position = sum(i * stride for i, stride in zip(outer, strides)) + first
+        file.seek(offset + position * itemsize)
+        run = numpy.frombuffer(file.read((last - first + 1) * itemsize), dtype=dtype)
+        out[index * len(inner):(index + 1) * len(inner)] = run[take]
+    return region
+
+
+def read_planes_to_last_axis(file, arr, shape, out):
+    """
+    Reads the 3d array of shape (planes, y, x) left in file as the arrayref
+    arr into out, of shape (y, x, planes). The planes are read a block at a
+    time and transposed into out, so besides out only one block of at most
+    read_chunk_size bytes is held.
+    """
+    dtype = arrayref_to_dtype(arr)
+    plane_size = shape[1] * shape[2] * dtype.itemsize
+    planes = max(1, read_chunk_size // max(1, plane_size))
+    block = numpy.empty((min(planes, shape[0]), shape[1], shape[2]), dtype=dtype)
+    file.seek(arr.offset)
+    for start in range(0, shape[0], planes):
+        planes_block = block[:min(planes, shape[0] - start)]
+        if file.readinto(memoryview(planes_block).cast('B')) != planes_block.nbytes:
+            raise IOError("image data is truncated")
+        out[:, :, start:start + len(planes_block)] = numpy.moveaxis(planes_block, 0, 2)
+
+
+def imagedatadict_to_ndarray(imdict, file=None, memmap=True):
     """
     Converts the ImageData dictionary, imdict, to an nd image.
+    If the data was left in the file (see parse_dm3.arrayref), file must be
+    the file it was parsed from and memmap is passed to arrayref_to_ndarray.
     """
     arr = imdict['Data']
     im = None
-    if isinstance(arr, parse_dm3.array.array):
+    if isinstance(arr, parse_dm3.arrayref):
+        im = arrayref_to_ndarray(arr, file, memmap)
+    elif isinstance(arr, parse_dm3.array.array):
         im = numpy.asarray(arr, dtype=arr.typecode)
     elif isinstance(arr, parse_dm3.structarray):
         t = tuple(arr.typecodes)
@@ -81,6 +220,38 @@ def imagedatadict_to_ndarray(imdict):
     return im
 
 
+def ndarray_to_chunks(nparr, chunk_size=None):
+    """
+    Yields the bytes of nparr, in C order and native byte order, in chunks
+    of at most chunk_size bytes (unless a single element is bigger).
+    Contiguous arrays in native byte order are not copied; other arrays are
+    copied, and byte swapped, one chunk at a time.
+    """
+    chunk_size = chunk_size if chunk_size is not None else write_chunk_size
+    native = nparr.dtype.newbyteorder('=')
+    if nparr.flags.c_contiguous:
+        flat = nparr.reshape(-1)
+        items = max(1, chunk_size // max(1, nparr.itemsize))
+        for start in range(0, len(flat), items):
+            yield flat[start:start + items].astype(native, copy=False).view(numpy.uint8)
+    elif nparr.ndim > 1 and nparr[0].nbytes > chunk_size:
+        for row in nparr:
+            for chunk in ndarray_to_chunks(row, chunk_size):
+                yield chunk
+    else:
+        rows = max(1, chunk_size // max(1, nparr[0:1].nbytes))
+        for start in range(0, nparr.shape[0], rows):
+            yield numpy.ascontiguousarray(nparr[start:start + rows], native).reshape(-1).view(numpy.uint8)
+
+
+def ndarray_to_streamarray(nparr, typecodes):
+    """
+    Wraps nparr in a parse_dm3.streamarray, so it is written to the file
+    straight from its own buffer.
+    """
+    return parse_dm3.streamarray(list(typecodes), nparr.size, lambda: ndarray_to_chunks(nparr))
+
+
 def ndarray_to_imagedatadict(nparr):
     """
     Convert the numpy array nparr into a suitable ImageList entry dictionary.
@@ -105,17 +276,16 @@ def ndarray_to_imagedatadict(nparr):
             rgba_image[:,:,3] = 255
             rgb_view = rgba_image.view(numpy.int32).reshape(rgba_image.shape[:-1])  # squash the color into uint32
         ret["Dimensions"] = list(rgb_view.shape[::-1])
-        ret["Data"] = parse_dm3.array.array(rgb_view.dtype.char, rgb_view.flatten())
+        ret["Data"] = ndarray_to_streamarray(rgb_view, rgb_view.dtype.char)
     else:
         ret["DataType"] = dm_type
         ret["PixelDepth"] = nparr.dtype.itemsize
         ret["Dimensions"] = list(nparr.shape[::-1])
         if nparr.dtype.type in np_to_structarray_map:
             types = np_to_structarray_map[nparr.dtype.type]
-            ret["Data"] = parse_dm3.structarray(types)
-            ret["Data"].raw_data = bytes(nparr.data)
+            ret["Data"] = ndarray_to_streamarray(nparr, types)
         else:
-            ret["Data"] = parse_dm3.array.array(nparr.dtype.char, nparr.flatten())
+            ret["Data"] = ndarray_to_streamarray(nparr, nparr.dtype.char)
     return ret
 
 
@@ -147,51 +317,372 @@ def display_keys(tag, indent=None):
 
 
 def fix_strings(d):
-    if isinstance(d, dict):
-        r = dict()
-        for k, v in d.items():
-            if k != "Data":
-                r[k] = fix_strings(v)
+    """
+    Returns a copy of the tag tree d with every array.array, except those
+    in tags named 'Data', converted by parse_dm3.array_to_python. Parsing
+    with decode_strings=True gives the same result without the copy.
+    The tree is walked without recursion, so its depth is not limited.
+    """
+    def fix_string(v):
+        return parse_dm3.array_to_python(v) if isinstance(v, parse_dm3.array.array) else v
+
+    if not isinstance(d, (dict, list)):
+        return fix_string(d)
+    result = dict() if isinstance(d, dict) else list()
+    pending = [(d, result)]
+    while pending:
+        source, target = pending.pop()
+        is_dict = isinstance(source, dict)
+        for k, v in (source.items() if is_dict else enumerate(source)):
+            if is_dict and k == "Data":
+                r = v
+            elif isinstance(v, (dict, list)):
+                r = dict() if isinstance(v, dict) else list()
+                pending.append((v, r))
             else:
-                r[k] = v
-        return r
-    elif isinstance(d, list):
-        l = list()
-        for v in d:
-            l.append(fix_strings(v))
-        return l
-    elif isinstance(d, parse_dm3.array.array):
-        if d.typecode == 'H':
-            return d.tostring().decode("utf-16")
-        else:
-            return d.tolist()
+                r = fix_string(v)
+            if is_dict:
+                target[k] = r
+            else:
+                target.append(r)
+    return result
+
+class DMImageList(object):
+    """
+    The images in the ImageList of a DM file. The tags are parsed once, with
+    the image data left in the file, and an image is only read when it is
+    loaded. file is a file-like object or a string, in which case the file
+    is opened here and closed by close (or on leaving a with block).
+    Numeric arrays of more than defer_size bytes elsewhere in the tags are
+    left in the file too and appear in the properties as parse_dm3.arrayref
+    objects.
+
+    The tags of a file opened by path are looked up in cache, a
+    header_cache.HeaderCache, if one is given.
+
+    Each item is a (shape, dtype, calibrations, intensity, title, properties)
+    tuple describing the image as load would return it.
+    """
+    def __init__(self, file, defer_size=None, cache=None):
+        self.__close_file = isinstance(file, str) or isinstance(file, unicode_type)
+        self.file = open(file, "rb") if self.__close_file else file
+        try:
+            def parse():
+                return parse_dm3.parse_dm_file(self.file, defer_data=True, defer_size=defer_size, decode_strings=True)
+            if self.__close_file and cache is not None:
+                self.tags = cache.get(file, parse, ("DMImageList", defer_size))
+            else:
+                self.tags = parse()
+        except Exception:
+            self.close()
+            raise
+        #display_keys(self.tags)
+        self.image_tags = self.tags.get('ImageList', list())
+
+    def close(self):
+        if self.__close_file and self.file is not None:
+            self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.image_tags)
+
+    def __getitem__(self, index):
+        image_tags = self.image_tags[index]
+        shape, dtype = imagedatadict_to_shape_and_dtype(image_tags['ImageData'])
+        if len(shape) == 3 and dtype != numpy.uint8:
+            shape = shape[1:] + shape[:1]
+        return (shape, dtype) + image_tags_to_metadata(image_tags, len(shape), dtype)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def load_region(self, index, key):
+        """
+        Reads the region key (integers, slices and Ellipsis, in the axis
+        order load returns) of image index without reading the rest of
+        the image. Returns just the data.
+        """
+        imdict = self.image_tags[index]['ImageData']
+        assert isinstance(imdict['Data'], parse_dm3.arrayref)
+        shape, dtype = imagedatadict_to_shape_and_dtype(imdict)
+        moved = len(shape) == 3 and dtype != numpy.uint8
+        if moved:
+            shape = shape[1:] + shape[:1]
+        key = normalize_key(key, shape)
+        if moved:
+            key = key[2:] + key[:2]
+        file_shape = tuple(imdict['Dimensions'][::-1])
+        is_rgb = imdict["DataType"] == 23
+        file_dtype = numpy.int32 if is_rgb else dtype
+        region = read_region(self.file, imdict['Data'].offset, file_shape, file_dtype, key[:len(file_shape)])
+        if is_rgb:
+            region = region.view(numpy.uint8).reshape(region.shape + (4, ))[..., :-1][..., key[-1]]  # strip A
+        elif moved:
+            region = numpy.moveaxis(region, 0, 2)
+            key = key[1:] + key[:1]
+        return region[tuple(0 if isinstance(k, int) else slice(None) for k in key[:region.ndim])]
+
+    def load(self, index=-1, memmap=False, contiguous=False):
+        """
+        Loads image index, returning data, calibrations, intensity, title and
+        properties like load_image. If memmap is True the data is a read-only
+        numpy.memmap over the file, see arrayref_to_ndarray.
+        3d data is stored as (planes, y, x) and returned as (y, x, planes),
+        normally as a view. If contiguous is True it is returned as a C
+        contiguous array instead, transposed while it is read.
+        """
+        image_tags = self.image_tags[index]
+        if contiguous:
+            if memmap:
+                raise ValueError("memmap data has the layout of the file and can't be made contiguous")
+            shape, dtype = self[index][:2]
+            data = numpy.empty(shape, dtype=dtype)
+            self.load_into(index, data)
+            return (data, ) + image_tags_to_metadata(image_tags, data.ndim, data.dtype)
+        data = imagedatadict_to_ndarray(image_tags['ImageData'], self.file, memmap)
+        if len(data.shape) == 3 and data.dtype != numpy.uint8:
+            data = numpy.moveaxis(data, 0, 2)
+        return (data, ) + image_tags_to_metadata(image_tags, data.ndim, data.dtype)
+
+    def load_into(self, index, out):
+        """
+        Reads the data of image index into the array out, which must have
+        the shape and dtype load would return. C contiguous out arrays are
+        read into directly, without a temporary copy.
+        """
+        imagedatadict_load_into(self.image_tags[index]['ImageData'], self.file, out)
+
+
+def imagedatadict_load_into(imdict, file, out):
+    """
+    Reads the data of the ImageData dictionary imdict into the array out,
+    which must have the shape and dtype DMImageList.load would return.
+    If the data was left in the file, file must be the file imdict was
+    parsed from; it is read without parsing the tags again.
+    """
+    shape, dtype = imagedatadict_to_shape_and_dtype(imdict)
+    # RGB data and the axes of 3d data are rearranged by load
+    is_3d = len(shape) == 3 and dtype != numpy.uint8
+    if is_3d:
+        shape = shape[1:] + shape[:1]
+    if out.shape != shape or out.dtype != dtype:
+        raise ValueError("image has shape {} and dtype {}, not {} and {}".format(shape, dtype, out.shape, out.dtype))
+    data = imdict['Data']
+    stored_as_loaded = imdict["DataType"] != 23 and not is_3d
+    if isinstance(data, parse_dm3.arrayref) and stored_as_loaded and out.flags.c_contiguous:
+        file.seek(data.offset)
+        if file.readinto(memoryview(out).cast('B')) != data.bytelen():
+            raise IOError("image data is truncated")
+    elif isinstance(data, parse_dm3.arrayref) and is_3d:
+        read_planes_to_last_axis(file, data, tuple(imdict['Dimensions'][::-1]), out)
     else:
-        return d
+        data = imagedatadict_to_ndarray(imdict, file, memmap=True)
+        out[...] = numpy.moveaxis(data, 0, 2) if is_3d else data
+
 
-def load_image(file):
+class DMSequence(object):
+    """
+    A sequence of DM files, such as a focal or tilt series, loaded as one
+    array with the sequence as its first axis. files is a glob pattern or a
+    sequence of file names, which are sorted naturally (image2 before
+    image10). The last image of every file, the one load_image would load,
+    must have the same shape and dtype.
+
+    calibrations, intensity and data_descriptor describe the sequence:
+    an uncalibrated sequence axis followed by the calibrations of the first
+    file, and (is_sequence, collection_dimension_count,
+    datum_dimension_count). titles and properties are per file.
+
+    The tags of all files are parsed once, by up to max_workers threads,
+    looking them up in cache (a header_cache.HeaderCache) if given.
+    No file is kept open between calls, so there is nothing to close.
+    """
+    def __init__(self, files, cache=None, max_workers=None):
+        if isinstance(files, str) or isinstance(files, unicode_type):
+            files = glob.glob(files)
+        self.files = natural_sorted(files)
+        if not self.files:
+            raise ValueError("no files found")
+
+        def parse(file):
+            with DMImageList(file, cache=cache) as images:
+                return images[-1], images.image_tags[-1]['ImageData']
+
+        # the tags are parsed once, by up to max_workers threads, and the
+        # ImageData of every file is kept so asarray only reads the data
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            descriptions, self.__imdicts = zip(*executor.map(parse, self.files))
+        shape, dtype, calibrations, intensity = descriptions[0][:4]
+        for file, description in zip(self.files, descriptions):
+            if description[:2] != (shape, dtype):
+                raise ValueError("{} has shape {} and dtype {}, not {} and {}".format(file, description[0], description[1], shape, dtype))
+            if description[2:4] != (calibrations, intensity):
+                logging.warning("%s is calibrated differently from %s", file, self.files[0])
+        self.shape = (len(self.files), ) + shape
+        self.dtype = dtype
+        self.calibrations = ((0.0, 1.0, str()), ) + calibrations
+        self.intensity = intensity
+        self.titles = [description[4] for description in descriptions]
+        self.properties = [description[5] for description in descriptions]
+        datum_dimension_count = len(shape) - (1 if dtype == numpy.uint8 else 0)  # RGB
+        if datum_dimension_count == 3:
+            self.data_descriptor = (True, 2, 1)
+        else:
+            self.data_descriptor = (True, 0, datum_dimension_count)
+
+    def __len__(self):
+        return len(self.files)
+
+    def asarray(self, memmap=False, tempdir=None, max_workers=None):
+        """
+        Reads the images of all files into one array of shape. The array is
+        allocated first and the files are read into it in parallel by up to
+        max_workers threads. If memmap is True the array is a numpy.memmap
+        over a temporary file in tempdir.
+        """
+        if memmap:
+            with tempfile.NamedTemporaryFile(dir=tempdir) as fh:
+                result = numpy.memmap(fh, dtype=self.dtype, shape=self.shape)
+        else:
+            result = numpy.empty(self.shape, dtype=self.dtype)
+
+        def load(index):
+            with open(self.files[index], "rb") as file:
+                imagedatadict_load_into(self.__imdicts[index], file, result[index])
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            for _ in executor.map(load, range(len(self.files))):
+                pass
+        return result
+
+
+def natural_sorted(names):
+    """Returns names sorted with the numbers in them compared as numbers."""
+    def key(name):
+        return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+    return sorted(names, key=key)
+
+
+def load_image(file, memmap=False, contiguous=False, cache=None):
     """
     Loads the image from the file-like object or string file.
     If file is a string, the file is opened and then read.
     Returns a numpy ndarray of our best guess for the most important image
     in the file.
+    If memmap is True, the image data is not read but returned as a read-only
+    numpy.memmap over the file (or read directly from file-like objects that
+    can't be mapped), so only the tags are parsed.
+    If contiguous is True, 3d data is returned as a C contiguous (y, x,
+    planes) array rather than a view of the (planes, y, x) data.
+    If cache, a header_cache.HeaderCache, is given, the tags of a file
+    opened by path are looked up in it.
+    Use DMImageList to get at the other images in the file.
+    """
+    with DMImageList(file, cache=cache) as images:
+        return images.load(-1, memmap, contiguous)
+
+
+def load_region(file, key, cache=None):
+    """
+    Reads the region key (integers, slices and Ellipsis) of the image
+    load_image would load from the file-like object or string file, without
+    reading the rest of the image. key uses the axis order of load_image.
+    cache is used like in load_image.
+    """
+    with DMImageList(file, cache=cache) as images:
+        return images.load_region(-1, key)
+
+
+def load_thumbnail(file, max_size=256, cache=None):
+    """
+    Returns a small version of the image load_image would load from the
+    file-like object or string file, at most about max_size pixels along its
+    image axes. The preview DM stores as the first of several images is used
+    if there is one. Otherwise the image is decimated by striding over it,
+    memory mapped where possible, so only the sampled pixels are read.
+    3d data is represented by its middle plane. cache is used like in
+    load_image.
+    """
+    with DMImageList(file, cache=cache) as images:
+        index = -1
+        if len(images) > 1 and numpy.prod(images[0][0]) < numpy.prod(images[-1][0]):
+            index = 0
+        shape, dtype = images[index][:2]
+        is_rgb = dtype == numpy.uint8
+        image_ndim = min(2, len(shape) - (1 if is_rgb else 0))
+        step = max(1, -(-max(shape[:image_ndim], default=1) // max(1, max_size)))
+        key = (slice(None, None, step), ) * image_ndim
+        if is_rgb:
+            key += (slice(None), )
+        elif len(shape) > image_ndim:
+            key += (shape[-1] // 2, )
+        return images.load_region(index, key)
+
+
+def load_metadata(file, defer_size=4096, cache=None):
+    """
+    Loads the description of the image load_image would load from the
+    file-like object or string file, without reading the image data.
+    Numeric arrays of more than defer_size bytes elsewhere in the tags are
+    skipped too and appear in the properties as parse_dm3.arrayref objects.
+    Returns shape, dtype, calibrations, intensity, title and properties,
+    ie what load_image returns with the data replaced by its shape and dtype.
+    cache is used like in load_image.
+    """
+    with DMImageList(file, defer_size, cache) as images:
+        return images[-1]
+
+
+def read_tags(file, paths):
     """
+    Reads only the tags at paths from the file-like object or string file,
+    eg read_tags(file, ["ImageList/1/ImageData/Calibrations"]). A path is
+    tag names and list indices separated by "/". Returns a dictionary from
+    each path found to its value, with strings decoded and image data left
+    in the file as parse_dm3.arrayref objects. In dm4 files all other
+    groups are skipped without being parsed.
+    """
+    keys = dict((tuple(path.strip("/").split("/")), path) for path in paths)
     if isinstance(file, str) or isinstance(file, unicode_type):
         with open(file, "rb") as f:
-            return load_image(f)
-    dmtag = parse_dm3.parse_dm_header(file)
-    dmtag = fix_strings(dmtag)
-    #display_keys(dmtag)
-    img_index = -1
-    image_tags = dmtag['ImageList'][img_index]
-    data = imagedatadict_to_ndarray(image_tags['ImageData'])
+            tags = parse_dm3.read_dm_tags(f, keys.keys(), decode_strings=True)
+    else:
+        tags = parse_dm3.read_dm_tags(file, keys.keys(), decode_strings=True)
+    return dict((keys[key], value) for key, value in tags.items())
+
+
+def imagedatadict_to_shape_and_dtype(imdict):
+    """
+    Returns the shape and dtype of the nd image imagedatadict_to_ndarray
+    would make from the ImageData dictionary imdict, without its data.
+    """
+    shape = tuple(imdict['Dimensions'][::-1])
+    if imdict["DataType"] == 23:  # RGB
+        return shape + (3, ), numpy.dtype(numpy.uint8)
+    return shape, numpy.dtype(dm_image_dtypes[imdict["DataType"]][1])
+
+
+def image_tags_to_metadata(image_tags, ndim, dtype):
+    """
+    Returns the calibrations, intensity calibration, title and properties
+    for the ImageList entry image_tags, whose image has ndim dimensions of
+    dtype once loaded.
+    """
     calibrations = []
     calibration_tags = image_tags['ImageData'].get('Calibrations', dict())
     for dimension in calibration_tags.get('Dimension', list()):
         origin, scale, units = dimension.get('Origin', 0.0), dimension.get('Scale', 1.0), dimension.get('Units', str())
         calibrations.append((-origin * scale, scale, units))
     calibrations = tuple(reversed(calibrations))
-    if len(data.shape) == 3 and data.dtype != numpy.uint8:
-        data = numpy.moveaxis(data, 0, 2)
+    if ndim == 3 and dtype != numpy.uint8:
         calibrations = tuple(calibrations[1:]) + (calibrations[0],)
     brightness = calibration_tags.get('Brightness', dict())
     origin, scale, units = brightness.get('Origin', 0.0), brightness.get('Scale', 1.0), brightness.get('Units', str())
@@ -203,12 +694,14 @@ def load_image(file):
         voltage = image_tags['ImageTags'].get('ImageScanned', dict()).get('EHT', dict())
         if voltage:
             properties.setdefault("hardware_source", dict())["autostem"] = { "high_tension_v": float(voltage) }
-    return data, tuple(calibrations), intensity, title, properties
+    return tuple(calibrations), intensity, title, properties
 
 
-def save_image(data, dimensional_calibrations, intensity_calibration, metadata, file):
+def save_image(data, dimensional_calibrations, intensity_calibration, metadata, file, version=3):
     """
     Saves the nparray data to the file-like object (or string) file.
+    version is the DM file version to write, 3 or 4. Use 4 for data with
+    more than 2**32 elements.
     """
     # we need to create a basic DM tree suitable for an image
     # we'll try the minimum: just an data list
@@ -251,7 +744,7 @@ def save_image(data, dimensional_calibrations, intensity_calibration, metadata,
     ret["Image Behavior"] = {"ViewDisplayID": 8}
     ret["ImageList"][0]["ImageTags"] = metadata
     ret["InImageMode"] = 1
-    parse_dm3.parse_dm_header(file, ret)
+    parse_dm3.parse_dm_header(file, ret, version=version)
 
 
 # logging.debug(image_tags['ImageData']['Calibrations'])
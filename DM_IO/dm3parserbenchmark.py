@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for reading and writing DM files.
+
+Run from the repository root with
+
+    python -m DM_IO.dm3parserbenchmark [file.dm3 ...]
+
+Without arguments a metadata heavy dm4 file and a spectrum image are
+generated and used.
+"""
+
+import collections
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+from DM_IO import dm3_image_utils
+from DM_IO import parse_dm3
+
+
+# save_image only needs the offset, scale and units of a calibration
+Calibration = collections.namedtuple("Calibration", ["offset", "scale", "units"])
+
+
+def make_metadata(groups=200, tags=50):
+    """
+    Returns a tag tree like the ImageTags of a busy acquisition: nested
+    groups of numbers, strings, lists and small arrays.
+    """
+    metadata = dict()
+    for group in range(groups):
+        values = dict()
+        for tag in range(tags):
+            kind = tag % 5
+            if kind == 0:
+                values["Value %d" % tag] = float(tag)
+            elif kind == 1:
+                values["Count %d" % tag] = tag
+            elif kind == 2:
+                values["Name %d" % tag] = "value %d of group %d" % (tag, group)
+            elif kind == 3:
+                values["List %d" % tag] = [tag, tag + 1, tag + 2]
+            else:
+                values["Array %d" % tag] = parse_dm3.array.array('f', range(8))
+        metadata["Group %d" % group] = values
+    return {"ImageList": [{"ImageTags": metadata}]}
+
+
+def count_tags(tree):
+    count = 0
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            count += len(node)
+            pending.extend(node.values())
+        elif isinstance(node, list):
+            count += len(node)
+            pending.extend(node)
+    return count
+
+
+def best_time(fn, repeat=5):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_tag_parse(path):
+    """
+    Compares parsing the tag tree of path by reading the file (DMParser)
+    with parsing a memory map of it (DMBufferParser). Image data is
+    deferred so only the tag tree is measured.
+    """
+    def parse_file():
+        with open(path, "rb") as f:
+            return parse_dm3.DMParser(f, defer_data=True).parse_dm_header()
+
+    def parse_buffer():
+        with open(path, "rb") as f:
+            return parse_dm3.parse_dm_file(f, defer_data=True)
+
+    tags = count_tags(parse_file())
+    print("{}: {} tags".format(os.path.basename(path), tags))
+    for name, fn in (("file parser", parse_file), ("buffer parser", parse_buffer)):
+        elapsed = best_time(fn)
+        print("  {:<16} {:8.1f} ms {:12.0f} tags/s".format(name, elapsed * 1000, tags / elapsed))
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_3d_load(path):
+    """
+    Compares getting a C contiguous (y, x, planes) array of the 3d image in
+    path by loading it and copying the moved axis view (what callers had to
+    do, or numpy did for them) with loading it contiguous directly.
+    """
+    def load_and_copy():
+        return numpy.ascontiguousarray(dm3_image_utils.load_image(path)[0])
+
+    def load_contiguous():
+        return dm3_image_utils.load_image(path, contiguous=True)[0]
+
+    data = load_contiguous()
+    print("{}: {} {}, {:.0f} MB".format(os.path.basename(path), data.shape, data.dtype, data.nbytes / 1e6))
+    for name, fn in (("load and copy", load_and_copy), ("contiguous load", load_contiguous)):
+        elapsed = best_time(fn)
+        peak = peak_memory(fn)
+        print("  {:<16} {:8.1f} ms {:8.0f} MB/s {:8.0f} MB peak".format(name, elapsed * 1000, data.nbytes / elapsed / 1e6, peak / 1e6))
+    # spectra are strided across the whole array unless it is contiguous
+    for name, data in (("moved view", dm3_image_utils.load_image(path)[0]), ("contiguous", data)):
+        elapsed = best_time(lambda: numpy.fft.rfft(data, axis=-1), repeat=3)
+        print("  {:<16} {:8.1f} ms to transform every spectrum".format(name, elapsed * 1000))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        for path in argv:
+            benchmark_tag_parse(path)
+            if len(dm3_image_utils.load_metadata(path)[0]) == 3:
+                benchmark_3d_load(path)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "metadata.dm4")
+        with open(path, "wb") as f:
+            parse_dm3.parse_dm_header(f, make_metadata(), version=4)
+        benchmark_tag_parse(path)
+        path = os.path.join(directory, "spectrum_image.dm4")
+        data = numpy.arange(128 * 128 * 1024, dtype=numpy.float32).reshape(128, 128, 1024)
+        with open(path, "wb") as f:
+            dm3_image_utils.save_image(data, [Calibration(0.0, 1.0, "")] * 3, None, dict(), f, version=4)
+        benchmark_3d_load(path)
+
+
+if __name__ == "__main__":
+    main()
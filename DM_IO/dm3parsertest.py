@@ -6,8 +6,13 @@ Created on Sun May 19 07:58:10 2013
 """
 
 import array
+import concurrent.futures
 import io
 import logging
+import os
+import struct
+import tempfile
+import tracemalloc
 import unittest
 import sys
 
@@ -15,6 +20,7 @@ import numpy
 
 from DM_IO import parse_dm3
 from DM_IO import dm3_image_utils
+from DM_IO import header_cache
 
 from nion.data import Calibration
 
@@ -177,6 +183,465 @@ class TestDM3ImportExportClass(unittest.TestCase):
         metadata_expected = {"one": [], "two": {}, "three": [1, 2]}
         self.assertEqual(metadata_out, metadata_expected)
 
+    def test_memmap_load_matches_full_load(self):
+        dtypes = (numpy.float32, numpy.complex64, numpy.uint16)
+        shapes = ((6, 4), (6, 4, 2))
+        for dtype in dtypes:
+            for shape in shapes:
+                data_in = numpy.arange(numpy.prod(shape)).reshape(shape).astype(dtype)
+                calibrations_in = [Calibration.Calibration() for _ in shape]
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, "memmap.dm3")
+                    with open(path, "wb") as f:
+                        dm3_image_utils.save_image(data_in, calibrations_in, Calibration.Calibration(), dict(), f)
+                    data_out, calibrations_out, _, _, _ = dm3_image_utils.load_image(path, memmap=True)
+                    self.assertIsInstance(data_out, numpy.memmap)
+                    self.assertFalse(data_out.flags.writeable)
+                    self.assertTrue(numpy.array_equal(data_in, data_out))
+                    self.assertEqual(calibrations_out, dm3_image_utils.load_image(path)[1])
+                    del data_out
+
+    def test_load_of_truncated_image_data_raises(self):
+        data_in = numpy.random.randn(400, 500).astype(numpy.float32)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "truncated.dm3")
+            with open(path, "wb") as f:
+                dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 2, None, dict(), f)
+            with dm3_image_utils.DMImageList(path) as images:
+                self.assertTrue(numpy.array_equal(images.load(-1, memmap=False)[0], data_in))
+                # the file is cut short after its tags are parsed
+                os.truncate(path, os.path.getsize(path) - data_in.nbytes // 2)
+                with self.assertRaises(IOError):
+                    images.load(-1, memmap=False)
+
+    def test_memmap_load_from_memory_file(self):
+        s = io.BytesIO()
+        data_in = numpy.random.randn(6, 4).astype(numpy.float32)
+        dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 2, Calibration.Calibration(), dict(), s)
+        s.seek(0)
+        dmtag = parse_dm3.parse_dm_header(s, defer_data=True)
+        self.assertIsInstance(dmtag["ImageList"][0]["ImageData"]["Data"], parse_dm3.arrayref)
+        s.seek(0)
+        data_out = dm3_image_utils.load_image(s, memmap=True)[0]
+        self.assertTrue(numpy.array_equal(data_in, data_out))
+
+    def minimal_dm4(self):
+        # a minimal dm4 file holding {"a": 5}, with 64 bit sizes throughout
+        entry = struct.pack("> 4s Q Q", b"%%%%", 1, 3) + struct.pack("<i", 5)
+        root = struct.pack("> b b Q", 1, 0, 1) + struct.pack("> b H 1s Q", 21, 1, b"a", len(entry)) + entry
+        return struct.pack("> l Q l", 4, len(root), 1) + root + struct.pack("> l l", 0, 0)
+
+    def test_parsers_keep_version_separate(self):
+        dm4 = self.minimal_dm4()
+        dm3 = io.BytesIO()
+        parse_dm3.parse_dm_header(dm3, outdata={"b": [1, 2, 3]})
+        dm3 = dm3.getvalue()
+        parser4 = parse_dm3.DMParser(io.BytesIO(dm4))
+        self.assertEqual(parser4.parse_dm_header(), {"a": 5})
+        self.assertEqual(parse_dm3.parse_dm_header(io.BytesIO(dm3)), {"b": [1, 2, 3]})
+        self.assertEqual(parser4.version, 4)
+        def parse(index):
+            return parse_dm3.parse_dm_header(io.BytesIO(dm4 if index % 2 else dm3))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(parse, range(200)))
+        for index, result in enumerate(results):
+            self.assertEqual(result, {"a": 5} if index % 2 else {"b": [1, 2, 3]})
+
+    def test_dm4_writer_matches_dm4_layout(self):
+        s = io.BytesIO()
+        parse_dm3.parse_dm_header(s, outdata={"a": 5}, version=4)
+        self.assertEqual(s.getvalue(), self.minimal_dm4())
+
+    def test_dm4_data_write_read_round_trip(self):
+        dtypes = (numpy.float32, numpy.complex128, numpy.uint16)
+        shapes = ((6, 4), (6, ), (6, 4, 2))
+        for dtype in dtypes:
+            for shape in shapes:
+                s = io.BytesIO()
+                data_in = numpy.arange(numpy.prod(shape)).reshape(shape).astype(dtype)
+                dimensional_calibrations_in = [Calibration.Calibration(1.0, 2.0 + index, "nm") for index in range(len(shape))]
+                intensity_calibration_in = Calibration.Calibration(4, 5, "six")
+                metadata_in = {"abc": 1, "def": "abc", "efg": {"one": 1, "three": [3, 4, 5]}}
+                dm3_image_utils.save_image(data_in, dimensional_calibrations_in, intensity_calibration_in, metadata_in, s, version=4)
+                s.seek(0)
+                self.assertEqual(struct.unpack("> l", s.read(4))[0], 4)
+                s.seek(0)
+                data_out, dimensional_calibrations_out, intensity_calibration_out, _, metadata_out = dm3_image_utils.load_image(s)
+                self.assertTrue(numpy.array_equal(data_in, data_out))
+                dimensional_calibrations_out = [Calibration.Calibration(*d) for d in dimensional_calibrations_out]
+                self.assertEqual(dimensional_calibrations_in, dimensional_calibrations_out)
+                self.assertEqual(metadata_in, metadata_out)
+
+    def test_ndarray_chunks_match_array_bytes(self):
+        data = numpy.arange(6 * 5 * 4, dtype=numpy.float32).reshape(6, 5, 4)
+        swapped = data.astype(">f4")
+        for nparr in (data, data[::2], data[:, ::-1, 1:], numpy.moveaxis(data, 2, 0), data[0, 0], data[:0],
+                      swapped, swapped[::2], data.astype(">c16")[:, ::-1]):
+            for chunk_size in (4, 7, 64, 1024):
+                chunks = list(dm3_image_utils.ndarray_to_chunks(nparr, chunk_size))
+                self.assertTrue(all(len(chunk) <= max(chunk_size, nparr.itemsize) for chunk in chunks))
+                # the bytes are in native byte order
+                self.assertEqual(b"".join(bytes(chunk) for chunk in chunks), nparr.astype(nparr.dtype.newbyteorder("=")).tobytes())
+
+    def test_saving_non_native_data_copies_one_chunk_at_a_time(self):
+        data_in = numpy.random.randn(512, 1024).astype(">f4")
+        write_chunk_size = dm3_image_utils.write_chunk_size
+        dm3_image_utils.write_chunk_size = 64 * 1024
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                with open(os.path.join(directory, "swapped.dm3"), "wb") as f:
+                    tracemalloc.start()
+                    try:
+                        dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 2, None, dict(), f)
+                        peak = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        tracemalloc.stop()
+                self.assertLess(peak, data_in.nbytes // 4)
+                data_out = dm3_image_utils.load_image(os.path.join(directory, "swapped.dm3"))[0]
+                self.assertTrue(numpy.array_equal(data_out, data_in))
+        finally:
+            dm3_image_utils.write_chunk_size = write_chunk_size
+
+    def test_non_contiguous_data_write_read_round_trip(self):
+        data = numpy.random.randn(8, 6, 4)
+        for data_in in (data[::2, :, 1], data.astype(numpy.complex64)[:, ::-1], data.astype(">f4")):
+            s = io.BytesIO()
+            dimensional_calibrations_in = [Calibration.Calibration() for _ in data_in.shape]
+            dm3_image_utils.save_image(data_in, dimensional_calibrations_in, Calibration.Calibration(), dict(), s)
+            s.seek(0)
+            data_out = dm3_image_utils.load_image(s)[0]
+            self.assertTrue(numpy.array_equal(data_in, data_out))
+
+    def test_buffer_parser_matches_file_parser(self):
+        st = parse_dm3.structarray(['f', 'f'])
+        st.raw_data = array.array('b', range(16))
+        data = {"a": 5, "Short Name": "abc", "l": [1.5, "xyz", {"c": array.array('f', [1, 2, 3])}], "s": (1, 2.0),
+                "Data": array.array('h', range(10)), "st": st, "empty": [], "b": False}
+        for version in (3, 4):
+            for defer_data in (False, True):
+                s = io.BytesIO()
+                parse_dm3.parse_dm_header(s, data, version=version)
+                expected = parse_dm3.DMParser(io.BytesIO(s.getvalue()), defer_data=defer_data).parse_dm_header()
+                with parse_dm3.DMBufferParser(s.getvalue(), defer_data=defer_data) as parser:
+                    self.assertEqual(parser.parse_dm_header(), expected)
+                s.seek(0)
+                self.assertEqual(parse_dm3.parse_dm_file(s, defer_data), expected)
+                self.assertEqual(s.tell(), len(s.getvalue()))
+                with tempfile.TemporaryFile() as f:
+                    f.write(s.getvalue())
+                    f.seek(0)
+                    self.assertEqual(parse_dm3.parse_dm_file(f, defer_data), expected)
+
+    def test_load_metadata_matches_load_image(self):
+        rgb = (numpy.random.randn(6, 4, 3) * 255).astype(numpy.uint8)
+        for data_in in (numpy.ones((6, 4), numpy.float32), numpy.ones((6, 4, 5), numpy.int16), numpy.ones((6, ), numpy.complex64), rgb):
+            s = io.BytesIO()
+            dimensional_calibrations_in = [Calibration.Calibration(1, 2 + index, "nm") for index in range(data_in.ndim)]
+            metadata_in = {"abc": 1, "def": "abc", "efg": {"three": [3, 4, 5]}}
+            dm3_image_utils.save_image(data_in, dimensional_calibrations_in, Calibration.Calibration(4, 5, "six"), metadata_in, s)
+            s.seek(0)
+            data, calibrations, intensity, title, properties = dm3_image_utils.load_image(s)
+            s.seek(0)
+            shape, dtype, calibrations_out, intensity_out, title_out, properties_out = dm3_image_utils.load_metadata(s)
+            self.assertEqual(shape, data.shape)
+            self.assertEqual(dtype, data.dtype)
+            self.assertEqual(calibrations_out, calibrations)
+            self.assertEqual(intensity_out, intensity)
+            self.assertEqual(title_out, title)
+            self.assertEqual(properties_out, properties)
+
+    def test_load_metadata_skips_large_arrays(self):
+        s = io.BytesIO()
+        metadata_in = {"small": array.array('f', range(4)), "large": array.array('f', range(4096)), "name": "x" * 4096}
+        dm3_image_utils.save_image(numpy.ones((6, 4), numpy.float32), [], None, metadata_in, s)
+        s.seek(0)
+        properties = dm3_image_utils.load_metadata(s, defer_size=1024)[-1]
+        self.assertEqual(properties["small"], [0, 1, 2, 3])
+        self.assertEqual(properties["name"], "x" * 4096)
+        self.assertIsInstance(properties["large"], parse_dm3.arrayref)
+        self.assertEqual(properties["large"].num_elements(), 4096)
+        s.seek(properties["large"].offset)
+        self.assertEqual(numpy.frombuffer(s.read(properties["large"].bytelen()), numpy.float32).tolist(), list(range(4096)))
+
+    def test_image_list_enumerates_and_loads_each_image(self):
+        thumbnail = (numpy.random.randn(4, 5, 3) * 255).astype(numpy.uint8)
+        main_image = numpy.random.randn(6, 4, 3).astype(numpy.float32)
+        s = io.BytesIO()
+        dm3_image_utils.save_image(main_image, [Calibration.Calibration(0, 1, "nm")] * 3, None, {"a": 1}, s)
+        s.seek(0)
+        dmtag = parse_dm3.parse_dm_header(s)
+        dmtag["ImageList"].insert(0, {"ImageData": dm3_image_utils.ndarray_to_imagedatadict(thumbnail), "Name": "Thumbnail"})
+        s = io.BytesIO()
+        parse_dm3.parse_dm_header(s, dmtag)
+        s.seek(0)
+        with dm3_image_utils.DMImageList(s) as images:
+            self.assertEqual(len(images), 2)
+            self.assertEqual([image[0] for image in images], [thumbnail.shape, main_image.shape])
+            self.assertEqual(images[0][1], numpy.uint8)
+            self.assertEqual(images[0][4], "Thumbnail")
+            self.assertEqual(images[1][1], numpy.float32)
+            self.assertTrue(numpy.array_equal(images.load(0)[0], thumbnail))
+            self.assertTrue(numpy.array_equal(images.load(1)[0], main_image))
+            self.assertTrue(numpy.array_equal(images.load(-1, memmap=True)[0], main_image))
+            self.assertEqual(images.load(1)[4], {"a": 1})
+
+    def test_load_region_matches_slicing_loaded_image(self):
+        rgb = (numpy.random.randn(5, 6, 3) * 255).astype(numpy.uint8)
+        cube = numpy.arange(5 * 6 * 7, dtype=numpy.float32).reshape(5, 6, 7)
+        keys = ((1, ), (slice(1, 4), slice(None), 2), (Ellipsis, slice(None, None, -2)), (slice(None, None, 2), 3), (-1, Ellipsis), (slice(2, 2), ))
+        for data_in in (cube, cube.astype(numpy.complex64), numpy.arange(30, dtype=numpy.int16).reshape(5, 6), rgb):
+            s = io.BytesIO()
+            dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 3, None, dict(), s)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "region.dm3")
+                with open(path, "wb") as f:
+                    f.write(s.getvalue())
+                for key in keys:
+                    s.seek(0)
+                    if len(key) > data_in.ndim:
+                        with self.assertRaises(IndexError):
+                            dm3_image_utils.load_region(s, key)
+                        continue
+                    for data_out in (dm3_image_utils.load_region(s, key), dm3_image_utils.load_region(path, key)):
+                        self.assertEqual(data_out.shape, data_in[key].shape)
+                        self.assertTrue(numpy.array_equal(data_out, data_in[key]))
+
+    def test_load_region_reads_only_the_region(self):
+        class CountingBytesIO(io.BytesIO):
+            bytes_read = 0
+            def read(self, size=-1):
+                data = super(CountingBytesIO, self).read(size)
+                self.bytes_read += len(data)
+                return data
+        data_in = numpy.random.randn(64, 64, 32).astype(numpy.float32)
+        s = CountingBytesIO()
+        dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 3, None, dict(), s)
+        s.seek(0)
+        with dm3_image_utils.DMImageList(s) as images:
+            s.bytes_read = 0
+            data_out = images.load_region(-1, (slice(8, 12), slice(8, 12), slice(4, 8)))
+        self.assertTrue(numpy.array_equal(data_out, data_in[8:12, 8:12, 4:8]))
+        self.assertEqual(s.bytes_read, 4 * 4 * 4 * 4)
+
+    def test_decode_strings_while_parsing_matches_fix_strings(self):
+        data = {"a": 5, "Short Name": "abc", "s": "a string", "l": [1.5, "xyz", {"c": array.array('f', [1, 2, 3]), "Data": array.array('f', [4])}],
+                "Data": array.array('h', range(10)), "empty": []}
+        s = io.BytesIO()
+        parse_dm3.parse_dm_header(s, data)
+        s.seek(0)
+        expected = dm3_image_utils.fix_strings(parse_dm3.parse_dm_header(s))
+        s.seek(0)
+        self.assertEqual(parse_dm3.parse_dm_header(s, decode_strings=True), expected)
+        with parse_dm3.DMBufferParser(s.getvalue(), decode_strings=True) as parser:
+            self.assertEqual(parser.parse_dm_header(), expected)
+        self.assertEqual(expected["s"], "a string")
+        self.assertEqual(expected["l"][2]["Data"], array.array('f', [4]))
+
+    def test_parse_handles_deep_trees(self):
+        depth = sys.getrecursionlimit() * 2
+        data_in = numpy.random.randn(6, 4).astype(numpy.float32)
+        s = io.BytesIO()
+        dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 2, None, {"a": 1}, s)
+        leaf = io.BytesIO()
+        parse_dm3.DMParser(leaf).parse_dm_tag_entry({"s": "deep"}, "next")
+        # a group entry named "next" holding one tag, in dm3 layout
+        group = struct.pack("> b H 4s b b L", 20, 4, b"next", 1, 0, 1)
+        deep = group * depth + leaf.getvalue()
+        # add the deep branch as the first tag of the root group, after the file header
+        data = s.getvalue()
+        is_dict, _open, num_tags = struct.unpack_from("> b b L", data, 12)
+        s = io.BytesIO(data[:12] + struct.pack("> b b L", is_dict, _open, num_tags + 1) + deep + data[18:])
+        tree = parse_dm3.parse_dm_file(s, defer_data=True, decode_strings=True)
+        for i in range(depth + 1):
+            tree = tree["next"]
+        self.assertEqual(tree, {"s": "deep"})
+        s.seek(0)
+        data_out, _, _, _, metadata_out = dm3_image_utils.load_image(s)
+        self.assertTrue(numpy.array_equal(data_out, data_in))
+        self.assertEqual(metadata_out, {"a": 1})
+        s.seek(0)
+        self.assertEqual(len(parse_dm3.read_dm_tags(s, [["ImageList"]])[("ImageList", )]), 1)
+
+    def test_fix_strings_handles_deep_trees(self):
+        depth = sys.getrecursionlimit() * 2
+        tree = leaf = dict()
+        for i in range(depth):
+            leaf["next"] = dict()
+            leaf = leaf["next"]
+        leaf["s"] = array.array('H', "deep".encode("utf-16-le"))
+        fixed = dm3_image_utils.fix_strings(tree)
+        for i in range(depth):
+            fixed = fixed["next"]
+        self.assertEqual(fixed, {"s": "deep"})
+
+    def test_read_tags_matches_full_parse(self):
+        class CountingBytesIO(io.BytesIO):
+            bytes_read = 0
+            def read(self, size=-1):
+                data = super(CountingBytesIO, self).read(size)
+                self.bytes_read += len(data)
+                return data
+        data_in = numpy.random.randn(16, 8).astype(numpy.float32)
+        metadata = {"Microscope Info": {"Voltage": 200000.0, "Name": "scope"}, "Other": {"Group %d" % i: list(range(20)) for i in range(50)}}
+        paths = ["ImageList/0/ImageData/Calibrations", "ImageList/0/ImageTags/Microscope Info", "ImageList/0/ImageTags/Microscope Info/Voltage", "ImageList/1/ImageData"]
+        for version in (3, 4):
+            s = CountingBytesIO()
+            dm3_image_utils.save_image(data_in, [Calibration.Calibration(1, 2, "nm")] * 2, None, metadata, s, version=version)
+            s.seek(0)
+            tags = parse_dm3.parse_dm_header(s, defer_data=True, decode_strings=True)
+            full_bytes = s.bytes_read
+            s.seek(0)
+            result = dm3_image_utils.read_tags(s, paths)
+            self.assertEqual(sorted(result.keys()), sorted(paths[:3]))
+            self.assertEqual(result[paths[0]], tags["ImageList"][0]["ImageData"]["Calibrations"])
+            self.assertEqual(result[paths[1]], {"Voltage": 200000.0, "Name": "scope"})
+            self.assertEqual(result[paths[2]], 200000.0)
+            s.seek(0)
+            s.bytes_read = 0
+            parse_dm3.DMParser(s, defer_data=True).read_tags([path.split("/") for path in paths[:2]])
+            if version == 4:
+                self.assertLess(s.bytes_read * 4, full_bytes)
+            else:
+                self.assertLessEqual(s.bytes_read, full_bytes)
+
+    def test_header_cache_reuses_tags_until_file_changes(self):
+        data_in = numpy.random.randn(6, 4).astype(numpy.float32)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cached.dm3")
+            cache = header_cache.HeaderCache(os.path.join(directory, "cache"))
+            with open(path, "wb") as f:
+                dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 2, None, {"a": 1}, f)
+            for i in range(3):
+                with dm3_image_utils.DMImageList(path, cache=cache) as images:
+                    self.assertTrue(numpy.array_equal(images.load(-1)[0], data_in))
+                    self.assertEqual(images[-1][5], {"a": 1})
+            self.assertEqual((cache.hits, cache.misses), (2, 1))
+            self.assertTrue(numpy.array_equal(dm3_image_utils.load_image(path, cache=cache)[0], data_in))
+            self.assertEqual((cache.hits, cache.misses), (3, 1))
+            with open(path, "wb") as f:
+                dm3_image_utils.save_image(data_in[:3], [Calibration.Calibration()] * 2, None, {"a": 2}, f)
+            os.utime(path, ns=(0, 0))  # make sure the modification time differs
+            with dm3_image_utils.DMImageList(path, cache=cache) as images:
+                self.assertTrue(numpy.array_equal(images.load(-1)[0], data_in[:3]))
+                self.assertEqual(images[-1][5], {"a": 2})
+            self.assertEqual((cache.hits, cache.misses), (3, 2))
+
+    def test_header_cache_evicts_least_recently_used_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = header_cache.HeaderCache(os.path.join(directory, "cache"), max_size=2500)
+            paths = list()
+            for i in range(3):
+                paths.append(os.path.join(directory, "file%d" % i))
+                with open(paths[-1], "wb") as f:
+                    f.write(bytes(i))
+            cache.get(paths[0], lambda: bytes(1000))
+            cache.get(paths[1], lambda: bytes(1000))
+            for name in os.listdir(cache.directory):
+                os.utime(os.path.join(cache.directory, name), (1000, 1000))
+            cache.get(paths[0], lambda: bytes(1000))  # a hit makes it the most recently used
+            cache.get(paths[2], lambda: bytes(1000))  # over max_size, so the entry of paths[1] goes
+            self.assertEqual(len(os.listdir(cache.directory)), 2)
+            self.assertEqual((cache.hits, cache.misses), (1, 3))
+            cache.get(paths[0], lambda: bytes(1000))
+            cache.get(paths[2], lambda: bytes(1000))
+            self.assertEqual((cache.hits, cache.misses), (3, 3))
+            cache.get(paths[1], lambda: bytes(1000))
+            self.assertEqual((cache.hits, cache.misses), (3, 4))
+
+    def test_sequence_loads_files_in_natural_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for shape in ((6, 4), (3, 4, 5)):
+                frames = [numpy.random.randn(*shape).astype(numpy.float32) for i in range(12)]
+                for i, frame in enumerate(frames):
+                    with open(os.path.join(directory, "frame%d_%d.dm3" % (len(shape), i + 1)), "wb") as f:
+                        dm3_image_utils.save_image(frame, [Calibration.Calibration(0, 2, "nm")] * len(shape), None, {"i": i}, f)
+                cache = header_cache.HeaderCache(os.path.join(directory, "cache%d" % len(shape)))
+                sequence = dm3_image_utils.DMSequence(os.path.join(directory, "frame%d_*.dm3" % len(shape)), cache=cache, max_workers=4)
+                self.assertEqual(sequence.shape, (12, ) + shape)
+                self.assertEqual([p["i"] for p in sequence.properties], list(range(12)))
+                self.assertEqual(len(sequence.calibrations), len(shape) + 1)
+                self.assertEqual(sequence.data_descriptor, (True, 0, 2) if len(shape) == 2 else (True, 2, 1))
+                expected = numpy.stack(frames)
+                self.assertTrue(numpy.array_equal(sequence.asarray(max_workers=4), expected))
+                self.assertTrue(numpy.array_equal(sequence.asarray(memmap=True, tempdir=directory), expected))
+                # the tags are parsed once, not again by asarray
+                self.assertEqual((cache.hits, cache.misses), (0, 12))
+            with open(os.path.join(directory, "frame2_13.dm3"), "wb") as f:
+                dm3_image_utils.save_image(numpy.zeros((6, 5), numpy.float32), [Calibration.Calibration()] * 2, None, dict(), f)
+            with self.assertRaises(ValueError):
+                dm3_image_utils.DMSequence(os.path.join(directory, "frame2_*.dm3"))
+
+    def test_write_to_non_seekable_stream(self):
+        class Pipe(io.RawIOBase):
+            def __init__(self):
+                self.data = bytearray()
+            def writable(self):
+                return True
+            def write(self, b):
+                self.data += memoryview(b).cast('B')
+                return memoryview(b).nbytes
+        data_in = numpy.random.randn(8, 6, 4).astype(numpy.float32)
+        metadata_in = {"a": [1, "two", {"three": 3.5}], "b": "string"}
+        for version in (3, 4):
+            s = io.BytesIO()
+            dm3_image_utils.save_image(data_in, [Calibration.Calibration(0, 1, "nm")] * 3, None, metadata_in, s, version=version)
+            pipe = Pipe()
+            self.assertFalse(pipe.seekable())
+            dm3_image_utils.save_image(data_in, [Calibration.Calibration(0, 1, "nm")] * 3, None, metadata_in, pipe, version=version)
+            self.assertEqual(bytes(pipe.data), s.getvalue())
+            data_out, _, _, _, metadata_out = dm3_image_utils.load_image(io.BytesIO(bytes(pipe.data)))
+            self.assertTrue(numpy.array_equal(data_out, data_in))
+            self.assertEqual(metadata_out, metadata_in)
+
+    def test_contiguous_load_matches_load(self):
+        read_chunk_size = dm3_image_utils.read_chunk_size
+        dm3_image_utils.read_chunk_size = 200  # a few planes per block
+        try:
+            for data_in in (numpy.random.randn(7, 5, 3).astype(numpy.float32), numpy.random.randn(7, 5, 3).astype(numpy.complex64),
+                            numpy.arange(35, dtype=numpy.int16).reshape(7, 5), (numpy.random.randn(7, 5, 3) * 255).astype(numpy.uint8)):
+                s = io.BytesIO()
+                dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * 3, None, dict(), s)
+                s.seek(0)
+                data_out = dm3_image_utils.load_image(s, contiguous=True)[0]
+                self.assertTrue(data_out.flags.c_contiguous)
+                self.assertEqual(data_out.dtype, data_in.dtype)
+                self.assertTrue(numpy.array_equal(data_out, data_in))
+                s.seek(0)
+                with self.assertRaises(ValueError):
+                    dm3_image_utils.load_image(s, memmap=True, contiguous=True)
+        finally:
+            dm3_image_utils.read_chunk_size = read_chunk_size
+
+    def test_load_thumbnail_decimates_or_uses_preview(self):
+        cube = numpy.random.randn(40, 30, 8).astype(numpy.float32)
+        for data_in, expected in ((numpy.random.randn(100, 60).astype(numpy.float32), numpy.s_[::4, ::4]),
+                                  (numpy.random.randn(10, 6).astype(numpy.float32), numpy.s_[:, :]),
+                                  (numpy.arange(1000, dtype=numpy.int16), numpy.s_[::40]),
+                                  ((numpy.random.randn(50, 20, 3) * 255).astype(numpy.uint8), numpy.s_[::2, ::2, :]),
+                                  (cube, numpy.s_[::2, ::2, 4])):
+            s = io.BytesIO()
+            dm3_image_utils.save_image(data_in, [Calibration.Calibration()] * data_in.ndim, None, dict(), s)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "thumbnail.dm3")
+                with open(path, "wb") as f:
+                    f.write(s.getvalue())
+                for file in (s, path):
+                    s.seek(0)
+                    thumbnail = dm3_image_utils.load_thumbnail(file, 25)
+                    self.assertTrue(numpy.array_equal(thumbnail, data_in[expected]))
+        preview = (numpy.random.randn(12, 16, 3) * 255).astype(numpy.uint8)
+        s = io.BytesIO()
+        dm3_image_utils.save_image(cube, [Calibration.Calibration()] * 3, None, dict(), s)
+        s.seek(0)
+        dmtag = parse_dm3.parse_dm_header(s)
+        dmtag["ImageList"].insert(0, {"ImageData": dm3_image_utils.ndarray_to_imagedatadict(preview)})
+        s = io.BytesIO()
+        parse_dm3.parse_dm_header(s, dmtag)
+        s.seek(0)
+        self.assertTrue(numpy.array_equal(dm3_image_utils.load_thumbnail(s, 64), preview))
+        s.seek(0)
+        self.assertTrue(numpy.array_equal(dm3_image_utils.load_thumbnail(s, 8), preview[::2, ::2]))
+
     def disabled_test_series_data_ordering(self):
         s = "/Users/cmeyer/Downloads/NEW_7FocalSeriesImages_Def_50000nm.dm3"
         data_out, dimensional_calibrations_out, intensity_calibration_out, title_out, metadata_out = dm3_image_utils.load_image(s)
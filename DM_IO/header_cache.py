@@ -0,0 +1,122 @@
+"""
+    An on-disk cache of parsed file headers.
+
+    Reopening a file normally means parsing all of its tags again. The cache
+    stores what a parse returned, keyed by the path, size and modification
+    time of the file, so a second open of an unchanged file only costs a stat
+    and the read of one small entry. The entries are pickles in a directory
+    of their own; when their total size goes over max_size the least recently
+    used ones are removed.
+
+    The DM_IO and TIFF_IO extensions are installed independently, so each
+    carries an identical copy of this module. Change both copies together.
+"""
+
+# standard libraries
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+# third party libraries
+# None
+
+# local libraries
+# None
+
+
+def default_directory(name):
+    """Returns the directory for the cache called name in the user's cache directory."""
+    return os.path.join(os.path.expanduser("~"), ".cache", "nionswift", name)
+
+
+class HeaderCache(object):
+    """
+    The parsed headers of files in directory, at most max_size bytes of
+    them. hits and misses count the lookups since the cache was created.
+    """
+
+    def __init__(self, directory, max_size=32 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+
+    def get(self, path, parse, key=None):
+        """
+        Returns the header of the file at path, calling parse() to read it
+        if there is no entry for the file as it is now. key distinguishes
+        different kinds of parse of the same file and must be picklable.
+        """
+        stat = os.stat(path)
+        file_key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns, key)
+        name = hashlib.sha1(repr(file_key).encode("utf-8")).hexdigest() + ".pickle"
+        entry_path = os.path.join(self.directory, name)
+        try:
+            with open(entry_path, "rb") as f:
+                entry_key, value = pickle.load(f)
+            if entry_key == file_key:
+                os.utime(entry_path)  # the modification time of an entry is its last use
+                with self.__lock:
+                    self.hits += 1
+                return value
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.debug("Ignoring unreadable header cache entry %s: %s", entry_path, e)
+        with self.__lock:
+            self.misses += 1
+        value = parse()
+        try:
+            self.__store(entry_path, (file_key, value))
+        except Exception as e:
+            logging.debug("Could not store header cache entry %s: %s", entry_path, e)
+        return value
+
+    def clear(self):
+        """Removes all entries."""
+        for entry in self.__entries():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def __entries(self):
+        try:
+            return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".pickle")]
+        except FileNotFoundError:
+            return list()
+
+    def __store(self, entry_path, entry):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # write to a temporary file and rename it, so readers never see part of an entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        self.__evict()
+
+    def __evict(self):
+        entries = list()
+        for entry in self.__entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
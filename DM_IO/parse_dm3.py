@@ -1,8 +1,9 @@
 import array
+import contextlib
 import io
 import struct
 import logging
-import re
+import mmap
 
 def u(x=None, y=None):
     return str(x if x is not None else str(), y)
@@ -15,9 +16,8 @@ def str_to_iso8859_bytes(s):
     return bytes(s, 'ISO-8859-1')
 
 # mfm 2013-11-15 initial dm4 support
-# this should probably migrate into a class at some point.
-# No support for writing dm4 files, but shouldn't be hard -
-# just need to make sure functions are symmetric
+# dm4 files are written with the same functions as dm3 files, the only
+# differences are 64 bit size fields and the tag size after each tag name
 # mfm 2013-05-21 do we need the numpy array stuff? The python array module
 # allows us to store arrays easily and efficiently. How do we deal
 # with arrays of complex data? We could use numpy arrays with custom dtypes
@@ -34,14 +34,11 @@ def str_to_iso8859_bytes(s):
 # this one doesn't). Is easier to follow though
 verbose = False
 
-# we treat sizes separately to distinguish 32bit (dm3) and 64 bit (dm4)
-# these globals can get changed in parse_dm3_header
-version = 3
-size_type = "L"
-
 TAG_TYPE_ARRAY = 20
 TAG_TYPE_DATA = 21
 
+TAG_DATA_DELIMITER = b"%%%%"
+
 def get_from_file(f, stype):
     #print("reading", stype, "size", struct.calcsize(stype))
     src = f.read(struct.calcsize(stype))
@@ -59,6 +56,22 @@ def put_into_file(f, stype, *args):
     f.write(struct.pack(stype, *args))
 
 
+# unpack_from function, size and whether it unpacks a single value for the
+# struct formats DMBufferParser has seen
+_structs = {}
+
+
+def array_to_python(arr):
+    """
+    Returns the array.array arr as a string if it is an array of 'H' (which
+    is how DM stores strings) or as a list otherwise.
+    """
+    if arr.typecode == 'H':
+        return arr.tobytes().decode("utf-16")
+    else:
+        return arr.tolist()
+
+
 class structarray(object):
     """
     A class to represent struct arrays. We store the data as a list of
@@ -89,204 +102,92 @@ class structarray(object):
     def from_file(self, f, num_elements):
         self.raw_data = array.array('b', f.read(self.bytelen(num_elements)))
 
+    def from_bytes(self, data):
+        self.raw_data = array.array('b')
+        self.raw_data.frombytes(data)
+
     def to_file(self, f):
         f.write(bytearray(self.raw_data))
 
 
-def parse_dm_header(f, outdata=None):
+class streamarray(object):
     """
-    This is the start of the DM file. We check for some
-    magic values and then treat the next entry as a tag_root
+    A class to represent an array that is only written, from chunks of bytes
+    rather than from a single block in memory (eg straight from the buffer
+    of a large image). typecodes are the struct typecodes of a single element
+    and chunks is a function returning an iterable of bytes-like objects that
+    together hold length elements.
+    """
+    def __init__(self, typecodes, length, chunks):
+        self.typecodes = typecodes
+        self.length = length
+        self.chunks = chunks
 
-    If outdata is supplied, we write instead of read using the dictionary outdata as a source
-    Hopefully parse_dm_header(newf, outdata=parse_dm_header(f)) copies f to newf
+    def __repr__(self):
+        return "streamarray({}, {})".format(self.typecodes, self.length)
+
+    def bytelen(self):
+        return self.length * struct.calcsize(" ".join(self.typecodes))
+
+    def num_elements(self):
+        return self.length
+
+    def to_file(self, f):
+        for chunk in self.chunks():
+            f.write(chunk)
+
+
+class lengthwriter(object):
     """
-    # filesize is sizeondisk - 16. But we have 8 bytes of zero at the end of
-    # the file.
-    if outdata is not None:  # this means we're WRITING to the file
-        if verbose:
-            print("write_dm_header start", f.tell())
-        ver, file_size, endianness = 3, -1, 1
-        put_into_file(f, "> l l l", ver, file_size, endianness)
-        start = f.tell()
-        parse_dm_tag_root(f, outdata)
-        end = f.tell()
-        # start is end of 3 long header. We want to write 2nd long
-        f.seek(start - 8)
-        # the real file size. We started counting after 12-byte version,fs,end
-        # and we need to subtract 16 total:
-        put_into_file(f, "> l", end - start + 4)
-        f.seek(end)
-        enda, endb = 0, 0
-        put_into_file(f, "> l l", enda, endb)
-        if verbose:
-            print("write_dm_header end", f.tell())
-    else:
-        if verbose:
-            print("read_dm_header start", f.tell())
-        ver = get_from_file(f, "> l")
-        assert ver in [3,4], "Version must be 3 or 4, not %s" % ver
-        # argh. why a global?
-        global size_type, version
-        if ver == 3:
-            size_type = 'L'  # may be Q?
-            version = 3
-        if ver == 4:
-            size_type = 'Q'  # may be Q?
-            version = 4
-        file_size, endianness = get_from_file(f, ">%c l" % size_type)
-        assert endianness == 1, "Endianness must be 1, not %s"%endianness
-        start = f.tell()
-        ret = parse_dm_tag_root(f, outdata)
-        end = f.tell()
-        # print("fs", file_size, end - start, (end-start)%8)
-        # mfm 2013-07-11 the file_size value is not always
-        # end-start, sometimes there seems to be an extra 4 bytes,
-        # other times not. Let's just ignore it for the moment
-        # assert(file_size == end - start)
-        enda, endb = get_from_file(f, "> l l")
-        assert(enda == endb == 0)
-        if verbose:
-            print("read_dm_header end", f.tell())
-        return ret
-
-
-def parse_dm_tag_root(f, outdata=None):
-    if outdata is not None:  # this means we're WRITING to the file
-        is_dict = 0 if isinstance(outdata, list) else 1
-        _open = 0
-        if is_dict:
-            num_tags = sum(1 if k is not None and len(k) > 0 and v is not None else 0 for k, v in outdata.items())
-        else:
-            num_tags = sum(1 if v is not None else 0 for v in outdata)
-        if verbose:
-            print("write_dm_tag_root start {} {} {}".format(f.tell(), is_dict, num_tags))
-        put_into_file(f, "> b b l", is_dict, _open, num_tags)
-        if not is_dict:
-            for subdata in outdata:
-                if subdata is not None:
-                    parse_dm_tag_entry(f, subdata, None)
-        else:
-            for key in outdata:
-                if key is not None and len(key) > 0:  # don't write out invalid dict's
-                    value = outdata[key]
-                    if value is not None:
-                        parse_dm_tag_entry(f, value, key)
-        if verbose:
-            print("write_dm_tag_root end", f.tell())
-    else:
-        if verbose:
-            print("read_dm_tag_root start", f.tell())
-        is_dict, _open, num_tags = get_from_file(f, ("> b b %c" % size_type))
-        if is_dict:
-            new_obj = {}
-            for i in range(num_tags):
-                pos = f.tell()
-                name, data = parse_dm_tag_entry(f)
-                assert(name is not None)
-                new_obj[name] = data
-        else:
-            new_obj = []
-            for i in range(num_tags):
-                pos = f.tell()
-                name, data = parse_dm_tag_entry(f)
-                assert(name is None)
-                new_obj.append(data)
-        if verbose:
-            print("read_dm_tag_root end", f.tell())
-        return new_obj
-
-
-def parse_dm_tag_entry(f, outdata=None, outname=None):
-    if outdata is not None:  # this means we're WRITING to the file
-        if verbose:
-            print("write_dm_tag_entry start", f.tell())
-        dtype = TAG_TYPE_ARRAY if isinstance(outdata, (dict, list)) else TAG_TYPE_DATA
-        name_len = len(outname) if outname else 0
-        put_into_file(f, "> b H", dtype, name_len)
-        if outname:
-            put_into_file(f, ">" + str(name_len) + "s", str_to_iso8859_bytes(outname))
+    Stands in for the output file while a DM file is written front to back.
+    It counts the bytes written, so tell works on streams that can't tell
+    (pipes, sockets, compressors), and passes them on to f. With f None, in
+    the pass that works out the length fields, the bytes are only counted.
+    """
+    def __init__(self, f=None):
+        self.f = f
+        self.pos = 0
 
-        if dtype == TAG_TYPE_DATA:
-            parse_dm_tag_data(f, outdata)
-        else:
-            parse_dm_tag_root(f, outdata)
-        if verbose:
-            print("write_dm_tag_entry end", f.tell())
+    def write(self, data):
+        if self.f is not None:
+            self.f.write(data)
+        self.pos += memoryview(data).nbytes
 
-    else:
-        if verbose:
-            print("read_dm_tag_entry start", f.tell())
-        dtype, name_len = get_from_file(f, "> b H")
-        if name_len:
-            name = get_from_file(f, ">" + str(name_len) + "s").decode("latin")
-        else:
-            name = None
+    def skip(self, size):
+        # count size bytes without their data, only while working out lengths
+        assert self.f is None
+        self.pos += size
 
-        if version == 4:
-            extra_tag_flags = get_from_file(f, ">%c" % size_type)
+    def tell(self):
+        return self.pos
 
-        if dtype == TAG_TYPE_DATA:
-            arr = parse_dm_tag_data(f)
-            if name and hasattr(arr, "__len__") and len(arr) > 0:
-                # if we find data which matches this regex we return a
-                # string instead of an array
-                treat_as_string_names = ['.*Name']
-                for regex in treat_as_string_names:
-                    if re.match(regex, name):
-                        if isinstance(arr[0], int):
-                            arr = ''.join(chr(x) for x in arr)
-                        elif isinstance(arr[0], str):
-                            arr = ''.join(arr)
-            if verbose:
-                print("read_dm_tag_entry end", f.tell())
-            return name, arr
-        elif dtype == TAG_TYPE_ARRAY:
-            result = parse_dm_tag_root(f)
-            if verbose:
-                print("read_dm_tag_entry end", f.tell())
-            return name, result
-        else:
-            raise Exception("Unknown data type=" + str(dtype))
 
+class arrayref(object):
+    """
+    A class to represent an array that has been left in the file. Rather
+    than reading the elements we record where they start, the struct
+    typecodes of a single element and the number of elements, so that the
+    caller can map or read the data later.
+    """
+    def __init__(self, typecodes, offset, length):
+        self.typecodes = typecodes
+        self.offset = offset
+        self.length = length
+
+    def __eq__(self, other):
+        return isinstance(other, arrayref) and (self.typecodes, self.offset, self.length) == (other.typecodes, other.offset, other.length)
+
+    def __ne__(self, other):
+        return not self == other
 
-def parse_dm_tag_data(f, outdata=None):
-    # todo what is id??
-    # it is normally one of 1,3,7,11,19
-    # we can parse lists of numbers with them all 1
-    # strings work with 3
-    # could id be some offset to the start of the data?
-    # for simple types we just read data, for strings, we read type, length
-    # for structs we read len,num, len0,type0,len1,... =num*2+2
-    # structs (15) can be 7,9,11,19
-    # arrays (TAG_TYPE_ARRAY) can be 3 or 11
-    if outdata is not None:  # this means we're WRITING to the file
-            # can we get away with a limited set that we write?
-        # ie can all numbers be doubles or ints, and we have lists
-        if verbose:
-            print("write_dm_tag_data start", f.tell())
-        _, data_type = get_structdmtypes_for_python_typeorobject(outdata)
-        if not data_type:
-            raise Exception("Unsupported type: {}".format(type(outdata)))
-        _delim = "%%%%"
-        put_into_file(f, "> 4s l l", str_to_iso8859_bytes(_delim), 0, data_type)
-        pos = f.tell()
-        header = dm_types[data_type](f, outdata)
-        f.seek(pos-8)  # where our header_len starts
-        put_into_file(f, "> l", header+1)
-        f.seek(0, 2)
-        if verbose:
-            print("write_dm_tag_data end", f.tell())
-    else:
-        if verbose:
-            print("read_dm_tag_data start", f.tell())
-        _delim, header_len, data_type = get_from_file(f, "> 4s {size} {size}".format(size=size_type))
-        assert(_delim == str_to_iso8859_bytes("%%%%"))
-        ret, header = dm_types[data_type](f)
-        assert(header + 1 == header_len)
-        if verbose:
-            print("read_dm_tag_data end", f.tell())
-        return ret
+    def __repr__(self):
+        return "arrayref({}, {}, {})".format(self.typecodes, self.offset, self.length)
+
+    def bytelen(self):
+        return self.length * struct.calcsize(" ".join(self.typecodes))
+
+    def num_elements(self):
+        return self.length
 
 
 # we store the id as a key and the name,
@@ -328,6 +229,9 @@ def get_dmtype_for_name(name):
     return 0
 
 
+DM_TYPE_STRUCT = get_dmtype_for_name('struct')
+
+
 def get_structdmtypes_for_python_typeorobject(typeorobj):
     """
     Return structchar, dmtype for the python (or numpy)
@@ -356,6 +260,8 @@ def get_structdmtypes_for_python_typeorobject(typeorobj):
         return None, get_dmtype_for_name('struct')
     elif comparer(structarray):
         return None, get_dmtype_for_name('array')
+    elif comparer(streamarray):
+        return None, get_dmtype_for_name('array')
     logging.warn("No appropriate DMType found for %s, %s", typeorobj, type(typeorobj))
     return None
 
@@ -374,235 +280,825 @@ def get_dmtype_for_structchar(struct_char):
     return -1
 
 
-def standard_dm_read(datatype_num, desc):
+class DMParser(object):
     """
-    datatype_num is the number of the data type, see dm_simple_names
-    above. desc is a (nicename, struct_char) tuple. We return a function
-    that parses the data for us.
+    Reads (or writes) a DM tag file. All per-file state lives on the parser,
+    notably the version, which selects 32 bit (dm3) or 64 bit (dm4) size
+    fields, so separate files can be parsed concurrently by separate parsers.
+
+    Every method reads from f, or writes to f if the outdata argument is
+    given, mirroring the module level functions. When writing, version
+    chooses the format; when reading it is taken from the file header.
+    Writing never seeks: the tags are walked once to work out the length
+    fields (see write_forward) and then written in one forward pass, so f
+    can be a pipe, socket or compressor.
+
+    If defer_data is True, arrays in tags named 'Data' are not read but
+    returned as arrayref objects recording where they are in the file.
+    If defer_size is given, the same goes for any other numeric array of
+    more than defer_size bytes.
+    If decode_strings is True, arrays not in tags named 'Data' are returned
+    as python objects while parsing: 'H' arrays as (utf-16) strings and
+    others as lists.
     """
-    nicename, structchar, types = desc
+    def __init__(self, f, version=3, defer_data=False, defer_size=None, decode_strings=False):
+        self.f = f
+        self.set_version(version)
+        self.defer_data = defer_data
+        self.defer_size = defer_size
+        self.decode_strings = decode_strings
+        # the length fields of the data being written, see write_forward
+        self.lengths = None
+        self.sizing = False
+        self.dm_types = {}
+        for key, name, sc, types in dm_simple_names:
+            self.dm_types[key] = self.standard_dm_read(sc)
+        self.dm_types[get_dmtype_for_name('bool')] = self.dm_read_bool
+        self.dm_types[get_dmtype_for_name('string')] = self.dm_read_string
+        self.dm_types[get_dmtype_for_name('struct')] = self.dm_read_struct
+        self.dm_types[get_dmtype_for_name('array')] = self.dm_read_array
+
+    def get(self, stype):
+        return get_from_file(self.f, stype)
+
+    def read(self, size):
+        return self.f.read(size)
+
+    def read_array(self, ret, num_elements):
+        if isinstance(self.f, file_type):
+            ret.fromfile(self.f, num_elements)
+        else:
+            ret.frombytes(self.f.read(num_elements * ret.itemsize))
 
-    def dm_read_x(f, outdata=None):
-        """Reads (or write if outdata is given) a simple data type.
-        returns the data if reading and the number of bytes of header
+    def skip(self, size):
+        self.f.seek(size, 1)
+
+    def tell(self):
+        return self.f.tell()
+
+    def is_large_array(self, typecodes, num_elements):
+        # strings are stored as 'H' arrays, we always read those
+        if self.defer_size is None or typecodes == ['H']:
+            return False
+        return num_elements * struct.calcsize(" ".join(typecodes)) > self.defer_size
+
+    def write_forward(self, write, outdata, *args):
         """
+        Writes outdata with the writing method write in two passes. The
+        first writes to nothing and records the value of every length field,
+        which is only known once what follows the field has been written.
+        The second writes f front to back with those values.
+        """
+        f = self.f
+        try:
+            self.lengths, self.sizing = list(), True
+            self.f = lengthwriter()
+            write(outdata, *args)
+            self.lengths, self.sizing = iter(self.lengths), False
+            self.f = lengthwriter(f)
+            return write(outdata, *args)
+        finally:
+            self.f = f
+            self.lengths, self.sizing = None, False
+
+    def put_length(self):
+        """
+        Writes a length field, returning a slot for set_length. While sizing
+        the field is a placeholder, otherwise it holds the recorded value.
+        """
+        if self.sizing:
+            put_into_file(self.f, self.size_format, 0)
+            self.lengths.append(None)
+            return len(self.lengths) - 1
+        put_into_file(self.f, self.size_format, next(self.lengths))
+        return None
+
+    def set_length(self, slot, length):
+        if self.sizing:
+            self.lengths[slot] = length
+
+    def set_version(self, version):
+        # we treat sizes separately to distinguish 32bit (dm3) and 64 bit (dm4)
+        assert version in [3, 4], "Version must be 3 or 4, not %s" % version
+        self.version = version
+        self.size_type = 'L' if version == 3 else 'Q'
+        self.size_format = ">%c" % self.size_type
+        self.size_pair_format = "> {size} {size}".format(size=self.size_type)
+        self.tag_root_format = "> b b %c" % self.size_type
+        self.tag_data_format = "> 4s {size} {size}".format(size=self.size_type)
+
+    def parse_dm_header(self, outdata=None):
+        """
+        This is the start of the DM file. We check for some
+        magic values and then treat the next entry as a tag_root
+
+        If outdata is supplied, we write instead of read using the dictionary outdata as a source
+        Hopefully parse_dm_header(newf, outdata=parse_dm_header(f)) copies f to newf
+        """
+        f = self.f
+        # filesize is sizeondisk - 16. But we have 8 bytes of zero at the end of
+        # the file.
         if outdata is not None:  # this means we're WRITING to the file
+            if self.lengths is None:
+                return self.write_forward(self.parse_dm_header, outdata)
+            f = self.f
             if verbose:
-                print("dm_write start", structchar, outdata, "at", f.tell())
-            put_into_file(f, "<" + structchar, outdata)
+                print("write_dm_header start", self.tell())
+            ver, endianness = self.version, 1
+            put_into_file(f, "> l", ver)
+            file_size = self.put_length()
+            put_into_file(f, "> l", endianness)
+            start = self.tell()
+            self.parse_dm_tag_root(outdata)
+            end = self.tell()
+            if self.version == 3:
+                # the real file size. We started counting after 12-byte version,fs,end
+                # and we need to subtract 16 total:
+                self.set_length(file_size, end - start + 4)
+            else:
+                # dm4 stores the size of the root tag directory
+                self.set_length(file_size, end - start)
+            enda, endb = 0, 0
+            put_into_file(f, "> l l", enda, endb)
             if verbose:
-                print("dm_write end", f.tell())
-            return 0
+                print("write_dm_header end", self.tell())
         else:
             if verbose:
-                print("dm_read start", structchar, "at", f.tell())
-            result = get_from_file(f, "<" + structchar)
+                print("read_dm_header start", self.tell())
+            file_size = self.read_dm_version()
+            start = self.tell()
+            ret = self.parse_dm_tag_root()
+            end = self.tell()
+            # print("fs", file_size, end - start, (end-start)%8)
+            # mfm 2013-07-11 the file_size value is not always
+            # end-start, sometimes there seems to be an extra 4 bytes,
+            # other times not. Let's just ignore it for the moment
+            # assert(file_size == end - start)
+            enda, endb = self.get("> l l")
+            assert(enda == endb == 0)
             if verbose:
-                print("dm_read end", f.tell())
-            return result, 0
+                print("read_dm_header end", self.tell())
+            return ret
 
-    return dm_read_x
-
-dm_types = {}
-for key, name, sc, types in dm_simple_names:
-    dm_types[key] = standard_dm_read(key, (name, sc, types))
-# 8 is boolean, and relatively easy:
-
-
-def dm_read_bool(f, outdata=None):
-    if outdata:  # this means we're WRITING to the file
-        if verbose:
-            print("dm_write_bool start", f.tell())
-        put_into_file(f, "<b", 1 if outdata else 0)
-        if verbose:
-            print("dm_write_bool end", f.tell())
-        return 0
-    else:
-        if verbose:
-            print("dm_read_bool start", f.tell())
-        result = get_from_file(f, "<b")
-        if verbose:
-            print("dm_read_bool end", f.tell())
-        return result != 0, 0
-dm_types[get_dmtype_for_name('bool')] = dm_read_bool
-# string is 18:
+    def read_dm_version(self):
+        """
+        Reads the version, file size and endianness at the start of the file,
+        sets the version and returns the file size.
+        """
+        self.set_version(self.get("> l"))
+        file_size, endianness = self.get(">%c l" % self.size_type)
+        assert endianness == 1, "Endianness must be 1, not %s"%endianness
+        return file_size
 
+    def read_tags(self, paths):
+        """
+        Reads only the tags at paths, each a sequence of tag names and list
+        indices, from the start of the file. Returns a dictionary from each
+        path found (as a tuple) to its value. Other groups and data are
+        skipped: in dm4 files by seeking over the size stored with each tag,
+        in dm3 files by parsing them with all arrays left in the file.
+        """
+        paths = set(tuple(str(key) for key in path) for path in paths)
+        result = dict()
+        self.read_dm_version()
+        self.read_tag_root_paths(tuple(), paths, result)
+        return result
+
+    def read_tag_root_paths(self, path, paths, result):
+        is_dict, _open, num_tags = self.get(self.tag_root_format)
+        for i in range(num_tags):
+            dtype, name, tag_size = self.read_dm_tag_entry_start()
+            child = path + (name if is_dict else str(i), )
+            if child in paths:
+                value = self.read_dm_tag_entry_value(dtype, name)
+                result[child] = value
+                for p in paths:
+                    if len(p) > len(child) and p[:len(child)] == child:
+                        # a path inside a group we have read anyway
+                        v = value
+                        for key in p[len(child):]:
+                            if isinstance(v, dict) and key in v:
+                                v = v[key]
+                            elif isinstance(v, list) and key.isdigit() and int(key) < len(v):
+                                v = v[int(key)]
+                            else:
+                                break
+                        else:
+                            result[p] = v
+            elif dtype == TAG_TYPE_ARRAY and any(p[:len(child)] == child for p in paths):
+                self.read_tag_root_paths(child, paths, result)
+            elif tag_size is not None:
+                self.skip(tag_size)
+            else:
+                self.skip_dm_tag_entry_value(dtype)
+
+    def skip_dm_tag_entry_value(self, dtype):
+        # the entries of nested groups follow each other in the file, so
+        # counting those still to be skipped replaces recursion
+        pending = 0
+        while True:
+            if dtype == TAG_TYPE_DATA:
+                self.parse_dm_tag_data(defer=True)
+            elif dtype == TAG_TYPE_ARRAY:
+                is_dict, _open, num_tags = self.get(self.tag_root_format)
+                pending += num_tags
+            else:
+                raise Exception("Unknown data type=" + str(dtype))
+            if not pending:
+                break
+            pending -= 1
+            dtype, name, tag_size = self.read_dm_tag_entry_start()
 
-# mfm 2013-05-13 looks like this is never used, and all strings are
-# treated as array?
-def dm_read_string(f, outdata=None):
-    header_size = 1  # just a length field
-    if outdata is not None:  # this means we're WRITING to the file
-        if verbose:
-            print("dm_write_string start", f.tell())
-        outdata = outdata.encode("utf_16_le")
-        slen = len(outdata)
-        put_into_file(f, ">L", slen)
-        put_into_file(f, ">" + str(slen) + "s", str_to_iso8859_bytes(outdata))
-        if verbose:
-            print("dm_write_string end", f.tell())
-        return header_size
-    else:
-        assert(False)
-        if verbose:
-            print("dm_read_string start", f.tell())
-        slen = get_from_file(f, ">L")
-        raws = get_from_file(f, ">" + str(slen) + "s")
-        if verbose:
-            print("dm_read_string end", f.tell())
-        return u(raws, "utf_16_le"), header_size
+    def parse_dm_tag_root(self, outdata=None):
+        if outdata is not None:  # this means we're WRITING to the file
+            if self.lengths is None:
+                return self.write_forward(self.parse_dm_tag_root, outdata)
+            f = self.f
+            is_dict = 0 if isinstance(outdata, list) else 1
+            _open = 0
+            if is_dict:
+                num_tags = sum(1 if k is not None and len(k) > 0 and v is not None else 0 for k, v in outdata.items())
+            else:
+                num_tags = sum(1 if v is not None else 0 for v in outdata)
+            if verbose:
+                print("write_dm_tag_root start {} {} {}".format(self.tell(), is_dict, num_tags))
+            put_into_file(f, "> b b %c" % self.size_type, is_dict, _open, num_tags)
+            if not is_dict:
+                for subdata in outdata:
+                    if subdata is not None:
+                        self.parse_dm_tag_entry(subdata, None)
+            else:
+                for key in outdata:
+                    if key is not None and len(key) > 0:  # don't write out invalid dict's
+                        value = outdata[key]
+                        if value is not None:
+                            self.parse_dm_tag_entry(value, key)
+            if verbose:
+                print("write_dm_tag_root end", self.tell())
+        else:
+            if verbose:
+                print("read_dm_tag_root start", self.tell())
+            # nested groups are read from a stack of [group, tags left]
+            # frames rather than by recursion, so their depth is not limited
+            is_dict, _open, num_tags = self.get(self.tag_root_format)
+            new_obj = {} if is_dict else []
+            stack = [[new_obj, num_tags]]
+            while stack:
+                frame = stack[-1]
+                if not frame[1]:
+                    stack.pop()
+                    continue
+                frame[1] -= 1
+                group = frame[0]
+                dtype, name, tag_size = self.read_dm_tag_entry_start()
+                if dtype == TAG_TYPE_ARRAY:
+                    is_dict, _open, num_tags = self.get(self.tag_root_format)
+                    data = {} if is_dict else []
+                    stack.append([data, num_tags])
+                else:
+                    data = self.read_dm_tag_entry_value(dtype, name)
+                if isinstance(group, dict):
+                    assert(name is not None)
+                    group[name] = data
+                else:
+                    assert(name is None)
+                    group.append(data)
+            if verbose:
+                print("read_dm_tag_root end", self.tell())
+            return new_obj
 
-dm_types[get_dmtype_for_name('string')] = dm_read_string
+    def parse_dm_tag_entry(self, outdata=None, outname=None):
+        if outdata is not None:  # this means we're WRITING to the file
+            if self.lengths is None:
+                return self.write_forward(self.parse_dm_tag_entry, outdata, outname)
+            f = self.f
+            if verbose:
+                print("write_dm_tag_entry start", self.tell())
+            dtype = TAG_TYPE_ARRAY if isinstance(outdata, (dict, list)) else TAG_TYPE_DATA
+            name_len = len(outname) if outname else 0
+            put_into_file(f, "> b H", dtype, name_len)
+            if outname:
+                put_into_file(f, ">" + str(name_len) + "s", str_to_iso8859_bytes(outname))
+            if self.version == 4:
+                # the tag size counts the bytes after itself to the end of the tag
+                tag_size = self.put_length()
+                start = self.tell()
+
+            if dtype == TAG_TYPE_DATA:
+                self.parse_dm_tag_data(outdata)
+            else:
+                self.parse_dm_tag_root(outdata)
+            if self.version == 4:
+                self.set_length(tag_size, self.tell() - start)
+            if verbose:
+                print("write_dm_tag_entry end", self.tell())
 
+        else:
+            if verbose:
+                print("read_dm_tag_entry start", self.tell())
+            dtype, name, tag_size = self.read_dm_tag_entry_start()
+            return name, self.read_dm_tag_entry_value(dtype, name)
 
-# struct is 15
-def dm_read_struct_types(f, outtypes=None):
-    if outtypes is not None:
-        _len, nfields = 0, len(outtypes)
-        put_into_file(f, "> l l", _len, nfields)
-        for t in outtypes:
-            _len = 0
-            put_into_file(f, "> l l", _len, t)
-        return 2+2*len(outtypes)
-    else:
-        types = []
-        _len, nfields = get_from_file(f, "> {size} {size}".format(size=size_type))
-        assert(_len == 0)  # is it always?
-        for i in range(nfields):
-            _len, dtype = get_from_file(f, "> {size} {size}".format(size=size_type))
-            types.append(dtype)
-            assert(_len == 0)
-            assert(dtype != 15)  # we don't allow structs of structs?
-        return types, 2+2*nfields
+    def read_dm_tag_entry_start(self):
+        """
+        Reads the type and name of a tag entry, and in dm4 files the size of
+        the rest of the entry (None for dm3).
+        """
+        dtype, name_len = self.get("> b H")
+        if name_len:
+            name = str(self.read(name_len), "latin")
+        else:
+            name = None
+        tag_size = None
+        if self.version == 4:
+            tag_size = self.get(self.size_format)
+        return dtype, name, tag_size
 
+    def read_dm_tag_entry_value(self, dtype, name):
+        if dtype == TAG_TYPE_DATA:
+            arr = self.parse_dm_tag_data(defer=self.defer_data and name == "Data")
+            if name and hasattr(arr, "__len__") and len(arr) > 0:
+                # if we find data whose name contains one of these we
+                # return a string instead of an array
+                treat_as_string_names = ['Name']
+                for string_name in treat_as_string_names:
+                    if string_name in name:
+                        if isinstance(arr[0], int):
+                            arr = ''.join(map(chr, arr))
+                        elif isinstance(arr[0], str):
+                            arr = ''.join(arr)
+            if self.decode_strings and name != "Data" and isinstance(arr, array.array):
+                arr = array_to_python(arr)
+            if verbose:
+                print("read_dm_tag_entry end", self.tell())
+            return arr
+        elif dtype == TAG_TYPE_ARRAY:
+            result = self.parse_dm_tag_root()
+            if verbose:
+                print("read_dm_tag_entry end", self.tell())
+            return result
+        else:
+            raise Exception("Unknown data type=" + str(dtype))
 
-def dm_read_struct(f, outdata=None):
-    if outdata is not None:  # this means we're WRITING to the file
-        if verbose:
-            print("dm_write_struct start", f.tell())
-        start = f.tell()
-        types = [get_structdmtypes_for_python_typeorobject(x)[1]
-                 for x in outdata]
-        header = dm_read_struct_types(f, types)
-        for t, data in zip(types, outdata):
-            dm_types[t](f, data)
-        # we write length at the very end
-        # but _len is probably not len, it's set to 0 for the
-        # file I'm trying...
-        write_len = False
-        if write_len:
-            end = f.tell()
-            f.seek(start)
-            # dm_read_struct first writes a length which we overwrite here
-            # I think the length ignores the length field (4 bytes)
-            put_into_file(f, "> l", end-start-4)
-            f.seek(0, 2)  # the very end (2 is pos from end)
-            assert(f.tell() == end)
-        if verbose:
-            print("dm_write_struct end", f.tell())
-        return header
-    else:
-        if verbose:
-            print("dm_read_struct start", f.tell())
-        types, header = dm_read_struct_types(f)
-        ret = []
-        for t in types:
-            d, h = dm_types[t](f)
-            ret.append(d)
-        if verbose:
-            print("dm_read_struct end", f.tell())
-        return tuple(ret), header
+    def parse_dm_tag_data(self, outdata=None, defer=False):
+        # todo what is id??
+        # it is normally one of 1,3,7,11,19
+        # we can parse lists of numbers with them all 1
+        # strings work with 3
+        # could id be some offset to the start of the data?
+        # for simple types we just read data, for strings, we read type, length
+        # for structs we read len,num, len0,type0,len1,... =num*2+2
+        # structs (15) can be 7,9,11,19
+        # arrays (TAG_TYPE_ARRAY) can be 3 or 11
+        if outdata is not None:  # this means we're WRITING to the file
+                # can we get away with a limited set that we write?
+            # ie can all numbers be doubles or ints, and we have lists
+            if self.lengths is None:
+                return self.write_forward(self.parse_dm_tag_data, outdata)
+            f = self.f
+            if verbose:
+                print("write_dm_tag_data start", self.tell())
+            _, data_type = get_structdmtypes_for_python_typeorobject(outdata)
+            if not data_type:
+                raise Exception("Unsupported type: {}".format(type(outdata)))
+            put_into_file(f, "> 4s", TAG_DATA_DELIMITER)
+            header_len = self.put_length()
+            put_into_file(f, self.size_format, data_type)
+            header = self.dm_types[data_type](outdata)
+            self.set_length(header_len, header+1)
+            if verbose:
+                print("write_dm_tag_data end", self.tell())
+        else:
+            if verbose:
+                print("read_dm_tag_data start", self.tell())
+            _delim, header_len, data_type = self.get(self.tag_data_format)
+            assert(_delim == TAG_DATA_DELIMITER)
+            if defer and data_type == TAG_TYPE_ARRAY:
+                ret, header = self.dm_read_array(defer=True)
+            else:
+                ret, header = self.dm_types[data_type]()
+            assert(header + 1 == header_len)
+            if verbose:
+                print("read_dm_tag_data end", self.tell())
+            return ret
 
-dm_types[get_dmtype_for_name('struct')] = dm_read_struct
+    def standard_dm_read(self, structchar):
+        """
+        structchar is the struct character of one of the simple data types,
+        see dm_simple_names above. We return a function that parses the
+        data for us.
+        """
+        def dm_read_x(outdata=None):
+            """Reads (or write if outdata is given) a simple data type.
+            returns the data if reading and the number of bytes of header
+            """
+            f = self.f
+            if outdata is not None:  # this means we're WRITING to the file
+                if verbose:
+                    print("dm_write start", structchar, outdata, "at", self.tell())
+                put_into_file(f, "<" + structchar, outdata)
+                if verbose:
+                    print("dm_write end", self.tell())
+                return 0
+            else:
+                if verbose:
+                    print("dm_read start", structchar, "at", self.tell())
+                result = self.get("<" + structchar)
+                if verbose:
+                    print("dm_read end", self.tell())
+                return result, 0
 
+        return dm_read_x
 
-# array is TAG_TYPE_ARRAY
-def dm_read_array(f, outdata=None):
-    array_header = 2  # type, length
-    if outdata is not None:  # this means we're WRITING to the file
-        if verbose:
-            print("dm_write_array start", f.tell())
-        if isinstance(outdata, structarray):
-            # we write type, struct_types, length
-            outdmtypes = [get_dmtype_for_structchar(s) for s in outdata.typecodes]
-            put_into_file(f, "> l", get_dmtype_for_name('struct'))
-            struct_header = dm_read_struct_types(f, outtypes=outdmtypes)
-            put_into_file(f, "> L", outdata.num_elements())
-            outdata.to_file(f)
+    # 8 is boolean, and relatively easy:
+    def dm_read_bool(self, outdata=None):
+        f = self.f
+        if outdata:  # this means we're WRITING to the file
             if verbose:
-                print("dm_write_array1 end", f.tell())
-            return struct_header + array_header
-        elif isinstance(outdata, (str, unicode_type, array.array)):
-            if isinstance(outdata, (str, unicode_type)):
-                outdata = array.array('H', outdata.encode("utf_16_le"))
-            assert(isinstance(outdata, array.array))
-            dtype = get_dmtype_for_structchar(outdata.typecode)
-            if dtype < 0:
-                print("typecode %s" % outdata.typecode)
-            assert dtype >= 0
-            put_into_file(f, "> l", dtype)
-            put_into_file(f, "> L", int(len(outdata.tostring()) / struct.calcsize(outdata.typecode)))
+                print("dm_write_bool start", self.tell())
+            put_into_file(f, "<b", 1 if outdata else 0)
             if verbose:
-                print("dm_write_array2 end", dtype, len(outdata), outdata.typecode, f.tell())
-            if isinstance(f, file_type):
-                outdata.tofile(f)
-            else:
-                f.write(outdata.tostring())
+                print("dm_write_bool end", self.tell())
+            return 0
+        else:
+            if verbose:
+                print("dm_read_bool start", self.tell())
+            result = self.get("<b")
+            if verbose:
+                print("dm_read_bool end", self.tell())
+            return result != 0, 0
+
+    # string is 18:
+    # mfm 2013-05-13 looks like this is never used, and all strings are
+    # treated as array?
+    def dm_read_string(self, outdata=None):
+        f = self.f
+        header_size = 1  # just a length field
+        if outdata is not None:  # this means we're WRITING to the file
+            if verbose:
+                print("dm_write_string start", self.tell())
+            outdata = outdata.encode("utf_16_le")
+            slen = len(outdata)
+            put_into_file(f, ">L", slen)
+            put_into_file(f, ">" + str(slen) + "s", str_to_iso8859_bytes(outdata))
             if verbose:
-                print("dm_write_array3 end", f.tell())
-            return array_header
+                print("dm_write_string end", self.tell())
+            return header_size
         else:
-            logging.warn("Unsupported type for conversion to array:%s", outdata)
-
-    else:
-        # supports arrays of structs and arrays of types,
-        # but not arrays of arrays (Is this possible)
-        # actually lets just use the array object, which only allows arrays of
-        # simple types!
-
-        # arrays of structs are pretty common, eg in a simple image CLUT
-        # data["DocumentObjectList"][0]["ImageDisplayInfo"]["CLUT"] is an
-        # array of 3 bytes
-        # we can't handle arrays of structs easily, as we use lists for
-        # taglists, dicts for taggroups and arrays for array data.
-        # But array.array only supports simple types. We need a new type, then.
-        # let's make a structarray
-        if verbose:
-            print("dm_read_array start", f.tell())
-        pos = f.tell()
-        dtype = get_from_file(f, "> {size}".format(size=size_type))
-        if dtype == get_dmtype_for_name('struct'):
-            types, struct_header = dm_read_struct_types(f)
-            # NB this was '> L', but changing to > {size}. May break things!
-            alen = get_from_file(f, "> {size}".format(size=size_type))
-            ret = structarray([get_structchar_for_dmtype(d) for d in types])
-            ret.from_file(f, alen)
+            assert(False)
             if verbose:
-                print("dm_read_array1 end", f.tell())
-            return ret, array_header + struct_header
+                print("dm_read_string start", self.tell())
+            slen = self.get(">L")
+            raws = self.get(">" + str(slen) + "s")
+            if verbose:
+                print("dm_read_string end", self.tell())
+            return u(raws, "utf_16_le"), header_size
+
+    # struct is 15
+    def dm_read_struct_types(self, outtypes=None):
+        f = self.f
+        if outtypes is not None:
+            _len, nfields = 0, len(outtypes)
+            put_into_file(f, "> {size} {size}".format(size=self.size_type), _len, nfields)
+            for t in outtypes:
+                _len = 0
+                put_into_file(f, "> {size} {size}".format(size=self.size_type), _len, t)
+            return 2+2*len(outtypes)
+        else:
+            types = []
+            _len, nfields = self.get(self.size_pair_format)
+            assert(_len == 0)  # is it always?
+            for i in range(nfields):
+                _len, dtype = self.get(self.size_pair_format)
+                types.append(dtype)
+                assert(_len == 0)
+                assert(dtype != 15)  # we don't allow structs of structs?
+            return types, 2+2*nfields
+
+    def dm_read_struct(self, outdata=None):
+        f = self.f
+        if outdata is not None:  # this means we're WRITING to the file
+            if verbose:
+                print("dm_write_struct start", self.tell())
+            start = self.tell()
+            types = [get_structdmtypes_for_python_typeorobject(x)[1]
+                     for x in outdata]
+            header = self.dm_read_struct_types(types)
+            for t, data in zip(types, outdata):
+                self.dm_types[t](data)
+            # we write length at the very end
+            # but _len is probably not len, it's set to 0 for the
+            # file I'm trying...
+            write_len = False
+            if write_len:
+                end = self.tell()
+                f.seek(start)
+                # dm_read_struct first writes a length which we overwrite here
+                # I think the length ignores the length field (4 bytes)
+                put_into_file(f, "> l", end-start-4)
+                f.seek(0, 2)  # the very end (2 is pos from end)
+                assert(self.tell() == end)
+            if verbose:
+                print("dm_write_struct end", self.tell())
+            return header
+        else:
+            if verbose:
+                print("dm_read_struct start", self.tell())
+            types, header = self.dm_read_struct_types()
+            ret = []
+            for t in types:
+                d, h = self.dm_types[t]()
+                ret.append(d)
+            if verbose:
+                print("dm_read_struct end", self.tell())
+            return tuple(ret), header
+
+    def write_streamarray(self, outdata):
+        if self.sizing:
+            self.f.skip(outdata.bytelen())  # no need to produce the chunks just to count them
         else:
-            # mfm 2013-08-02 struct.calcsize('l') is 4 on win and 8 on Mac!
-            # however >l, <l is 4 on both... could be a bug?
-            # Can we get around this by adding '>' to out structchar?
-            # nope, array only takes a sinlge char. Trying i, I instead
-            struct_char = get_structchar_for_dmtype(dtype)
-            ret = array.array(struct_char)
-            # NB this was '> L', but changing to > {size}. May break things!
-            alen = get_from_file(f, "> {size}".format(size=size_type))
-            if alen:
-                # faster to read <1024f than <f 1024 times. probly
-                # stype = "<" + str(alen) + dm_simple_names[dtype][1]
-                # ret = get_from_file(f, stype)
+            outdata.to_file(self.f)
+
+    # array is TAG_TYPE_ARRAY
+    def dm_read_array(self, outdata=None, defer=False):
+        f = self.f
+        array_header = 2  # type, length
+        if outdata is not None:  # this means we're WRITING to the file
+            if verbose:
+                print("dm_write_array start", self.tell())
+            if isinstance(outdata, streamarray) and len(outdata.typecodes) == 1:
+                # we write type, length, then the chunks
+                dtype = get_dmtype_for_structchar(outdata.typecodes[0])
+                assert dtype >= 0
+                put_into_file(f, ">%c" % self.size_type, dtype)
+                put_into_file(f, ">%c" % self.size_type, outdata.num_elements())
+                self.write_streamarray(outdata)
                 if verbose:
-                    print("dm_read_array2 end", dtype, alen, ret.typecode, f.tell())
-                if isinstance(f, file_type):
-                    ret.fromfile(f, alen)
+                    print("dm_write_array4 end", self.tell())
+                return array_header
+            elif isinstance(outdata, (structarray, streamarray)):
+                # we write type, struct_types, length
+                outdmtypes = [get_dmtype_for_structchar(s) for s in outdata.typecodes]
+                put_into_file(f, ">%c" % self.size_type, get_dmtype_for_name('struct'))
+                struct_header = self.dm_read_struct_types(outtypes=outdmtypes)
+                put_into_file(f, ">%c" % self.size_type, outdata.num_elements())
+                if isinstance(outdata, streamarray):
+                    self.write_streamarray(outdata)
                 else:
-                    ret.fromstring(f.read(alen*struct.calcsize(ret.typecode)))
-            # if dtype == get_dmtype_for_name('ushort'):
-            #     ret = ret.tostring().decode("utf-16")
+                    outdata.to_file(f)
+                if verbose:
+                    print("dm_write_array1 end", self.tell())
+                return struct_header + array_header
+            elif isinstance(outdata, (str, unicode_type, array.array)):
+                if isinstance(outdata, (str, unicode_type)):
+                    outdata = array.array('H', outdata.encode("utf_16_le"))
+                assert(isinstance(outdata, array.array))
+                dtype = get_dmtype_for_structchar(outdata.typecode)
+                if dtype < 0:
+                    print("typecode %s" % outdata.typecode)
+                assert dtype >= 0
+                put_into_file(f, ">%c" % self.size_type, dtype)
+                put_into_file(f, ">%c" % self.size_type, len(outdata))
+                if verbose:
+                    print("dm_write_array2 end", dtype, len(outdata), outdata.typecode, self.tell())
+                f.write(outdata)
+                if verbose:
+                    print("dm_write_array3 end", self.tell())
+                return array_header
+            else:
+                logging.warn("Unsupported type for conversion to array:%s", outdata)
+
+        else:
+            # supports arrays of structs and arrays of types,
+            # but not arrays of arrays (Is this possible)
+            # actually lets just use the array object, which only allows arrays of
+            # simple types!
+
+            # arrays of structs are pretty common, eg in a simple image CLUT
+            # data["DocumentObjectList"][0]["ImageDisplayInfo"]["CLUT"] is an
+            # array of 3 bytes
+            # we can't handle arrays of structs easily, as we use lists for
+            # taglists, dicts for taggroups and arrays for array data.
+            # But array.array only supports simple types. We need a new type, then.
+            # let's make a structarray
             if verbose:
-                print("dm_read_array3 end", f.tell())
-            return ret, array_header
+                print("dm_read_array start", self.tell())
+            dtype = self.get(self.size_format)
+            if dtype == DM_TYPE_STRUCT:
+                types, struct_header = self.dm_read_struct_types()
+                # NB this was '> L', but changing to > {size}. May break things!
+                alen = self.get(self.size_format)
+                typecodes = [get_structchar_for_dmtype(d) for d in types]
+                if defer or self.is_large_array(typecodes, alen):
+                    ret = arrayref(typecodes, self.tell(), alen)
+                    self.skip(ret.bytelen())
+                    return ret, array_header + struct_header
+                ret = structarray(typecodes)
+                ret.from_bytes(self.read(ret.bytelen(alen)))
+                if verbose:
+                    print("dm_read_array1 end", self.tell())
+                return ret, array_header + struct_header
+            else:
+                # mfm 2013-08-02 struct.calcsize('l') is 4 on win and 8 on Mac!
+                # however >l, <l is 4 on both... could be a bug?
+                # Can we get around this by adding '>' to out structchar?
+                # nope, array only takes a sinlge char. Trying i, I instead
+                struct_char = get_structchar_for_dmtype(dtype)
+                ret = array.array(struct_char)
+                # NB this was '> L', but changing to > {size}. May break things!
+                alen = self.get(self.size_format)
+                if defer or self.is_large_array([struct_char], alen):
+                    ret = arrayref([struct_char], self.tell(), alen)
+                    self.skip(ret.bytelen())
+                    if verbose:
+                        print("dm_read_array deferred", ret, self.tell())
+                    return ret, array_header
+                if alen:
+                    # faster to read <1024f than <f 1024 times. probly
+                    # stype = "<" + str(alen) + dm_simple_names[dtype][1]
+                    # ret = self.get(stype)
+                    if verbose:
+                        print("dm_read_array2 end", dtype, alen, ret.typecode, self.tell())
+                    self.read_array(ret, alen)
+                # if dtype == get_dmtype_for_name('ushort'):
+                #     ret = ret.tostring().decode("utf-16")
+                if verbose:
+                    print("dm_read_array3 end", self.tell())
+                return ret, array_header
+
+
+class DMBufferParser(DMParser):
+    """
+    A read only DMParser working over a single buffer holding the whole file,
+    eg a memoryview of an mmap, starting at offset. Values are unpacked
+    in place with cached struct.Struct objects rather than read one at a
+    time from a file. Call close (or use as a context manager) to release
+    the buffer.
+    """
+    def __init__(self, buffer, offset=0, defer_data=False, defer_size=None, decode_strings=False):
+        super(DMBufferParser, self).__init__(None, defer_data=defer_data, defer_size=defer_size, decode_strings=decode_strings)
+        self.buffer = memoryview(buffer).cast('B')
+        self.pos = offset
+
+    def close(self):
+        self.buffer.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, stype):
+        try:
+            unpack_from, size, single = _structs[stype]
+        except KeyError:
+            s = struct.Struct(stype)
+            unpack_from, size, single = _structs[stype] = s.unpack_from, s.size, len(s.unpack(bytes(s.size))) == 1
+        d = unpack_from(self.buffer, self.pos)
+        self.pos += size
+        return d[0] if single else d
+
+    def read(self, size):
+        src = self.buffer[self.pos:self.pos + size]
+        assert(len(src) == size)
+        self.pos += size
+        return src
+
+    def read_array(self, ret, num_elements):
+        ret.frombytes(self.read(num_elements * ret.itemsize))
+
+    def skip(self, size):
+        self.pos += size
 
+    def tell(self):
+        return self.pos
+
+
+# the module level functions below read and write dm3 files (or dm4 files in
+# the case of parse_dm_header) using a new DMParser for each call.
+
+def parse_dm_header(f, outdata=None, defer_data=False, version=3, defer_size=None, decode_strings=False):
+    """
+    This is the start of the DM file. We check for some
+    magic values and then treat the next entry as a tag_root
+
+    If outdata is supplied, we write instead of read using the dictionary outdata as a source
+    Hopefully parse_dm_header(newf, outdata=parse_dm_header(f)) copies f to newf
+    version (3 or 4) is the format to write; dm4 uses 64 bit sizes throughout.
+
+    If defer_data is True, arrays in tags named 'Data' are not read but
+    returned as arrayref objects recording where they are in the file.
+    If defer_size is given, so are other numeric arrays of more than
+    defer_size bytes.
+    If decode_strings is True, arrays outside 'Data' tags are returned as
+    strings ('H' arrays) or lists.
+    """
+    return DMParser(f, version=version, defer_data=defer_data, defer_size=defer_size, decode_strings=decode_strings).parse_dm_header(outdata)
+
+
+@contextlib.contextmanager
+def open_dm_parser(f, **options):
+    """
+    Yields a parser for the DM file f from its current position: a
+    DMBufferParser over a memory map of the file (or the buffer of an
+    in-memory file) where possible, otherwise a DMParser. options are passed
+    to the parser. After a successful parse f is left where the parser
+    stopped.
+    """
+    buffer = None
+    try:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, io.UnsupportedOperation, ValueError, OSError):
+        if isinstance(f, io.BytesIO):
+            buffer = f.getbuffer()
+    if buffer is None:
+        yield DMParser(f, **options)
+        return
+    try:
+        with DMBufferParser(buffer, f.tell(), **options) as parser:
+            yield parser
+        f.seek(parser.pos)
+    finally:
+        try:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+            else:
+                buffer.release()
+        except BufferError:
+            pass  # a failed parse can leave views of the buffer in its traceback
+
+
+def parse_dm_file(f, defer_data=False, defer_size=None, decode_strings=False):
+    """
+    Reads the DM file f from its current position, like parse_dm_header,
+    but parses a memory map of the file (or the buffer of an in-memory
+    file) with a DMBufferParser where possible. f is left after the end of
+    the DM data.
+    """
+    with open_dm_parser(f, defer_data=defer_data, defer_size=defer_size, decode_strings=decode_strings) as parser:
+        return parser.parse_dm_header()
+
+
+def read_dm_tags(f, paths, decode_strings=False):
+    """
+    Reads only the tags at paths from the DM file f, see DMParser.read_tags.
+    Data arrays are left in the file as arrayrefs.
+    """
+    with open_dm_parser(f, defer_data=True, decode_strings=decode_strings) as parser:
+        return parser.read_tags(paths)
+
+
+def parse_dm_tag_root(f, outdata=None, defer_data=False):
+    return DMParser(f, defer_data=defer_data).parse_dm_tag_root(outdata)
+
+
+def parse_dm_tag_entry(f, outdata=None, outname=None, defer_data=False):
+    return DMParser(f, defer_data=defer_data).parse_dm_tag_entry(outdata, outname)
+
+
+def parse_dm_tag_data(f, outdata=None, defer=False):
+    return DMParser(f).parse_dm_tag_data(outdata, defer)
+
+
+def standard_dm_read(datatype_num, desc):
+    """
+    datatype_num is the number of the data type, see dm_simple_names
+    above. desc is a (nicename, struct_char) tuple. We return a function
+    that parses the data for us.
+    """
+    nicename, structchar, types = desc
+
+    def dm_read_x(f, outdata=None):
+        return DMParser(f).standard_dm_read(structchar)(outdata)
+
+    return dm_read_x
+
+
+def dm_read_bool(f, outdata=None):
+    return DMParser(f).dm_read_bool(outdata)
+
+
+def dm_read_string(f, outdata=None):
+    return DMParser(f).dm_read_string(outdata)
+
+
+def dm_read_struct_types(f, outtypes=None):
+    return DMParser(f).dm_read_struct_types(outtypes)
+
+
+def dm_read_struct(f, outdata=None):
+    return DMParser(f).dm_read_struct(outdata)
+
+
+def dm_read_array(f, outdata=None, defer=False):
+    return DMParser(f).dm_read_array(outdata, defer)
+
+
+dm_types = {}
+for key, name, sc, types in dm_simple_names:
+    dm_types[key] = standard_dm_read(key, (name, sc, types))
+dm_types[get_dmtype_for_name('bool')] = dm_read_bool
+dm_types[get_dmtype_for_name('string')] = dm_read_string
+dm_types[get_dmtype_for_name('struct')] = dm_read_struct
 dm_types[get_dmtype_for_name('array')] = dm_read_array
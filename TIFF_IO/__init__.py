@@ -23,7 +23,7 @@ import datetime
 import json
 
 # local libraries
-# None
+from . import header_cache
 
 
 _ = gettext.gettext
@@ -31,11 +31,16 @@ _ = gettext.gettext
 
 NION_TAG = 'nion.1'
 
+# contiguous data of at least this many bytes is memory mapped instead of read
+memmap_size = 256 * 1024 * 1024
+
 
 class TIFFIODelegate(object):
 
-    def __init__(self, api):
+    def __init__(self, api, cache=None):
         self.__api = api
+        # a header_cache.HeaderCache for the page records of files being read, or None
+        self.__cache = cache
         self.io_handler_id = "tiff-io-handler"
         self.io_handler_name = _("TIFF Files")
         self.io_handler_extensions = ["tif", "tiff"]
@@ -47,11 +52,11 @@ class TIFFIODelegate(object):
         # Imagej axes names
         images = channels = slices = frames = None
 
-        with tifffile.TiffFile(file_path) as tiffimage:
-            # TODO: Check whether support for multiple tif pages is necessary (for imagej compatible tifs it isn't)
+        with tifffile.TiffFile(file_path, cache=self.__cache) as tiffimage:
             # Non-imagej compatible tifs are written (by tifffile.py) into multiple pages if they have more than 2 dimensions
-            # There is also a 'shape' attribute that describes the original shape for those files. This information could be used
-            # to properly load these files as well. However, right now, only the first page will be loaded and imported.
+            # and have a 'shape' attribute that describes the original shape. The first series of the file uses it to
+            # load all pages as one array. Uncompressed files of either kind store all pages contiguously, so their
+            # page records are not read beyond the first one.
             tiffpage = tiffimage.pages[0]
             # Try if image is imagej type
             if tiffimage.is_imagej:
@@ -90,7 +95,14 @@ class TIFFIODelegate(object):
                                               data_element_dict.get('datum_dimension_count', 1) +
                                               int(data_element_dict.get('is_sequence', False)))
 
-            data = tiffpage.asarray()
+            # imagej stacks are described by the first page alone, other files by their first series
+            if tiffimage.is_imagej:
+                data = tiffpage.asarray(memmap=tiffpage.is_contiguous is not None and
+                                        tiffpage.is_contiguous[1] >= memmap_size)
+            else:
+                series = tiffimage.series[0]
+                data = tiffimage.asarray(series=0, memmap=series.offset is not None and
+                                         numpy.prod(series.shape) * series.dtype.itemsize >= memmap_size)
 
             # check and adapt for rgb(a) data
             # last data axis depends on whether data is rgb(a)
@@ -409,8 +421,10 @@ class TIFFIOExtension(object):
     def __init__(self, api_broker):
         # grab the api object.
         api = api_broker.get_api(version="1", ui_version="1")
+        # files are often reopened (browsing, re-import), so keep their parsed page records on disk.
+        cache = header_cache.HeaderCache(header_cache.default_directory("tiff_io"))
         # be sure to keep a reference or it will be closed immediately.
-        self.__io_handler_ref = api.create_data_and_metadata_io_handler(TIFFIODelegate(api))
+        self.__io_handler_ref = api.create_data_and_metadata_io_handler(TIFFIODelegate(api, cache))
 
     def close(self):
         # close will be called when the extension is unloaded. in turn, close any references so they get closed. this
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for reading TIFF files.
+
+Run from the repository root with
+
+    python -m TIFF_IO.tiffbenchmark [file.tif ...]
+    python -m TIFF_IO.tiffbenchmark --codecs file.tif [...]
+
+The second form compares the registered compression codecs on the first
+page of each file.
+
+Without arguments a large deflate compressed, tiled image, a file with
+many small compressed pages, a stack of uncompressed pages and a series
+of 1000 files are generated and used. The predictors of the writer are
+compared on detector-like images, and the decoders of the codecs
+implemented in Python are compared with the per-byte and per-code loops
+they replaced.
+"""
+
+import io
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from TIFF_IO import header_cache
+    from TIFF_IO import tifffile
+
+
+def make_image(shape=(8192, 8192)):
+    """
+    Returns a uint16 image that compresses about as well as a detector
+    image: a smooth background with shot noise on top.
+    """
+    y, x = numpy.ogrid[:shape[0], :shape[1]]
+    background = 1000 + 500 * numpy.sin(y / 300) * numpy.cos(x / 200)
+    return numpy.random.poisson(background).astype(numpy.uint16)
+
+
+def decode_packbits_loop(encoded):
+    """The per-run loop decode_packbits used to be, extending a list of ints."""
+    result = []
+    result_extend = result.extend
+    i = 0
+    try:
+        while True:
+            n = encoded[i] + 1
+            i += 1
+            if n < 129:
+                result_extend(encoded[i:i+n])
+                i += n
+            elif n > 129:
+                result_extend(encoded[i:i+1] * (258-n))
+                i += 1
+    except IndexError:
+        pass
+    return bytes(result)
+
+
+def decode_lzw_loop(encoded):
+    """The per-code loop decode_lzw used to be, reading each code with struct."""
+    len_encoded = len(encoded)
+    bitcount_max = len_encoded * 8
+    unpack = struct.unpack
+    newtable = [bytes([i]) for i in range(256)]
+    newtable.extend((0, 0))
+
+    def next_code():
+        start = bitcount // 8
+        s = encoded[start:start+4]
+        try:
+            code = unpack('>I', s)[0]
+        except Exception:
+            code = unpack('>I', s + b'\x00'*(4-len(s)))[0]
+        code <<= bitcount % 8
+        code &= mask
+        return code >> shr
+
+    switchbitch = {
+        255: (9, 23, int(9*'1'+'0'*23, 2)),
+        511: (10, 22, int(10*'1'+'0'*22, 2)),
+        1023: (11, 21, int(11*'1'+'0'*21, 2)),
+        2047: (12, 20, int(12*'1'+'0'*20, 2)), }
+    bitw, shr, mask = switchbitch[255]
+    bitcount = 0
+    next_code()
+    code = 0
+    oldcode = 0
+    result = []
+    result_append = result.append
+    while True:
+        code = next_code()
+        bitcount += bitw
+        if code == 257 or bitcount >= bitcount_max:
+            break
+        if code == 256:
+            table = newtable[:]
+            table_append = table.append
+            lentable = 258
+            bitw, shr, mask = switchbitch[255]
+            code = next_code()
+            bitcount += bitw
+            if code == 257:
+                break
+            result_append(table[code])
+        else:
+            if code < lentable:
+                decoded = table[code]
+                newcode = table[oldcode] + decoded[:1]
+            else:
+                newcode = table[oldcode]
+                newcode += newcode[:1]
+                decoded = newcode
+            result_append(decoded)
+            table_append(newcode)
+            lentable += 1
+        oldcode = code
+        if lentable in switchbitch:
+            bitw, shr, mask = switchbitch[lentable]
+    return b''.join(result)
+
+
+def best_time(fn, repeat=5):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_decode(path):
+    """
+    Compares decoding the first page of path serially with decoding its
+    strips or tiles on 2, 4 and one per core threads.
+    """
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages[0]
+        data = page.asarray()
+        print("{}: {} {}, {}, {} {}".format(
+            os.path.basename(path), data.shape, data.dtype, page.compression,
+            len(page._byte_counts_offsets[0]), "tiles" if page.is_tiled else "strips"))
+        for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+            name = "{} threads".format(workers) if workers > 1 else "serial"
+            elapsed = best_time(lambda: page.asarray(maxworkers=workers))
+            print("  {:<16} {:8.1f} ms {:8.0f} MB/s".format(name, elapsed * 1000, data.nbytes / elapsed / 1e6))
+
+
+def benchmark_open(path):
+    """
+    Measures how many pages per second opening path parses, and the cost
+    of then decoding every tag value, which opening leaves until accessed.
+    Then compares reading the last page after following the chain of IFDs
+    with reading it at its offset in a page index.
+    """
+    def open_file():
+        with tifffile.TiffFile(path) as tif:
+            return len(tif.pages)
+
+    def open_and_decode():
+        with tifffile.TiffFile(path) as tif:
+            for page in tif.pages:
+                for tag in page.tags.values():
+                    tag.value
+
+    pages = open_file()
+    print("{}: {} pages".format(os.path.basename(path), pages))
+    for name, fn in (("open", open_file), ("open and decode", open_and_decode)):
+        elapsed = best_time(fn, repeat=3)
+        print("  {:<18} {:8.1f} ms {:8.0f} pages/s".format(name, elapsed * 1000, pages / elapsed))
+    with tempfile.TemporaryDirectory() as directory:
+        index = header_cache.HeaderCache(directory)
+
+        def last_page(index=None):
+            with tifffile.TiffFile(path, index=index) as tif:
+                return tif.pages[-1].asarray()
+
+        last_page(index)  # store the index
+        for name, fn in (("last page", last_page), ("indexed last page", lambda: last_page(index))):
+            elapsed = best_time(fn, repeat=3)
+            print("  {:<18} {:8.1f} ms".format(name, elapsed * 1000))
+
+
+def stack_pages_copy(pages, memmap=False):
+    """The stack_pages loop before pages were decoded into the stack: copy and flush each page."""
+    data0 = pages[0].asarray()
+    if memmap:
+        with tempfile.NamedTemporaryFile() as fh:
+            data = numpy.memmap(fh, dtype=data0.dtype, shape=(len(pages),) + data0.shape)
+    else:
+        data = numpy.empty((len(pages),) + data0.shape, data0.dtype)
+    data[0] = data0
+    for i, page in enumerate(pages[1:]):
+        data[i+1] = page.asarray()
+        if memmap:
+            data.flush()
+    return data
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_stack(path):
+    """
+    Compares stacking all pages of path, in memory and into a memory map,
+    by copying each decoded page and flushing after it with decoding into
+    the stack and flushing in batches (stack_pages).
+    """
+    with tifffile.TiffFile(path, fastij=False) as tif:
+        pages = tif.pages
+        data = tifffile.stack_pages(pages)
+        print("{}: {} pages, {} {}, {:.0f} MB".format(
+            os.path.basename(path), len(pages), data.shape, data.dtype, data.nbytes / 1e6))
+        del data
+        for memmap in (False, True):
+            for name, stack in (("copy", stack_pages_copy), ("stack_pages", tifffile.stack_pages)):
+                fn = lambda: stack(pages, memmap=memmap)
+                elapsed = best_time(fn, repeat=3)
+                peak = peak_memory(fn)
+                if memmap:
+                    name += " memmap"
+                print("  {:<18} {:8.1f} ms {:8.0f} MB/s {:8.1f} MB peak".format(
+                    name, elapsed * 1000, len(pages) * pages[0].asarray().nbytes / elapsed / 1e6, peak / 1e6))
+
+
+def benchmark_sequence(files):
+    """
+    Compares reading the series of image files matching the glob pattern
+    files serially with reading 2, 4 and 16 files at a time, into memory
+    and into a memory map.
+    """
+    sequence = tifffile.TiffSequence(files)
+    data = sequence.asarray()
+    print("{}: {} files, {} {}".format(files, len(sequence), data.shape, data.dtype))
+    for memmap in (False, True):
+        for workers in (1, 2, 4, 16):
+            name = "{} threads".format(workers) if workers > 1 else "serial"
+            if memmap:
+                name += " memmap"
+            elapsed = best_time(lambda: sequence.asarray(memmap=memmap, maxworkers=workers), repeat=3)
+            print("  {:<18} {:8.1f} ms {:8.0f} files/s".format(name, elapsed * 1000, len(sequence) / elapsed))
+
+
+def benchmark_predictors(shape=(2048, 2048), compress=6):
+    """
+    Compares the compression ratio and write and read throughput of
+    deflate compression without and with the predictors of the writer, on
+    a uint16 image and on the float32 image of it divided by a gain
+    reference, as after flat field correction.
+    """
+    image = make_image(shape)
+    gain = 1 + 0.05 * numpy.random.standard_normal(shape)
+    print("predictors: {} images, deflate level {}".format(shape, compress))
+    for data, predictors in (
+            (image, (None, "horizontal")),
+            ((image / gain).astype(numpy.float32), (None, "float"))):
+        for predictor in predictors:
+            buffer = io.BytesIO()
+
+            def write():
+                buffer.seek(0)
+                buffer.truncate()
+                tifffile.imsave(buffer, data, compress=compress, predictor=predictor)
+
+            def read():
+                buffer.seek(0)
+                return tifffile.imread(buffer)
+
+            write_time = best_time(write, repeat=3)
+            assert numpy.array_equal(read(), data)
+            read_time = best_time(read, repeat=3)
+            print("  {:<18} ratio {:5.2f} write {:6.1f} MB/s read {:6.1f} MB/s".format(
+                "{} {}".format(data.dtype, predictor or "none"), data.nbytes / len(buffer.getvalue()),
+                data.nbytes / write_time / 1e6, data.nbytes / read_time / 1e6))
+
+
+def benchmark_codecs(size=1024 * 1024):
+    """
+    Compares the PackBits and LZW decoders with the loops they replaced and
+    with reading uncompressed data, on a strip of size bytes of a uint16
+    image.
+    """
+    data = make_image((size // 2048, 1024)).tobytes()
+    print("codecs: {:.1f} MB strip".format(len(data) / 1e6))
+    elapsed = best_time(lambda: numpy.frombuffer(data, numpy.uint16).copy())
+    print("  {:<24} {:8.2f} ms {:8.1f} MB/s".format("uncompressed", elapsed * 1000, len(data) / elapsed / 1e6))
+    for name, encode, decoders in (
+            ("packbits", tifffile.encode_packbits, (("loop", decode_packbits_loop), ("joined runs", tifffile.decode_packbits))),
+            ("lzw", tifffile.encode_lzw, (("loop", decode_lzw_loop), ("bulk codes", tifffile.decode_lzw)))):
+        encoded = encode(data)
+        for decoder_name, decode in decoders:
+            assert decode(encoded) == data
+            elapsed = best_time(lambda: decode(encoded), repeat=3)
+            print("  {:<24} {:8.2f} ms {:8.1f} MB/s".format(
+                "{} {}".format(name, decoder_name), elapsed * 1000, len(data) / elapsed / 1e6))
+
+
+def benchmark_compression(path):
+    """
+    Measures the compression ratio and encode and decode throughput of
+    every codec in tifffile.TIFF_CODECS that can encode, on the image data
+    of the first page of path, encoded as one strip.
+    """
+    with tifffile.TiffFile(path) as tif:
+        data = tif.pages[0].asarray()
+    # the (depth, length, width, samples) shape the writer passes to codecs
+    data = numpy.ascontiguousarray(data).reshape((1,) + data.shape[:2] + (-1,))
+    raw = data.tobytes()
+    print("{}: {} {}, {:.1f} MB".format(os.path.basename(path), data.shape[1:3], data.dtype, len(raw) / 1e6))
+    for codec in sorted(tifffile.TIFF_CODECS.values(), key=lambda codec: codec.code):
+        if codec.encode is None:
+            continue
+        for level in (1, 6, 9) if codec.name == "deflate" else (codec.level,):
+            encoded = codec.encode(data, level)
+            assert codec.decode(encoded) == raw
+            repeat = 3 if codec.releases_gil else 1
+            encode_time = best_time(lambda: codec.encode(data, level), repeat=repeat)
+            decode_time = best_time(lambda: codec.decode(encoded), repeat=repeat)
+            name = codec.name if level is None else "{} {}".format(codec.name, level)
+            print("  {:<18} ratio {:5.2f} encode {:7.1f} MB/s decode {:7.1f} MB/s{}".format(
+                name, len(raw) / len(encoded), len(raw) / encode_time / 1e6, len(raw) / decode_time / 1e6,
+                "" if codec.releases_gil else "  holds the GIL"))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "--codecs":
+        for path in argv[1:]:
+            benchmark_compression(path)
+        return
+    if argv:
+        for path in argv:
+            benchmark_open(path)
+            benchmark_decode(path)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "deflate_tiled.tif")
+        tifffile.imsave(path, make_image(), compress=6, tile=(256, 256))
+        benchmark_decode(path)
+        path = os.path.join(directory, "codecs.tif")
+        tifffile.imsave(path, make_image((1024, 1024)))
+        benchmark_compression(path)
+        # compressed pages are not contiguous, so every IFD is parsed
+        path = os.path.join(directory, "many_pages.tif")
+        tifffile.imsave(path, numpy.zeros((20000, 8, 8), numpy.uint16), compress=1)
+        benchmark_open(path)
+        path = os.path.join(directory, "stack.tif")
+        with tifffile.TiffWriter(path) as tif:
+            for image in make_image((64 * 1024, 1024)).reshape(64, 1024, 1024):
+                tif.save(image)
+        benchmark_stack(path)
+        image = make_image((256, 256))
+        for t in range(1000):
+            tifffile.imsave(os.path.join(directory, "series_t{:04d}.tif".format(t)), image, compress=6)
+        benchmark_sequence(os.path.join(directory, "series_t*.tif"))
+    benchmark_predictors()
+    benchmark_codecs()
+
+
+if __name__ == "__main__":
+    main()
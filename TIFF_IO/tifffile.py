@@ -263,6 +263,8 @@ import warnings
 import tempfile
 import datetime
 import collections
+import collections.abc
+import concurrent.futures
 from fractions import Fraction
 from xml.etree import cElementTree as etree
 
@@ -276,6 +278,11 @@ except ImportError:
     except ImportError:
         lzma = None
 
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+
 try:
     if __package__:
         from . import _tifffile
@@ -442,7 +449,7 @@ class TiffWriter(object):
         self._fh.write(struct.pack(byteorder+self._offset_format, 0))
 
     def save(self, data, photometric=None, planarconfig=None, tile=None,
-             contiguous=True, compress=0, colormap=None,
+             contiguous=True, compress=0, predictor=None, colormap=None,
              description=None, datetime=None, resolution=None,
              metadata={}, extratags=()):
         """Write image data and tags to TIFF file.
@@ -484,12 +491,21 @@ class TiffWriter(object):
             previous ones, if any, the data are stored contiguously after
             the previous one. Parameters 'photometric' and 'planarconfig' are
             ignored.
-        compress : int or 'lzma'
+        compress : int, str, or (str, int)
             Values from 0 to 9 controlling the level of zlib compression.
             If 0, data are written uncompressed (default).
             Compression cannot be used to write contiguous files.
-            If 'lzma', LZMA compression is used, which is not available on
+            Else the name of a codec in TIFF_CODECS, such as 'deflate',
+            'lzma', 'bz2', 'packbits', or 'lzw', optionally with a
+            compression level from 0 to 9. Not all codecs are available on
             all platforms.
+        predictor : {None, 'horizontal', 'float'}
+            The prediction applied to image data before compression.
+            'horizontal' stores the difference of each integer sample to the
+            sample to its left, 'float' the horizontal byte differences of
+            floating point samples (not for tiles).
+            Usually improves compression of images with smooth variations.
+            Can only be used with compression.
         colormap : numpy.ndarray
             RGB color values for the corresponding data value.
             Must be of shape (3, 2**(data.itemsize*8)) and dtype uint16.
@@ -573,17 +589,57 @@ class TiffWriter(object):
         if not compress:
             compress = False
             compress_tag = 1
-        elif compress == 'lzma':
-            compress = lzma.compress
-            compress_tag = 34925
-            if self._imagej:
-                raise ValueError("ImageJ can not handle LZMA compression")
-        elif not 0 <= compress <= 9:
-            raise ValueError("invalid compression level %s" % compress)
-        elif compress:
-            def compress(data, level=compress):
-                return zlib.compress(data, level)
-            compress_tag = 32946
+        else:
+            if isinstance(compress, basestring):
+                name, level = compress, None
+            elif isinstance(compress, (tuple, list)):
+                name, level = compress
+            else:
+                name, level = 'deflate', compress
+            if level is not None and (
+                    isinstance(level, bool) or
+                    not isinstance(level, (int, numpy.integer)) or
+                    not 0 <= level <= 9):
+                raise ValueError("invalid compression level %s" % level)
+            codec = TIFF_CODECS.get(name)
+            if codec is None or codec.encode is None:
+                raise ValueError("cannot compress %s" % name)
+            if self._imagej and name not in ('deflate', 'adobe_deflate',
+                                             'packbits', 'lzw'):
+                raise ValueError("ImageJ can not handle %s compression" %
+                                 name)
+            if level is None:
+                level = codec.level
+
+            def compress(data, encode=codec.encode, level=level):
+                return encode(data, level)
+            compress_tag = codec.code
+
+        # prepare prediction
+        if not predictor:
+            predictor = False
+        elif predictor not in ('horizontal', 'float'):
+            raise ValueError("invalid predictor %s" % predictor)
+        elif not compress:
+            raise ValueError("predictor requires compression")
+        elif predictor == 'horizontal':
+            if data.dtype.kind not in 'iu':
+                raise ValueError("horizontal predictor requires integer data")
+
+            def predictor(data):
+                result = data.copy()
+                numpy.subtract(data[..., 1:, :], data[..., :-1, :],
+                               out=result[..., 1:, :])
+                return result
+            predictor_tag = 2
+        else:
+            if data.dtype.kind != 'f':
+                raise ValueError("float predictor requires floating point "
+                                 "data")
+            if tile:
+                raise ValueError("float predictor not supported for tiles")
+            predictor = encode_floats
+            predictor_tag = 3
 
         # prepare ImageJ format
         if self._imagej:
@@ -826,6 +882,8 @@ class TiffWriter(object):
         addtag('datetime', 's', 0, datetime.strftime("%Y:%m:%d %H:%M:%S"),
                writeonce=True)
         addtag('compression', 'H', 1, compress_tag)
+        if predictor:
+            addtag('predictor', 'H', 1, predictor_tag)
         addtag('image_width', 'I', 1, shape[-2])
         addtag('image_length', 'I', 1, shape[-3])
         if tile:
@@ -951,7 +1009,8 @@ class TiffWriter(object):
                                     ty*tile[1]:ty*tile[1]+c1,
                                     tx*tile[2]:tx*tile[2]+c2]
                                 if compress:
-                                    t = compress(chunk)
+                                    t = compress(predictor(chunk) if predictor
+                                                 else chunk)
                                     strip_byte_counts.append(len(t))
                                     fh.write(t)
                                 else:
@@ -959,6 +1018,8 @@ class TiffWriter(object):
                                     fh.flush()
             elif compress:
                 for plane in data[pageindex]:
+                    if predictor:
+                        plane = predictor(plane)
                     plane = compress(plane)
                     strip_byte_counts.append(len(plane))
                     fh.write(plane)
@@ -1227,7 +1288,7 @@ class TiffFile(object):
     """
     def __init__(self, arg, name=None, offset=None, size=None,
                  multifile=True, multifile_close=True, maxpages=None,
-                 fastij=True, is_ome=None):
+                 fastij=True, is_ome=None, cache=None, index=None):
         """Initialize instance from file.
 
         Parameters
@@ -1254,10 +1315,20 @@ class TiffFile(object):
             Number of pages to read (default: no limit).
         fastij : bool
             If True (default), try to use only the metadata from the first page
-            of ImageJ files. Significantly speeds up loading movies with
-            thousands of pages.
+            of ImageJ files and of uncompressed files written by TiffWriter.
+            Significantly speeds up loading movies with thousands of pages.
         is_ome : bool
             If False, disable processing of OME-XML metadata.
+        cache : object
+            Optional cache of parsed page records for files opened by name,
+            with a 'get(path, parse, key)' method that returns the result
+            of 'parse()', or its stored value if the file is unchanged.
+        index : object
+            Optional cache, like 'cache', of a TiffPageIndex of files opened
+            by name. Instead of following the chain of IFDs, only the first
+            page is read on opening and other pages are read from the
+            offsets in the index when first accessed. Used instead of
+            'cache' if both are given.
 
         """
         if is_ome is False:
@@ -1271,7 +1342,12 @@ class TiffFile(object):
         self._multifile_close = bool(multifile_close)
         self._files = {self._fh.name: self}  # cache of TiffFiles
         try:
-            self._fromfile(maxpages, fastij)
+            if index is not None and isinstance(arg, basestring):
+                self._fromindex(index, maxpages, fastij)
+            elif cache is not None and isinstance(arg, basestring):
+                self._fromcache(cache, maxpages, fastij)
+            else:
+                self._fromfile(maxpages, fastij)
         except Exception:
             self._fh.close()
             raise
@@ -1294,24 +1370,7 @@ class TiffFile(object):
 
     def _fromfile(self, maxpages=None, fastij=True):
         """Read TIFF header and all page records from file."""
-        self._fh.seek(0)
-        try:
-            self.byteorder = {b'II': '<', b'MM': '>'}[self._fh.read(2)]
-        except KeyError:
-            raise ValueError("invalid TIFF file")
-        self._is_native = self.byteorder == {'big': '>',
-                                             'little': '<'}[sys.byteorder]
-        version = struct.unpack(self.byteorder+'H', self._fh.read(2))[0]
-        if version == 43:
-            # BigTiff
-            self.offset_size, zero = struct.unpack(self.byteorder+'HH',
-                                                   self._fh.read(4))
-            if zero or self.offset_size != 8:
-                raise ValueError("invalid BigTIFF file")
-        elif version == 42:
-            self.offset_size = 4
-        else:
-            raise ValueError("not a TIFF file")
+        self._fromheader()
         self.pages = []
         while True:
             try:
@@ -1322,8 +1381,8 @@ class TiffFile(object):
             if maxpages and len(self.pages) > maxpages:
                 break
             if fastij:
-                if page._patch_imagej():
-                    break  # only read the first page of ImageJ files
+                if page._patch_imagej() or page._patch_shaped():
+                    break  # only read the first page of contiguous files
                 fastij = False
 
         if not self.pages:
@@ -1337,6 +1396,78 @@ class TiffFile(object):
             self._fix_lsm_strip_offsets()
             self._fix_lsm_strip_byte_counts()
 
+    def _fromheader(self):
+        """Read TIFF header from file. Leave cursor at offset to first IFD."""
+        self._fh.seek(0)
+        try:
+            self.byteorder = {b'II': '<', b'MM': '>'}[self._fh.read(2)]
+        except KeyError:
+            raise ValueError("invalid TIFF file")
+        self._is_native = self.byteorder == {'big': '>',
+                                             'little': '<'}[sys.byteorder]
+        version = struct.unpack(self.byteorder+'H', self._fh.read(2))[0]
+        if version == 43:
+            # BigTiff
+            self.offset_size, zero = struct.unpack(self.byteorder+'HH',
+                                                   self._fh.read(4))
+            if zero or self.offset_size != 8:
+                raise ValueError("invalid BigTIFF file")
+        elif version == 42:
+            self.offset_size = 4
+        else:
+            raise ValueError("not a TIFF file")
+
+    def _fromcache(self, cache, maxpages=None, fastij=True):
+        """Read page records from cache, or from file and store in cache.
+
+        The pages are stored without their parent, which is restored here.
+
+        """
+        def parse():
+            self._fromfile(maxpages, fastij)
+            state = dict((name, getattr(self, name)) for name in (
+                'byteorder', '_is_native', 'offset_size',
+                'micromanager_metadata') if name in self.__dict__)
+            pages = []
+            for page in self.pages:
+                page_state = page.__dict__.copy()
+                del page_state['parent']
+                pages.append(page_state)
+            return state, pages
+
+        key = ('TiffFile', self._fh._offset, self._fh.size, maxpages, fastij,
+               self.__dict__.get('is_ome'))
+        state, pages = cache.get(self._fh.path, parse, key)
+        if self.pages:
+            return  # parsed from file
+        self.__dict__.update(state)
+        for page_state in pages:
+            page = TiffPage.__new__(TiffPage)
+            page.__dict__.update(page_state)
+            page.parent = self
+            self.pages.append(page)
+
+    def _fromindex(self, index, maxpages=None, fastij=True):
+        """Read TIFF header and first page record from file, locate others.
+
+        The page index is read from index, or built from all page records
+        read from file and stored in index.
+
+        """
+        def parse():
+            self._fromfile(maxpages, fastij)
+            return TiffPageIndex(self.pages)
+
+        key = ('TiffPageIndex', self._fh._offset, self._fh.size, maxpages,
+               fastij, self.__dict__.get('is_ome'))
+        page_index = index.get(self._fh.path, parse, key)
+        if self.pages:
+            return  # parsed from file
+        self._fromheader()
+        self.pages = TiffPages(self, page_index, fastij)
+        if self.is_micromanager:
+            self.micromanager_metadata = read_micromanager_metadata(self._fh)
+
     def _fix_lsm_strip_offsets(self):
         """Unwrap strip offsets for LSM files greater than 4 GB."""
         # each series and position require separate unwrapping (undocumented)
@@ -1382,7 +1513,8 @@ class TiffFile(object):
                 page.strip_byte_counts = tuple(
                     strips[offset] for offset in page.strip_offsets)
 
-    def asarray(self, key=None, series=None, memmap=False, tempdir=None):
+    def asarray(self, key=None, series=None, memmap=False, tempdir=None,
+                region=None):
         """Return image data from multiple TIFF pages as numpy array.
 
         By default the first image series is returned.
@@ -1399,6 +1531,9 @@ class TiffFile(object):
             file is created.
         tempdir : str
             The directory where the memory-mapped file will be created.
+        region : tuple of int
+            Rows y0 to y1 and columns x0 to x1 of each page to return,
+            (y0, y1, x0, x1). See TiffPage.asarray.
 
         """
         if key is None and series is None:
@@ -1418,7 +1553,7 @@ class TiffFile(object):
             pages = [pages[key]]
         elif isinstance(key, slice):
             pages = pages[key]
-        elif isinstance(key, collections.Iterable):
+        elif isinstance(key, collections.abc.Iterable):
             pages = [pages[k] for k in key]
         else:
             raise TypeError("key must be an int, slice, or sequence")
@@ -1426,28 +1561,38 @@ class TiffFile(object):
         if not len(pages):
             raise ValueError("no pages selected")
 
+        page0 = next(p for p in pages if p)
+        series_shape = series.shape if series else None
+        page_shape = page0.shape
+        if region is not None:
+            region = page0._region(region)
+            if series:
+                series_shape = region_shape(series_shape, series.axes, region)
+            page_shape = region_shape(page_shape, page0.axes, region)
+
         if self.is_nih:
             if pages[0].is_indexed:
-                result = stack_pages(pages, colormapped=False, squeeze=False)
+                result = stack_pages(pages, colormapped=False, squeeze=False,
+                                     region=region)
                 result = apply_colormap(result, pages[0].color_map)
             else:
                 result = stack_pages(pages, memmap=memmap, tempdir=tempdir,
-                                     colormapped=False, squeeze=False)
+                                     colormapped=False, squeeze=False,
+                                     region=region)
         elif len(pages) == 1:
-            result = pages[0].asarray(memmap=memmap)
+            result = pages[0].asarray(memmap=memmap, region=region)
         elif self.is_ome:
             assert not self.is_indexed, "color mapping disabled for ome-tiff"
             if any(p is None for p in pages):
                 # zero out missing pages
-                firstpage = next(p for p in pages if p)
                 nopage = numpy.zeros_like(
-                    firstpage.asarray(memmap=False))
+                    page0.asarray(memmap=False, region=region))
             if memmap:
                 with tempfile.NamedTemporaryFile() as fh:
-                    result = numpy.memmap(fh, series.dtype, shape=series.shape)
+                    result = numpy.memmap(fh, series.dtype, shape=series_shape)
                     result = result.reshape(-1)
             else:
-                result = numpy.empty(series.shape, series.dtype).reshape(-1)
+                result = numpy.empty(series_shape, series.dtype).reshape(-1)
             index = 0
 
             class KeepOpen:
@@ -1473,7 +1618,7 @@ class TiffFile(object):
                 keep.open(page)
                 if page:
                     a = page.asarray(memmap=False, colormapped=False,
-                                     reopen=False)
+                                     reopen=False, region=region)
                 else:
                     a = nopage
                 try:
@@ -1483,7 +1628,7 @@ class TiffFile(object):
                     break
                 index += a.size
             keep.close()
-        elif key is None and series and series.offset:
+        elif key is None and series and series.offset and region is None:
             if memmap:
                 result = self.filehandle.memmap_array(
                     series.dtype, series.shape, series.offset)
@@ -1492,24 +1637,25 @@ class TiffFile(object):
                 result = self.filehandle.read_array(
                     series.dtype, product(series.shape))
         else:
-            result = stack_pages(pages, memmap=memmap, tempdir=tempdir)
+            result = stack_pages(pages, memmap=memmap, tempdir=tempdir,
+                                 region=region)
 
         if key is None:
             try:
-                result.shape = series.shape
+                result.shape = series_shape
             except ValueError:
                 try:
                     warnings.warn("failed to reshape %s to %s" % (
-                        result.shape, series.shape))
+                        result.shape, series_shape))
                     # try series of expected shapes
-                    result.shape = (-1,) + series.shape
+                    result.shape = (-1,) + series_shape
                 except ValueError:
                     # revert to generic shape
-                    result.shape = (-1,) + pages[0].shape
+                    result.shape = (-1,) + page_shape
         elif len(pages) == 1:
-            result.shape = pages[0].shape
+            result.shape = page_shape
         else:
-            result.shape = (-1,) + pages[0].shape
+            result.shape = (-1,) + page_shape
         return result
 
     @lazyattr
@@ -1947,24 +2093,30 @@ class TiffPage(object):
     5. contig samples_per_pixel.
 
     """
-    def __init__(self, parent):
-        """Initialize instance from file."""
+    def __init__(self, parent, index=None, offset=None):
+        """Initialize instance from file.
+
+        By default the page follows the pages of parent read so far.
+        Else index is the index of the page in file and offset the position
+        of its IFD.
+
+        """
         self.parent = parent
-        self.index = len(parent.pages)
+        self.index = len(parent.pages) if index is None else index
         self.shape = self._shape = ()
         self.dtype = self._dtype = None
         self.axes = ""
         self.tags = TiffTags()
         self._offset = 0
 
-        self._fromfile()
+        self._fromfile(offset)
         self._process_tags()
 
-    def _fromfile(self):
+    def _fromfile(self, offset=None):
         """Read TIFF IFD structure and its tags from file.
 
-        File cursor must be at storage position of IFD offset and is left at
-        offset to next IFD.
+        Unless the offset of the IFD is given, file cursor must be at storage
+        position of IFD offset. Cursor is left at offset to next IFD.
 
         Raises StopIteration if offset (first bytes read) is 0
         or a corrupted page list is encountered.
@@ -1975,8 +2127,9 @@ class TiffPage(object):
         offset_size = self.parent.offset_size
 
         # read offset to this IFD
-        fmt = {4: 'I', 8: 'Q'}[offset_size]
-        offset = struct.unpack(byteorder + fmt, fh.read(offset_size))[0]
+        if offset is None:
+            fmt = {4: 'I', 8: 'Q'}[offset_size]
+            offset = struct.unpack(byteorder + fmt, fh.read(offset_size))[0]
         if not offset:
             raise StopIteration()
         if offset >= fh.size:
@@ -1988,18 +2141,31 @@ class TiffPage(object):
         tags = self.tags
         fh.seek(offset)
         fmt, size = {4: ('H', 2), 8: ('Q', 8)}[offset_size]
+        # read the number of tags and, usually, all tag structures at once
+        entry_dtype = TIFF_IFD_ENTRY_DTYPES[byteorder, offset_size]
+        data = fh.read(size + 32 * entry_dtype.itemsize)
         try:
-            numtags = struct.unpack(byteorder + fmt, fh.read(size))[0]
+            numtags = struct.unpack(byteorder + fmt, data[:size])[0]
             if numtags > 4096:
                 raise ValueError("suspicious number of tags")
         except Exception:
             warnings.warn("corrupted page list at offset %i" % offset)
             raise StopIteration()
+        end = size + numtags * entry_dtype.itemsize
+        if len(data) < end:
+            data += fh.read(end - len(data))
+            if len(data) < end:
+                warnings.warn("corrupted tag list at offset %i" % offset)
+                numtags = (len(data) - size) // entry_dtype.itemsize
+                end = size + numtags * entry_dtype.itemsize
+        fh.seek(offset + end)
+        entries = numpy.frombuffer(data[size:end], entry_dtype).tolist()
 
         tagcode = 0
-        for _ in range(numtags):
+        for index, entry in enumerate(entries):
             try:
-                tag = TiffTag(self.parent)
+                tag = TiffTag._fromentry(self.parent, entry, offset + size +
+                                         index * entry_dtype.itemsize)
             except TiffTag.Error as e:
                 warnings.warn(str(e))
                 continue
@@ -2019,7 +2185,7 @@ class TiffPage(object):
                         tags[name] = tag
                         break
 
-        pos = fh.tell()  # where offset to next IFD can be found
+        pos = offset + end  # where offset to next IFD can be found
 
         if self.is_lsm or (self.index and self.parent.is_lsm):
             # correct non standard LSM bitspersample tags
@@ -2056,22 +2222,20 @@ class TiffPage(object):
 
         """
         tags = self.tags
-        for code, (name, default, dtype, count, validate) in TIFF_TAGS.items():
+        for name, validate in TIFF_TAGS_VALIDATE.items():
             if name in tags:
-                #tags[name] = TiffTag(code, dtype=dtype, count=count,
-                #                     value=default, name=name)
-                if validate:
-                    try:
-                        if tags[name].count == 1:
-                            setattr(self, name, validate[tags[name].value])
-                        else:
-                            setattr(self, name, tuple(
-                                validate[value] for value in tags[name].value))
-                    except KeyError:
-                        raise ValueError("%s.value (%s) not supported" %
-                                         (name, tags[name].value))
-            elif default is not None:
-                setattr(self, name, validate[default] if validate else default)
+                try:
+                    if tags[name].count == 1:
+                        setattr(self, name, validate[tags[name].value])
+                    else:
+                        setattr(self, name, tuple(
+                            validate[value] for value in tags[name].value))
+                except KeyError:
+                    raise ValueError("%s.value (%s) not supported" %
+                                     (name, tags[name].value))
+        for name, default in TIFF_TAGS_DEFAULT.items():
+            if name not in tags:
+                setattr(self, name, default)
 
         if 'bits_per_sample' in tags:
             tag = tags['bits_per_sample']
@@ -2312,9 +2476,62 @@ class TiffPage(object):
         self.axes = 'I' + self.axes
         return True
 
+    def _patch_shaped(self):
+        """Return if tifffile shaped data are contiguous and adjust page attributes.
+
+        Patch 'strip_offsets' and 'strip_byte_counts' tags to span the
+        data of all pages described by the shape in the image_description.
+
+        TiffWriter stores uncompressed data of all pages contiguously after
+        the first page record, like ImageJ. No need to read other pages.
+
+        """
+        if (not self.is_shaped or not self.is_contiguous or
+                self.is_indexed or self.parent.is_ome):
+            return
+        try:
+            shape = image_description_dict(self.is_shaped)['shape']
+            size = product(shape)
+        except Exception:
+            return
+        page_size = product(self.shape)
+        if not page_size or size % page_size:
+            return
+        images = size // page_size
+        if images <= 1:
+            return
+        offset, count = self.is_contiguous
+        fh = self.parent.filehandle
+        if (count != page_size * self.bits_per_sample // 8 or
+                offset + count*images > fh.size):
+            return
+
+        # check that next page is stored after data
+        byteorder = self.parent.byteorder
+        offset_size = self.parent.offset_size
+        pos = fh.tell()
+        fmt = {4: 'I', 8: 'Q'}[offset_size]
+        nextpage = struct.unpack(byteorder + fmt, fh.read(offset_size))[0]
+        fh.seek(pos)
+        if nextpage and offset + count*images > nextpage:
+            return
+
+        # patch metadata
+        pre = 'tile' if self.is_tiled else 'strip'
+        self.tags[pre+'_offsets'].value = (offset,)
+        self.tags[pre+'_byte_counts'].value = (count * images,)
+        setattr(self, pre+'_offsets', (offset,))
+        setattr(self, pre+'_byte_counts', (count * images,))
+        self.is_contiguous = (offset, count * images)
+        self.shape = (images,) + self.shape
+        self._shape = (images,) + self._shape[1:]
+        self.axes = 'I' + self.axes
+        return True
+
     def asarray(self, squeeze=True, colormapped=True, rgbonly=False,
                 scale_mdgel=False, memmap=False, reopen=True,
-                maxsize=64*1024*1024*1024):
+                maxsize=64*1024*1024*1024, maxworkers=1, region=None,
+                out=None):
         """Read image data from file and return as numpy array.
 
         Raise ValueError if format is unsupported.
@@ -2342,6 +2559,21 @@ class TiffPage(object):
         maxsize: int or None
             Maximum size of data before a ValueError is raised.
             Can be used to catch DOS. Default: 64 GB.
+        maxworkers : int
+            Maximum number of threads to decompress strips or tiles with.
+            Strips and tiles are still read from the file one at a time.
+            Codecs that do not release the GIL always decompress serially.
+            Default: 1, decompress serially.
+        region : tuple of int
+            Rows y0 to y1 and columns x0 to x1 to return, (y0, y1, x0, x1),
+            with the same meaning as slice(y0, y1) and slice(x0, x1).
+            Only the strips or tiles intersecting the region are read.
+            Raise ValueError if the region is empty.
+        out : numpy.ndarray
+            Array of the size and data type of the returned array to store
+            the image data in, which is then returned. Uncompressed data,
+            strips, and tiles spanning the image are decoded directly into
+            a C contiguous 'out', else the result is copied into it.
 
         """
         if not self._shape:
@@ -2382,6 +2614,26 @@ class TiffPage(object):
 
         byte_counts, offsets = self._byte_counts_offsets
 
+        if region is not None:
+            region = self._region(region)
+            y0, y1, x0, x1 = region
+        else:
+            y0, y1, x0, x1 = 0, image_length, 0, image_width
+        # rows and columns of the image held in result before cropping
+        wy0, wy1, wx0, wx1 = 0, image_length, 0, image_width
+
+        # decode into out if it is the result as decoded
+        if (out is not None and region is None and out.flags.c_contiguous and
+                out.dtype == numpy.dtype('=' + dtype) and
+                out.size == product(shape) and
+                self.predictor != 'float' and
+                not (colormapped and self.is_indexed) and
+                not (rgbonly and self.is_rgb and 'extra_samples' in self.tags)
+                and not (scale_mdgel and self.parent.is_mdgel)):
+            buffer = out.reshape(-1)
+        else:
+            buffer = None
+
         if self.is_tiled:
             tile_width = self.tile_width
             tile_length = self.tile_length
@@ -2398,6 +2650,27 @@ class TiffPage(object):
 
         if memmap and self._is_memmappable(rgbonly, colormapped):
             result = fh.memmap_array(typecode, shape, offset=offsets[0])
+        elif self.is_contiguous and region is not None:
+            # read the rows of the region in each plane
+            wy0, wy1 = y0, y1
+            planes = product(shape[:3])
+            rowsize = product(shape[-2:])
+            itemsize = numpy.dtype(typecode).itemsize
+            result = numpy.empty((planes, (wy1-wy0) * rowsize), '=' + dtype)
+            for i in range(planes):
+                fh.seek(offsets[0] + (i*shape[3] + wy0) * rowsize * itemsize)
+                result[i] = fh.read_array(typecode, (wy1-wy0) * rowsize)
+            if lsb2msb:
+                reverse_bitorder(result)
+        elif self.is_contiguous and buffer is not None:
+            fh.seek(offsets[0])
+            result = buffer
+            if fh.read_into(result) != result.nbytes:
+                raise IOError("image data is truncated")
+            if not self.parent._is_native:
+                result.byteswap(True)
+            if lsb2msb:
+                reverse_bitorder(result)
         elif self.is_contiguous:
             fh.seek(offsets[0])
             result = fh.read_array(typecode, product(shape))
@@ -2417,13 +2690,13 @@ class TiffPage(object):
                         # needs the raw byte order
                         typecode = dtype
                     try:
-                        return numpy.fromstring(x, typecode)
+                        return numpy.frombuffer(x, typecode)
                     except ValueError as e:
                         # strips may be missing EOI
                         warnings.warn("unpack: %s" % e)
                         xlen = ((len(x) // (bits_per_sample // 8)) *
                                 (bits_per_sample // 8))
-                        return numpy.fromstring(x[:xlen], typecode)
+                        return numpy.frombuffer(x[:xlen], typecode)
 
             elif isinstance(bits_per_sample, tuple):
                 def unpack(x):
@@ -2433,22 +2706,43 @@ class TiffPage(object):
                     return unpack_ints(x, typecode, bits_per_sample, runlen)
 
             decompress = TIFF_DECOMPESSORS[self.compression]
+            codec = TIFF_CODECS.get(self.compression)
+            if codec is not None and not codec.releases_gil:
+                # threads only add overhead to decoders holding the GIL
+                maxworkers = 1
             if self.compression == 'jpeg':
                 table = self.jpeg_tables if 'jpeg_tables' in self.tags else b''
 
                 def decompress(x):
                     return decode_jpeg(x, table, self.photometric)
 
+            def chunks(indices):
+                # read in file order; only decoding is done on threads
+                for i in indices:
+                    fh.seek(offsets[i])
+                    yield fh.read(byte_counts[i])
+
+            def decode(data):
+                if lsb2msb:
+                    data = reverse_bitorder(data)
+                return unpack(decompress(data))
+
             if self.is_tiled:
-                result = numpy.empty(shape, dtype)
-                tw, tl, td, pl = 0, 0, 0, 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    tile = fh.read(bytecount)
-                    if lsb2msb:
-                        tile = reverse_bitorder(tile)
-                    tile = decompress(tile)
-                    tile = unpack(tile)
+                # the region grown to whole tiles
+                wy0 = y0 - y0 % tile_length
+                wx0 = x0 - x0 % tile_width
+                wy1 = min(y1 + -y1 % tile_length, image_length)
+                wx1 = min(x1 + -x1 % tile_width, image_width)
+                result_shape = shape[:3] + (
+                    (wy1-wy0) + -(wy1-wy0) % tile_length,
+                    (wx1-wx0) + -(wx1-wx0) % tile_width, shape[-1])
+                if buffer is not None and result_shape == self._shape:
+                    result = buffer.reshape(result_shape)
+                else:
+                    result = numpy.empty(result_shape, dtype)
+
+                def decode_tile(tile, pl, td, tl, tw):
+                    tile = decode(tile)
                     try:
                         tile.shape = tile_shape
                     except ValueError:
@@ -2458,41 +2752,116 @@ class TiffPage(object):
                         s = min(tile.size, t.size)
                         t[:s] = tile[:s]
                         tile = t.reshape(tile_shape)
+                    out = result[0, pl, td:td+tile_depth,
+                                 tl:tl+tile_length, tw:tw+tile_width, :]
                     if self.predictor == 'horizontal':
-                        numpy.cumsum(tile, axis=-2, dtype=dtype, out=tile)
+                        numpy.cumsum(tile, axis=-2, dtype=dtype, out=out)
                     elif self.predictor == 'float':
                         raise NotImplementedError()
-                    result[0, pl, td:td+tile_depth,
-                           tl:tl+tile_length, tw:tw+tile_width, :] = tile
-                    del tile
-                    tw += tile_width
-                    if tw >= shape[4]:
-                        tw, tl = 0, tl + tile_length
-                        if tl >= shape[3]:
-                            tl, td = 0, td + tile_depth
-                            if td >= shape[2]:
-                                td, pl = 0, pl + 1
+                    else:
+                        out[:] = tile
+
+                def positions():
+                    tw, tl, td, pl = 0, 0, 0, 0
+                    while True:
+                        yield pl, td, tl, tw
+                        tw += tile_width
+                        if tw >= shape[4]:
+                            tw, tl = 0, tl + tile_length
+                            if tl >= shape[3]:
+                                tl, td = 0, td + tile_depth
+                                if td >= shape[2]:
+                                    td, pl = 0, pl + 1
+
+                selected = [
+                    (i, (pl, td, tl - wy0, tw - wx0))
+                    for i, (pl, td, tl, tw) in zip(range(len(offsets)),
+                                                   positions())
+                    if wy0 <= tl < wy1 and wx0 <= tw < wx1]
+                tasks = ((tile,) + position for tile, (i, position) in
+                         zip(chunks(i for i, _ in selected), selected))
+                if maxworkers > 1:
+                    run_threaded(decode_tile, tasks, maxworkers)
+                else:
+                    for task in tasks:
+                        decode_tile(*task)
                 result = result[...,
-                                :image_depth, :image_length, :image_width, :]
+                                :image_depth, :wy1-wy0, :wx1-wx0, :]
+            elif region is not None and image_depth == 1:
+                # the region grown to whole strips of full rows
+                rows_per_strip = self.rows_per_strip
+                wy0 = y0 - y0 % rows_per_strip
+                wy1 = min(y1 + -y1 % rows_per_strip, image_length)
+                strips_per_plane = ((image_length + rows_per_strip - 1) //
+                                    rows_per_strip)
+                rowsize = product(shape[-2:])
+                result = numpy.empty(
+                    shape[:3] + (wy1-wy0,) + shape[-2:], dtype).reshape(-1)
+
+                def decode_strip(strip, index, size):
+                    strip = decode(strip)
+                    size = min(strip.size, size)
+                    result[index:index+size] = strip[:size]
+
+                def placements():
+                    for i in range(len(offsets)):
+                        plane, row = divmod(i, strips_per_plane)
+                        row *= rows_per_strip
+                        if wy0 <= row < wy1:
+                            index = (plane*(wy1-wy0) + row - wy0) * rowsize
+                            size = (min(row + rows_per_strip, wy1) -
+                                    row) * rowsize
+                            yield i, index, size
+
+                selected = list(placements())
+                tasks = ((strip, index, size) for strip, (i, index, size) in
+                         zip(chunks(i for i, _, _ in selected), selected))
+                if maxworkers > 1:
+                    run_threaded(decode_strip, tasks, maxworkers)
+                else:
+                    for task in tasks:
+                        decode_strip(*task)
             else:
                 strip_size = (self.rows_per_strip * self.image_width *
                               self.samples_per_pixel)
-                result = numpy.empty(shape, dtype).reshape(-1)
-                index = 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    strip = fh.read(bytecount)
-                    if lsb2msb:
-                        strip = reverse_bitorder(strip)
-                    strip = decompress(strip)
-                    strip = unpack(strip)
-                    size = min(result.size, strip.size, strip_size,
+                if buffer is not None:
+                    result = buffer
+                else:
+                    result = numpy.empty(shape, dtype).reshape(-1)
+
+                def decode_strip(strip, index, size=strip_size):
+                    strip = decode(strip)
+                    size = min(result.size, strip.size, size,
                                result.size - index)
                     result[index:index+size] = strip[:size]
-                    del strip
-                    index += size
+                    return size
+
+                if maxworkers > 1:
+                    # strips are placed by plane and row, which differs from
+                    # the serial placement only for short, corrupted strips
+                    rows_per_strip = min(self.rows_per_strip, image_length)
+                    strips_per_plane = ((image_length + rows_per_strip - 1) //
+                                        rows_per_strip)
+                    rowsize = product(shape[-2:])
+
+                    def placements():
+                        strips = chunks(range(len(offsets)))
+                        for i, strip in enumerate(strips):
+                            plane, row = divmod(i, strips_per_plane)
+                            row *= rows_per_strip
+                            index = (plane*image_length + row) * rowsize
+                            size = (min(row + rows_per_strip, image_length) -
+                                    row) * rowsize
+                            yield strip, min(index, result.size), size
+
+                    tasks = placements()
+                    run_threaded(decode_strip, tasks, maxworkers)
+                else:
+                    index = 0
+                    for strip in chunks(range(len(offsets))):
+                        index += decode_strip(strip, index)
 
-        result.shape = self._shape
+        result.shape = self._shape[:3] + (wy1-wy0, wx1-wx0) + self._shape[5:]
 
         if self.predictor and not (self.is_tiled and not self.is_contiguous):
             if self.parent.is_lsm and not self.compression:
@@ -2501,6 +2870,10 @@ class TiffPage(object):
                 numpy.cumsum(result, axis=-2, dtype=dtype, out=result)
             elif self.predictor == 'float':
                 result = decode_floats(result)
+        if region is not None:
+            result = result[..., y0-wy0:y1-wy0, x0-wx0:x1-wx0, :]
+            if not isinstance(result, numpy.memmap):
+                result = numpy.ascontiguousarray(result)
         if colormapped and self.is_indexed:
             if self.color_map.shape[1] >= 2**bits_per_sample:
                 # FluoView and LSM might fail here
@@ -2525,11 +2898,14 @@ class TiffPage(object):
                     result = result[:, :3]
 
         if squeeze:
+            shape = self.shape
+            if region is not None:
+                shape = region_shape(shape, self.axes, region)
             try:
-                result.shape = self.shape
+                result.shape = shape
             except ValueError:
                 warnings.warn("failed to reshape from %s to %s" % (
-                    str(result.shape), str(self.shape)))
+                    str(result.shape), str(shape)))
 
         if scale_mdgel and self.parent.is_mdgel:
             # MD Gel stores private metadata in the second page
@@ -2542,11 +2918,25 @@ class TiffPage(object):
                     result **= 2  # squary root data format
                 result *= scale
 
+        if out is not None:
+            if not numpy.may_share_memory(result, out):
+                out[...] = result.reshape(out.shape)
+            result = out
+
         if closed:
             # TODO: file should remain open if an exception occurred above
             fh.close()
         return result
 
+    def _region(self, region):
+        """Return region clipped to the image as (y0, y1, x0, x1)."""
+        y0, y1, x0, x1 = region
+        y0, y1, _ = slice(y0, y1).indices(self.image_length)
+        x0, x1, _ = slice(x0, x1).indices(self.image_width)
+        if y1 <= y0 or x1 <= x0:
+            raise ValueError("empty region %s" % str(region))
+        return y0, y1, x0, x1
+
     @lazyattr
     def _byte_counts_offsets(self):
         """Return simplified byte_counts and offsets."""
@@ -2847,8 +3237,8 @@ class TiffTag(object):
     All attributes are read-only.
 
     """
-    __slots__ = ('code', 'name', 'count', 'dtype', 'value', 'value_offset',
-                 '_offset', '_value', '_type')
+    __slots__ = ('code', 'name', 'count', 'dtype', 'value_offset',
+                 '_offset', '_value', '_type', '_data', '_parent')
 
     class Error(Exception):
         pass
@@ -2856,11 +3246,48 @@ class TiffTag(object):
     def __init__(self, arg, **kwargs):
         """Initialize instance from file or arguments."""
         self._offset = None
+        self._parent = None
         if hasattr(arg, '_fh'):
             self._fromfile(arg, **kwargs)
         else:
             self._fromdata(arg, **kwargs)
 
+    @property
+    def value(self):
+        """Tag data as Python object, decoded on first access."""
+        try:
+            return self._data
+        except AttributeError:
+            self._data = self._decode()
+            return self._data
+
+    @value.setter
+    def value(self, value):
+        self._data = value
+
+    def __getstate__(self):
+        # values not decoded yet need the file, which is not pickled
+        self.value
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if name != '_parent' and hasattr(self, name))
+
+    def __setstate__(self, state):
+        self._parent = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def _fromentry(cls, parent, entry, offset):
+        """Return instance from tag structure read from file.
+
+        Like TiffTag(parent, entry=entry, offset=offset), which costs more
+        than the rest of the initialization when reading many pages.
+
+        """
+        self = cls.__new__(cls)
+        self._fromfile(parent, entry, offset)
+        return self
+
     def _fromdata(self, code, dtype, count, value, name=None):
         """Initialize instance from arguments."""
         self.code = int(code)
@@ -2871,19 +3298,31 @@ class TiffTag(object):
         self._value = value
         self._type = dtype
 
-    def _fromfile(self, parent):
-        """Read tag structure from open file. Advance file cursor."""
-        fh = parent.filehandle
-        byteorder = parent.byteorder
-        self._offset = fh.tell()
-        self.value_offset = self._offset + parent.offset_size + 4
+    def _fromfile(self, parent, entry=None, offset=None):
+        """Read tag structure from open file. Advance file cursor.
+
+        If entry is given, it is the (code, dtype, count, value, short, long,
+        long8) tuple of the tag structure at offset, already read from the
+        file, where short, long and long8 are the value field read as
+        integers.
+        Other than single integers, the value is decoded, and read from file
+        if stored elsewhere, when first accessed, except for custom tags.
 
-        fmt, size = {4: ('HHI4s', 12), 8: ('HHQ8s', 20)}[parent.offset_size]
-        data = fh.read(size)
-        code, dtype = struct.unpack(byteorder + fmt[:2], data[:4])
-        count, value = struct.unpack(byteorder + fmt[2:], data[4:])
+        """
+        byteorder = parent.byteorder
+        if entry is None:
+            fh = parent.filehandle
+            offset = fh.tell()
+            fmt, size = {4: ('HHI4s', 12), 8: ('HHQ8s', 20)}[
+                parent.offset_size]
+            data = fh.read(size)
+            code, dtype = struct.unpack(byteorder + fmt[:2], data[:4])
+            count, value = struct.unpack(byteorder + fmt[2:], data[4:])
+            entry = code, dtype, count, value, None, None, None
+        code, self._type, count, value, short, long_, long8 = entry
+        self._offset = offset
         self._value = value
-        self._type = dtype
+        self._parent = parent
 
         if code in TIFF_TAGS:
             name, _, _, cout_, _ = TIFF_TAGS[code]
@@ -2900,31 +3339,69 @@ class TiffTag(object):
         except KeyError:
             raise TiffTag.Error("unknown tag data type %i" % self._type)
 
-        fmt = '%s%i%s' % (byteorder, count*int(dtype[0]), dtype[1])
-        size = struct.calcsize(fmt)
-        if size > parent.offset_size or code in CUSTOM_TAGS:
-            pos = fh.tell()
-            tof = {4: 'I', 8: 'Q'}[parent.offset_size]
-            self.value_offset = offset = struct.unpack(byteorder+tof, value)[0]
+        self.code = code
+        self.name = name
+        self.dtype = dtype
+        self.count = count
+
+        if (count * TIFF_DATA_TYPE_SIZES[self._type] > parent.offset_size or
+                code in CUSTOM_TAGS):
+            self.value_offset = offset = int.from_bytes(
+                value, 'little' if byteorder == '<' else 'big')
             if offset < 0 or offset > parent.filehandle.size:
                 raise TiffTag.Error("corrupt file - invalid tag value offset")
             elif offset < 4:
                 raise TiffTag.Error("corrupt value offset for tag %i" % code)
-            fh.seek(offset)
             if code in CUSTOM_TAGS:
-                readfunc = CUSTOM_TAGS[code][1]
-                value = readfunc(fh, byteorder, dtype, count)
-                if isinstance(value, dict):  # numpy.core.records.record
-                    value = Record(value)
-            elif code in TIFF_TAGS or dtype[-1] == 's':
-                value = struct.unpack(fmt, fh.read(size))
-            else:
-                value = read_numpy(fh, byteorder, dtype, count)
-            fh.seek(pos)
+                self.value = self._decode()
         else:
-            value = struct.unpack(fmt, value[:size])
+            self.value_offset = self._offset + parent.offset_size + 4
+            if count == 1 and short is not None and code not in CUSTOM_TAGS:
+                if self._type == 3:
+                    value = short
+                elif self._type in (4, 13):
+                    value = long_
+                elif self._type in (16, 18):
+                    value = long8
+                else:
+                    return
+                if code in (273, 279, 324, 325, 530, 531):
+                    value = (value,)
+                self._data = value
 
-        if code not in CUSTOM_TAGS and code not in (
+    def _decode(self):
+        """Return value from tag structure or file as Python object."""
+        parent = self._parent
+        byteorder = parent.byteorder
+        dtype = self.dtype
+        count = self.count
+        fmt = '%s%i%s' % (byteorder, count*int(dtype[0]), dtype[1])
+        size = struct.calcsize(fmt)
+        if size <= parent.offset_size and self.code not in CUSTOM_TAGS:
+            value = struct.unpack(fmt, self._value[:size])
+        else:
+            fh = parent.filehandle
+            closed = fh.closed
+            if closed:
+                fh.open()
+            pos = fh.tell()
+            try:
+                fh.seek(self.value_offset)
+                if self.code in CUSTOM_TAGS:
+                    readfunc = CUSTOM_TAGS[self.code][1]
+                    value = readfunc(fh, byteorder, dtype, count)
+                    if isinstance(value, dict):  # numpy.core.records.record
+                        value = Record(value)
+                elif self.code in TIFF_TAGS or dtype[-1] == 's':
+                    value = struct.unpack(fmt, fh.read(size))
+                else:
+                    value = read_numpy(fh, byteorder, dtype, count)
+            finally:
+                fh.seek(pos)
+                if closed:
+                    fh.close()
+
+        if self.code not in CUSTOM_TAGS and self.code not in (
                 273, 279, 324, 325, 530, 531):
             # scalar value if not strip/tile offsets/byte_counts or subsampling
             if len(value) == 1:
@@ -2935,12 +3412,7 @@ class TiffTag(object):
             # TIFF ASCII fields can contain multiple strings,
             #   each terminated with a NUL
             value = stripascii(value)
-
-        self.code = code
-        self.name = name
-        self.dtype = dtype
-        self.count = count
-        self.value = value
+        return value
 
     def _fix_lsm_bitspersample(self, parent):
         """Correct LSM bitspersample tag.
@@ -2965,7 +3437,111 @@ class TiffTag(object):
 
     def __str__(self):
         """Return string containing information about tag."""
-        return ' '.join(str(getattr(self, s)) for s in self.__slots__)
+        return ' '.join(str(getattr(self, s)) for s in (
+            'code', 'name', 'count', 'dtype', 'value', 'value_offset',
+            '_offset', '_value', '_type'))
+
+
+class TiffPageIndex(object):
+    """Positions of the IFDs of a TIFF file and of the image data of pages.
+
+    Attributes
+    ----------
+    ifd_offsets : numpy.ndarray
+        Position of the IFD of each page.
+    strip_index : numpy.ndarray
+        Start of the strips or tiles of each page in strip_offsets and
+        strip_byte_counts, followed by the end of those of the last page.
+    strip_offsets : numpy.ndarray
+        Position of each strip or tile.
+    strip_byte_counts : numpy.ndarray
+        Number of bytes of each strip or tile.
+
+    The strip offsets and byte counts are the page attributes used to read
+    image data, after corrections that need other pages, as of LSM files.
+
+    """
+    def __init__(self, pages):
+        """Initialize instance from pages read from file."""
+        offsets = []
+        byte_counts = []
+        strip_index = [0]
+        for page in pages:
+            pre = 'tile' if 'tile_offsets' in page.tags else 'strip'
+            if pre+'_offsets' in page.tags and pre+'_byte_counts' in page.tags:
+                offsets.extend(getattr(page, pre+'_offsets'))
+                byte_counts.extend(getattr(page, pre+'_byte_counts'))
+            strip_index.append(len(offsets))
+        self.ifd_offsets = numpy.array([page._offset for page in pages],
+                                       numpy.uint64)
+        self.strip_index = numpy.array(strip_index, numpy.uint64)
+        self.strip_offsets = numpy.array(offsets, numpy.uint64)
+        self.strip_byte_counts = numpy.array(byte_counts, numpy.uint64)
+
+    def strips(self, index):
+        """Return strip or tile offsets and byte counts of page as tuples."""
+        start, end = self.strip_index[index:index+2].tolist()
+        return (tuple(self.strip_offsets[start:end].tolist()),
+                tuple(self.strip_byte_counts[start:end].tolist()))
+
+    def __len__(self):
+        """Return number of pages in file."""
+        return len(self.ifd_offsets)
+
+
+class TiffPages(object):
+    """Sequence of the pages of a TIFF file, read when first accessed.
+
+    Pages are read at the IFD offsets of a TiffPageIndex, so accessing any
+    page reads only its IFD and not those of the pages before it.
+
+    """
+    def __init__(self, parent, index, fastij=True):
+        self.parent = parent
+        self.index = index
+        self._pages = [None] * len(index)
+        # before parent has pages, like when following the chain of IFDs
+        self._pages[0] = self._read(0, fastij)
+
+    def _read(self, index, fastij=False):
+        """Return page read from file, with strips from the page index."""
+        fh = self.parent.filehandle
+        closed = fh.closed
+        if closed:
+            fh.open()
+        pos = fh.tell()
+        try:
+            page = TiffPage(self.parent, index,
+                            int(self.index.ifd_offsets[index]))
+            if fastij:
+                page._patch_imagej() or page._patch_shaped()
+        finally:
+            fh.seek(pos)
+            if closed:
+                fh.close()
+        pre = 'tile' if 'tile_offsets' in page.tags else 'strip'
+        if pre+'_offsets' in page.tags and pre+'_byte_counts' in page.tags:
+            # the tag values are only read from file if accessed
+            offsets, byte_counts = self.index.strips(index)
+            setattr(page, pre+'_offsets', offsets)
+            setattr(page, pre+'_byte_counts', byte_counts)
+        return page
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self._pages)))]
+        page = self._pages[key]
+        if page is None:
+            index = range(len(self._pages))[key]
+            page = self._pages[index] = self._read(index)
+        return page
+
+    def __iter__(self):
+        for i in range(len(self._pages)):
+            yield self[i]
 
 
 class TiffPageSeries(object):
@@ -3176,11 +3752,17 @@ class TiffSequence(object):
         """Read image data from all files and return as single numpy array.
 
         If memmap is True, return an array stored in a binary file on disk.
-        The args and kwargs parameters are passed to the imread function.
+        If the 'maxworkers' keyword argument is greater than 1, read that
+        many files at a time on threads, which hides the latency of file
+        systems on networks. Files are read into the result in order and
+        at most twice as many images as workers are held in memory.
+        The other args and kwargs parameters are passed to the imread
+        function.
 
         Raise IndexError or ValueError if image shapes do not match.
 
         """
+        maxworkers = kwargs.pop('maxworkers', 1)
         im = self.imread(self.files[0], *args, **kwargs)
         shape = self.shape + im.shape
         if memmap:
@@ -3189,11 +3771,22 @@ class TiffSequence(object):
         else:
             result = numpy.zeros(shape, dtype=im.dtype)
         result = result.reshape(-1, *im.shape)
+
+        def read(index, fname):
+            result[index] = self.imread(fname, *args, **kwargs)
+
+        tasks = []
         for index, fname in zip(self._indices, self.files):
             index = [i-j for i, j in zip(index, self._start_index)]
             index = numpy.ravel_multi_index(index, self.shape)
-            im = self.imread(fname, *args, **kwargs)
-            result[index] = im
+            tasks.append((index, fname))
+        result[tasks.pop(0)[0]] = im  # the first file is already read
+        del im
+        if maxworkers > 1:
+            run_threaded(read, tasks, maxworkers)
+        else:
+            for task in tasks:
+                read(*task)
         result.shape = shape
         return result
 
@@ -3300,6 +3893,49 @@ class TiffTags(Record):
         return '\n'.join(s)
 
 
+class TiffCodec(object):
+    """Functions to decode and encode a TIFF compression scheme.
+
+    Instances are created by register_codec and stored in TIFF_CODECS
+    by name.
+
+    Attributes
+    ----------
+    code : int
+        Value of the compression tag.
+    name : str
+        Name of the compression scheme.
+    decode : function or None
+        Return decoded bytes from encoded bytes, if supported.
+    encode : function or None
+        Return encoded bytes from image data and level, if supported.
+    level : int or None
+        Default compression level.
+    releases_gil : bool
+        If decode and encode release the global interpreter lock.
+
+    """
+    __slots__ = ('code', 'name', 'decode', 'encode', 'level', 'releases_gil')
+
+    def __init__(self, code, name, decode=None, encode=None, level=None,
+                 releases_gil=False):
+        self.code = int(code)
+        self.name = name
+        self.decode = decode
+        self.encode = encode
+        self.level = level
+        self.releases_gil = bool(releases_gil)
+
+    def __str__(self):
+        """Return string with information about codec."""
+        return "%i %s: %s%s%s" % (
+            self.code, self.name,
+            '/'.join(s for s, f in (('decode', self.decode),
+                                    ('encode', self.encode)) if f),
+            ', level %s' % self.level if self.level is not None else '',
+            ', releases GIL' if self.releases_gil else '')
+
+
 class FileHandle(object):
     """Binary file handle.
 
@@ -3473,6 +4109,36 @@ class FileHandle(object):
             data = self._fh.read(size)
             return numpy.fromstring(data, dtype, count, sep)
 
+    def read_into(self, out):
+        """Read data from file into contiguous numpy array 'out'.
+
+        Return number of bytes read.
+
+        """
+        view = memoryview(out.reshape(-1).view('u1'))
+        size = self._fh.readinto(view)
+        while size < len(view):
+            # raw and unbuffered streams may return less than requested
+            n = self._fh.readinto(view[size:])
+            if not n:
+                break
+            size += n
+        return size
+
+    def prefetch(self, offset, size):
+        """Advise the operating system that data will be read soon.
+
+        Where supported, the data at 'offset' are read into the page cache
+        in the background, while the caller does other work.
+
+        """
+        if self.is_file and hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(self._fh.fileno(), self._offset + offset,
+                                 size, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+
     def read_record(self, dtype, shape=1, byteorder=None):
         """Return numpy record from file."""
         try:
@@ -4195,6 +4861,45 @@ def decode_floats(data):
     return data
 
 
+def encode_floats(data):
+    """Encode floating point horizontal differencing.
+
+    The inverse of decode_floats. Return array of the shape and dtype of
+    data containing the differenced, reordered bytes of the image values,
+    which do not depend on the byte order of data.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The image to be encoded. The dtype must be a floating point.
+        The shape must include the number of contiguous samples per pixel
+        even if 1.
+
+    """
+    shape = data.shape
+    dtype = data.dtype
+    if len(shape) < 3:
+        raise ValueError('invalid data shape')
+    if dtype.char not in 'dfe':
+        raise ValueError('not a floating point image')
+    # reorder bytes, most significant first
+    data = numpy.ascontiguousarray(data, dtype.newbyteorder('<'))
+    data = data.view('uint8').reshape(shape + (-1,))
+    data = data[..., ::-1]
+    data = numpy.swapaxes(data, -2, -1)
+    data = numpy.swapaxes(data, -3, -2)
+    data = numpy.ascontiguousarray(data)
+    data.shape = shape[:-2] + (-1,) + shape[-1:]
+    # horizontal byte differencing
+    result = data.copy()
+    numpy.subtract(data[..., 1:, :], data[..., :-1, :],
+                   out=result[..., 1:, :])
+    result.shape = shape[:-1] + (-1,)
+    result = result.view(dtype)
+    result.shape = shape
+    return result
+
+
 def decode_jpeg(encoded, tables=b'', photometric=None,
                 ycbcr_subsampling=None, ycbcr_positioning=None):
     """Decode JPEG encoded byte string (using _czifile extension module)."""
@@ -4212,24 +4917,49 @@ def decode_packbits(encoded):
 
     PackBits is a simple byte-oriented run-length compression scheme.
 
+    Runs are collected as byte strings and joined once, so the Python loop
+    runs once per run, not once per byte.
+
     """
-    func = ord if sys.version[0] == '2' else lambda x: x
     result = []
-    result_extend = result.extend
+    result_append = result.append
+    size = len(encoded)
     i = 0
-    try:
-        while True:
-            n = func(encoded[i]) + 1
+    while i < size:
+        n = encoded[i] + 1
+        i += 1
+        if n < 129:
+            result_append(encoded[i:i+n])
+            i += n
+        elif n > 129:
+            result_append(encoded[i:i+1] * (258-n))
             i += 1
-            if n < 129:
-                result_extend(encoded[i:i+n])
-                i += n
-            elif n > 129:
-                result_extend(encoded[i:i+1] * (258-n))
-                i += 1
-    except IndexError:
-        pass
-    return b''.join(result) if sys.version[0] == '2' else bytes(result)
+    return b''.join(result)
+
+
+def _lzw_codes(encoded, bitpos, first, count):
+    """Return count codes of LZW stream and their end bit positions.
+
+    The codes start at bit position bitpos and the first of them is the
+    first-th code after a CLEAR code. Bit-widths follow from the number of
+    codes read since the CLEAR, so all codes up to the next CLEAR or EOI
+    are extracted at once. encoded is a uint8 array padded with 3 bytes.
+
+    """
+    k = numpy.arange(first, first + count)
+    lentable = 258 + numpy.maximum(k - 1, 0)
+    bitw = (9 + (lentable >= 511) + (lentable >= 1023) +
+            (lentable >= 2047)).astype(numpy.intp)
+    ends = bitpos + numpy.cumsum(bitw)
+    starts = ends - bitw
+    # codes past the end of the data are garbage and discarded by the caller
+    index = numpy.minimum(starts // 8, encoded.size - 3)
+    window = ((encoded[index].astype(numpy.uint32) << 16) |
+              (encoded[index + 1].astype(numpy.uint32) << 8) |
+              encoded[index + 2])
+    shift = (24 - (starts % 8) - bitw).astype(numpy.uint32)
+    codes = (window >> shift) & ((1 << bitw) - 1).astype(numpy.uint32)
+    return codes, ends
 
 
 @_replace_by('_tifffile.decode_lzw')
@@ -4241,76 +4971,64 @@ def decode_lzw(encoded):
     This is an implementation of the LZW decoding algorithm described in (1).
     It is not compatible with old style LZW compressed files like quad-lzw.tif.
 
+    All codes between CLEAR codes are extracted from the bit stream at once
+    with NumPy, so the Python loop only looks up and extends the table.
+
     """
     len_encoded = len(encoded)
     bitcount_max = len_encoded * 8
-    unpack = struct.unpack
-
-    if sys.version[0] == '2':
-        newtable = [chr(i) for i in range(256)]
-    else:
-        newtable = [bytes([i]) for i in range(256)]
-    newtable.extend((0, 0))
-
-    def next_code():
-        """Return integer of 'bitw' bits at 'bitcount' position in encoded."""
-        start = bitcount // 8
-        s = encoded[start:start+4]
-        try:
-            code = unpack('>I', s)[0]
-        except Exception:
-            code = unpack('>I', s + b'\x00'*(4-len(s)))[0]
-        code <<= bitcount % 8
-        code &= mask
-        return code >> shr
-
-    switchbitch = {  # code: bit-width, shr-bits, bit-mask
-        255: (9, 23, int(9*'1'+'0'*23, 2)),
-        511: (10, 22, int(10*'1'+'0'*22, 2)),
-        1023: (11, 21, int(11*'1'+'0'*21, 2)),
-        2047: (12, 20, int(12*'1'+'0'*20, 2)), }
-    bitw, shr, mask = switchbitch[255]
-    bitcount = 0
-
     if len_encoded < 4:
         raise ValueError("strip must be at least 4 characters long")
-
-    if next_code() != 256:
+    data = numpy.zeros(len_encoded + 3, numpy.uint8)
+    data[:len_encoded] = numpy.frombuffer(encoded, numpy.uint8)
+    if ((int(data[0]) << 1) | (int(data[1]) >> 7)) != 256:
         raise ValueError("strip must begin with CLEAR code")
 
-    code = 0
-    oldcode = 0
+    newtable = [bytes([i]) for i in range(256)]
+    newtable.extend((b'', b''))
     result = []
     result_append = result.append
+    maxcount = 4096 - 258 + 1  # codes between CLEAR codes of valid strips
+    bitcount = 9
+    code = 256
+    k = 0
     while True:
-        code = next_code()  # ~5% faster when inlining this function
-        bitcount += bitw
-        if code == 257 or bitcount >= bitcount_max:  # EOI
-            break
-        if code == 256:  # CLEAR
+        count = min(maxcount, (bitcount_max - bitcount) // 9 + 1)
+        codes, ends = _lzw_codes(data, bitcount, k, count)
+        # a code is used only if it ends within the strip
+        valid = int(numpy.searchsorted(ends, bitcount_max, side='right'))
+        special = numpy.flatnonzero((codes[:valid] & 0xFFE) == 256)
+        stop = int(special[0]) if len(special) else valid
+        codelist = codes[:stop].tolist()
+        if k == 0 and codelist:
+            # first code after CLEAR does not add a table entry
             table = newtable[:]
             table_append = table.append
-            lentable = 258
-            bitw, shr, mask = switchbitch[255]
-            code = next_code()
-            bitcount += bitw
+            code = codelist[0]
+            previous = table[code]
+            result_append(previous)
+            codelist = codelist[1:]
+        for code in codelist:
+            try:
+                decoded = table[code]
+                table_append(previous + decoded[:1])
+            except IndexError:
+                # code of the entry being added
+                decoded = previous + previous[:1]
+                table_append(decoded)
+            result_append(decoded)
+            previous = decoded
+        if stop < valid:
+            code = int(codes[stop])
             if code == 257:  # EOI
                 break
-            result_append(table[code])
+            bitcount = int(ends[stop])  # CLEAR
+            k = 0
+        elif valid < count or count == 0:
+            break  # end of strip
         else:
-            if code < lentable:
-                decoded = table[code]
-                newcode = table[oldcode] + decoded[:1]
-            else:
-                newcode = table[oldcode]
-                newcode += newcode[:1]
-                decoded = newcode
-            result_append(decoded)
-            table_append(newcode)
-            lentable += 1
-        oldcode = code
-        if lentable in switchbitch:
-            bitw, shr, mask = switchbitch[lentable]
+            bitcount = int(ends[-1])
+            k += count
 
     if code != 257:
         warnings.warn("unexpected end of lzw stream (code %i)" % code)
@@ -4318,6 +5036,176 @@ def decode_lzw(encoded):
     return b''.join(result)
 
 
+def encode_packbits(data):
+    """Compress byte string with PackBits.
+
+    Runs of three or more equal bytes are replicated, all other bytes are
+    copied literally. Runs are found with NumPy, so the Python loop runs
+    once per long run or 128 literal bytes, not once per byte.
+
+    """
+    data = bytes(data)
+    size = len(data)
+    if not size:
+        return b''
+    values = numpy.frombuffer(data, numpy.uint8)
+    starts = numpy.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = numpy.concatenate(([0], starts))
+    lengths = numpy.diff(numpy.concatenate((starts, [size])))
+    runs = lengths >= 3
+    result = []
+    result_append = result.append
+
+    def literal(start, end):
+        for i in range(start, end, 128):
+            chunk = data[i:min(i + 128, end)]
+            result_append(bytes((len(chunk) - 1,)))
+            result_append(chunk)
+
+    pos = 0
+    for start, length in zip(starts[runs].tolist(), lengths[runs].tolist()):
+        literal(pos, start)
+        value = data[start:start+1]
+        pos = start
+        while pos + 3 <= start + length:
+            count = min(start + length - pos, 128)
+            result_append(bytes((257 - count,)))
+            result_append(value)
+            pos += count
+    literal(pos, size)
+    return b''.join(result)
+
+
+def encode_lzw(data):
+    """Compress byte string with TIFF LZW (Lempel-Ziv-Welch).
+
+    The result begins with a CLEAR code, which is repeated before the table
+    grows beyond 12 bit codes, and ends with an EOI code. The code widths
+    follow the table size as expected by decode_lzw.
+    The Python loop only extends and looks up the table; the codes are
+    packed into the bit stream at once with NumPy.
+
+    """
+    codes = [256]
+    codes_append = codes.append
+    table = {}
+    nextcode = 258
+    code = None
+    for byte in bytes(data):
+        if code is None:
+            code = byte
+            continue
+        key = (code << 8) | byte
+        try:
+            code = table[key]
+        except KeyError:
+            codes_append(code)
+            table[key] = nextcode
+            nextcode += 1
+            code = byte
+            if nextcode >= 4094:
+                codes_append(256)
+                table = {}
+                nextcode = 258
+    if code is not None:
+        codes_append(code)
+    codes_append(257)
+
+    codes = numpy.array(codes, numpy.uint32)
+    # width of each code from the number of codes since the last CLEAR
+    index = numpy.arange(len(codes))
+    clears = numpy.maximum.accumulate(numpy.where(codes == 256, index, 0))
+    since_clear = index[1:] - clears[:-1] - 1
+    lentable = 258 + numpy.maximum(since_clear - 1, 0)
+    bitw = numpy.empty(len(codes), numpy.uint32)
+    bitw[0] = 9
+    bitw[1:] = (9 + (lentable >= 511) + (lentable >= 1023) +
+                (lentable >= 2047))
+    ends = numpy.cumsum(bitw)
+    starts = ends - bitw
+    # each code spans at most 3 bytes, aligned to the left of a 24 bit window
+    window = codes << (24 - bitw - starts % 8)
+    result = numpy.zeros(int(ends[-1] + 7) // 8 + 2, numpy.uint8)
+    byte = starts // 8
+    for i, shift in enumerate((16, 8, 0)):
+        numpy.bitwise_or.at(result, byte + i,
+                            ((window >> shift) & 255).astype(numpy.uint8))
+    # decoders require at least 4 bytes, which CLEAR and EOI alone are not
+    return result[:max(int(ends[-1] + 7) // 8, 4)].tobytes()
+
+
+def register_codec(code, name, decode=None, encode=None, level=None,
+                   releases_gil=False):
+    """Register functions to decode and encode a TIFF compression scheme.
+
+    Parameters
+    ----------
+    code : int
+        Value of the compression tag.
+    name : str
+        Name of the compression scheme, the value of TiffPage.compression
+        and of the 'compress' parameter of TiffWriter.save.
+    decode : function
+        Return decoded bytes from encoded bytes of a strip or tile.
+    encode : function
+        Return encoded bytes from image data and compression level.
+        The data of a strip or tile are passed as numpy.ndarray of shape
+        (depth, length, width, samples).
+    level : int
+        Compression level used if none is given.
+    releases_gil : bool
+        If True, decode and encode release the global interpreter lock,
+        so strips and tiles can be decoded in parallel on threads.
+        TiffPage.asarray decodes serially with codecs that don't.
+
+    Registering a code or name again replaces the codec, and the name or
+    code it was registered with before no longer resolves.
+
+    """
+    codec = TiffCodec(code, name, decode, encode, level, releases_gil)
+    # remove the codecs of the code and of the name being replaced
+    previous = TIFF_CODECS.get(TIFF_COMPESSIONS.get(code))
+    if previous is not None and previous.code == codec.code:
+        del TIFF_CODECS[previous.name]
+        TIFF_DECOMPESSORS.pop(previous.name, None)
+    previous = TIFF_CODECS.get(name)
+    if previous is not None and TIFF_COMPESSIONS.get(previous.code) == name:
+        del TIFF_COMPESSIONS[previous.code]
+    TIFF_CODECS[name] = codec
+    TIFF_COMPESSIONS[code] = name
+    if decode is None:
+        TIFF_DECOMPESSORS.pop(name, None)
+    else:
+        TIFF_DECOMPESSORS[name] = decode
+    return codec
+
+
+def _encode_deflate(data, level):
+    return zlib.compress(data, level)
+
+
+def _encode_lzma(data, level):
+    return lzma.compress(data, preset=level)
+
+
+def _encode_bz2(data, level):
+    return bz2.compress(data, level)
+
+
+def _encode_packbits(data, level=None):
+    # rows are packed separately as required by the TIFF specification
+    if not isinstance(data, numpy.ndarray) or data.ndim != 4:
+        return encode_packbits(data)
+    rowsize = data.shape[-2] * data.shape[-1] * data.itemsize
+    data = data.tobytes()
+    return b''.join(encode_packbits(data[i:i+rowsize])
+                    for i in range(0, len(data), rowsize))
+
+
+def _encode_lzw(data, level=None):
+    return encode_lzw(data)
+
+
 @_replace_by('_tifffile.unpack_ints')
 def unpack_ints(data, dtype, itemsize, runlen=0):
     """Decompress byte string to array of integers of any bit size <= 32.
@@ -4335,7 +5223,7 @@ def unpack_ints(data, dtype, itemsize, runlen=0):
 
     """
     if itemsize == 1:  # bitarray
-        data = numpy.fromstring(data, '|B')
+        data = numpy.frombuffer(data, '|B')
         data = numpy.unpackbits(data)
         if runlen % 8:
             data = data.reshape(-1, runlen + (8 - runlen % 8))
@@ -4344,7 +5232,7 @@ def unpack_ints(data, dtype, itemsize, runlen=0):
 
     dtype = numpy.dtype(dtype)
     if itemsize in (8, 16, 32, 64):
-        return numpy.fromstring(data, dtype)
+        return numpy.frombuffer(data, dtype)
     if itemsize < 1 or itemsize > 32:
         raise ValueError("itemsize out of range: %i" % itemsize)
     if dtype.kind not in "biu":
@@ -4420,7 +5308,7 @@ def unpack_rgb(data, dtype='<B', bitspersample=(5, 6, 5), rescale=True):
     if not (bits <= 32 and all(i <= dtype.itemsize*8 for i in bitspersample)):
         raise ValueError("sample size not supported %s" % str(bitspersample))
     dt = next(i for i in 'BHI' if numpy.dtype(i).itemsize*8 >= bits)
-    data = numpy.fromstring(data, dtype.byteorder+dt)
+    data = numpy.frombuffer(data, dtype.byteorder+dt)
     result = numpy.empty((data.size, len(bitspersample)), dtype.char)
     for i, bps in enumerate(bitspersample):
         t = data >> int(numpy.sum(bitspersample[i+1:]))
@@ -4645,12 +5533,49 @@ def reshape_axes(axes, shape, newshape):
     return ''.join(reversed(result[lendiff:]))
 
 
+def region_shape(shape, axes, region):
+    """Return shape with the Y and X axes reduced to region (y0, y1, x0, x1)."""
+    shape = list(shape)
+    y0, y1, x0, x1 = region
+    if 'Y' in axes:
+        shape[axes.index('Y')] = y1 - y0
+    if 'X' in axes:
+        shape[axes.index('X')] = x1 - x0
+    return tuple(shape)
+
+
+def run_threaded(func, tasks, maxworkers):
+    """Call func(*task) for all tasks using a pool of maxworkers threads.
+
+    Tasks are submitted in order and at most 2*maxworkers are pending at a
+    time, so only few of them need to be held in memory. Exceptions raised
+    by func are re-raised.
+
+    """
+    with concurrent.futures.ThreadPoolExecutor(maxworkers) as executor:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(func, *task))
+            if len(pending) > 2 * maxworkers:
+                pending.popleft().result()
+        for future in pending:
+            future.result()
+
+
+# memory-mapped arrays of stacked pages are flushed every this many bytes
+stack_pages_flush_size = 64 * 1024 * 1024
+
+
 def stack_pages(pages, memmap=False, tempdir=None, *args, **kwargs):
     """Read data from sequence of TiffPage and stack them vertically.
 
     If memmap is True, return an array stored in a binary file on disk.
     Additional parameters are passsed to the page asarray function.
 
+    Pages after the first are decoded directly into the stacked array.
+    The data of the next page are prefetched while a page is decoded, and
+    memory-mapped arrays are flushed every 'stack_pages_flush_size' bytes.
+
     """
     if len(pages) == 0:
         raise ValueError("no pages")
@@ -4667,13 +5592,26 @@ def stack_pages(pages, memmap=False, tempdir=None, *args, **kwargs):
         data = numpy.empty(shape, dtype=data0.dtype)
 
     data[0] = data0
-    if memmap:
-        data.flush()
     del data0
-    for i, page in enumerate(pages[1:]):
-        data[i+1] = page.asarray(*args, **kwargs)
-        if memmap:
+
+    def prefetch(page):
+        if page and page._shape:
+            byte_counts, offsets = page._byte_counts_offsets
+            start = min(offsets)
+            page.parent.filehandle.prefetch(
+                start, max(o + b for o, b in zip(offsets, byte_counts)) -
+                start)
+
+    flush_pages = max(1, stack_pages_flush_size // max(1, data[0].nbytes))
+    prefetch(pages[1])
+    for i in range(1, len(pages)):
+        if i + 1 < len(pages):
+            prefetch(pages[i+1])
+        pages[i].asarray(out=data[i], *args, **kwargs)
+        if memmap and not i % flush_pages:
             data.flush()
+    if memmap:
+        data.flush()
 
     return data
 
@@ -4965,17 +5903,23 @@ TIFF_COMPESSIONS = {
     34925: 'lzma',
 }
 
-TIFF_DECOMPESSORS = {
-    None: lambda x: x,
-    'adobe_deflate': zlib.decompress,
-    'deflate': zlib.decompress,
-    'packbits': decode_packbits,
-    'lzw': decode_lzw,
-    # 'jpeg': decode_jpeg
-}
+# Map compression names to decode functions, of the codecs in TIFF_CODECS
+TIFF_DECOMPESSORS = {}
+
+# Map compression names to TiffCodec. Use register_codec to add codecs.
+TIFF_CODECS = {}
 
+register_codec(1, None, decode=lambda x: x, releases_gil=True)
+register_codec(8, 'adobe_deflate', zlib.decompress, _encode_deflate, 6, True)
+register_codec(32946, 'deflate', zlib.decompress, _encode_deflate, 6, True)
+register_codec(32773, 'packbits', decode_packbits, _encode_packbits)
+register_codec(5, 'lzw', decode_lzw, _encode_lzw)
+# 'jpeg': decode_jpeg needs the JPEG tables of the page
 if lzma:
-    TIFF_DECOMPESSORS['lzma'] = lzma.decompress
+    register_codec(34925, 'lzma', lzma.decompress, _encode_lzma, 6, True)
+if bz2:
+    # private, unregistered compression code
+    register_codec(65000, 'bz2', bz2.decompress, _encode_bz2, 9, True)
 
 TIFF_DATA_TYPES = {
     1: '1B',   # BYTE 8-bit unsigned integer.
@@ -5002,6 +5946,12 @@ TIFF_DATA_TYPES = {
     18: '1Q',  # IFD8 unsigned 8 byte IFD offset (BigTiff)
 }
 
+# size in bytes of one value of TIFF_DATA_TYPES
+TIFF_DATA_TYPE_SIZES = dict(
+    (code, struct.calcsize('<' + dtype)) for code, dtype in
+    ((code, int(dtype[0]) * dtype[1]) for code, dtype in
+     TIFF_DATA_TYPES.items()))
+
 TIFF_SAMPLE_FORMATS = {
     1: 'uint',
     2: 'int',
@@ -5814,6 +6764,29 @@ TIFF_TAGS = {
     # code: (attribute name, default value, type, count, validator)
 }
 
+# validated values and default values of TIFF_TAGS by name
+TIFF_TAGS_VALIDATE = dict(
+    (name, validate) for name, _, _, _, validate in TIFF_TAGS.values()
+    if validate)
+TIFF_TAGS_DEFAULT = dict(
+    (name, validate[default] if validate else default)
+    for name, default, _, _, validate in TIFF_TAGS.values()
+    if default is not None)
+
+# structure of a tag in an IFD by byteorder and offset_size, with its value
+# field also read as a single SHORT, LONG, and LONG8 (LONG in classic TIFF)
+TIFF_IFD_ENTRY_DTYPES = dict(
+    ((byteorder, offset_size), numpy.dtype({
+        'names': ['code', 'dtype', 'count', 'value', 'short', 'long',
+                  'long8'],
+        'formats': [byteorder + 'u2', byteorder + 'u2',
+                    byteorder + {4: 'u4', 8: 'u8'}[offset_size],
+                    'V%i' % offset_size, byteorder + 'u2', byteorder + 'u4',
+                    byteorder + {4: 'u4', 8: 'u8'}[offset_size]],
+        'offsets': [0, 2, 4] + [offset_size + 4] * 4,
+        'itemsize': offset_size * 2 + 4}))
+    for byteorder in '<>' for offset_size in (4, 8))
+
 # Map custom TIFF tag codes to attribute names and import functions
 CUSTOM_TAGS = {
     700: ('xmp', read_bytes),
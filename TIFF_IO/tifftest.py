@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+Round trip tests for the TIFF reader and writer.
+
+Run from the repository root with
+
+    python -m pytest TIFF_IO/tifftest.py
+"""
+
+import os
+import struct
+import tempfile
+import threading
+import unittest
+import warnings
+import zlib
+
+import numpy
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from TIFF_IO import header_cache
+    from TIFF_IO import tifffile
+
+
+def write_strips(path, data, rows_per_strip, planar=False):
+    """
+    Writes the uint16 image data, (length, width) or (length, width,
+    samples), or (samples, length, width) if planar, as a little endian TIFF
+    of deflate compressed strips of rows_per_strip rows. TiffWriter always
+    writes one strip per plane, which hides short strips at the end of
+    planes.
+    """
+    planes = data if planar else data.reshape((1, ) + data.shape[:2] + (-1, ))
+    samples = len(planes) if planar else planes.shape[-1]
+    length, width = planes.shape[1:3]
+    strips = [zlib.compress(plane[row:row + rows_per_strip].tobytes())
+              for plane in planes for row in range(0, length, rows_per_strip)]
+    # the header, the strips, then the arrays of the tags and the IFD
+    offsets = [8 + sum(len(strip) for strip in strips[:i]) for i in range(len(strips))]
+    arrays = offsets[-1] + len(strips[-1])
+    tags = [(256, 4, [width]), (257, 4, [length]), (258, 3, [16] * samples), (259, 3, [8]),
+            (262, 3, [2 if samples == 3 else 1]), (273, 4, offsets), (277, 3, [samples]),
+            (278, 4, [rows_per_strip]), (279, 4, [len(strip) for strip in strips]),
+            (284, 3, [2 if planar else 1])]
+    values = bytearray()
+    entries = bytearray()
+    for code, dtype, value in tags:
+        value = struct.pack("<%d%s" % (len(value), "HI"[dtype // 4]), *value)
+        if len(value) > 4:
+            entries += struct.pack("<HHII", code, dtype, len(value) // (2 * (dtype // 2)), arrays + len(values))
+            values += value
+        else:
+            entries += struct.pack("<HHI", code, dtype, len(value) // (2 * (dtype // 2))) + value.ljust(4, b"\0")
+    with open(path, "wb") as f:
+        f.write(struct.pack("<2sHI", b"II", 42, arrays + len(values)))
+        f.write(b"".join(strips))
+        f.write(values)
+        f.write(struct.pack("<H", len(tags)) + entries + struct.pack("<I", 0))
+
+
+class TestTiffFileClass(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name="test.tif"):
+        return os.path.join(self.directory.name, name)
+
+    def test_shaped_series_loads_all_pages(self):
+        data_in = numpy.random.randint(0, 60000, (4, 5, 20, 30)).astype(numpy.uint16)
+        for compress in (0, 6):
+            tifffile.imsave(self.path(), data_in, compress=compress)
+            with tifffile.TiffFile(self.path()) as tif:
+                # uncompressed pages are contiguous, so only the first page record is read
+                self.assertEqual(len(tif.pages), 1 if not compress else 20)
+                self.assertEqual(tif.series[0].shape, data_in.shape)
+                self.assertTrue(numpy.array_equal(tif.asarray(), data_in))
+                data_out = tif.asarray(memmap=True)
+                # the TIFF file is mapped if its data are contiguous, else a temporary file
+                self.assertIsInstance(data_out, numpy.memmap)
+                self.assertEqual(data_out.filename == os.path.abspath(self.path()), not compress)
+                self.assertTrue(numpy.array_equal(data_out, data_in))
+                del data_out
+            with tifffile.TiffFile(self.path(), fastij=False) as tif:
+                self.assertEqual(len(tif.pages), 20)
+                self.assertTrue(numpy.array_equal(tif.asarray(), data_in))
+
+    def test_threaded_decoding_matches_serial_decoding(self):
+        data_in = numpy.random.randint(0, 60000, (3, 37, 53)).astype(numpy.uint16)
+        files = list()
+        # one strip per plane, as TiffWriter writes them
+        tifffile.imsave(self.path("planar.tif"), data_in, compress=6, planarconfig="planar")
+        files.append((self.path("planar.tif"), data_in))
+        tifffile.imsave(self.path("contig.tif"), data_in.transpose(1, 2, 0), compress=6, planarconfig="contig")
+        files.append((self.path("contig.tif"), data_in.transpose(1, 2, 0)))
+        tifffile.imsave(self.path("tiled.tif"), data_in[0], compress=6, tile=(16, 16))
+        files.append((self.path("tiled.tif"), data_in[0]))
+        # 37 rows do not fill the last strip of each plane
+        for rows_per_strip in (1, 5, 16, 37):
+            write_strips(self.path("planar%d.tif" % rows_per_strip), data_in, rows_per_strip, planar=True)
+            files.append((self.path("planar%d.tif" % rows_per_strip), data_in))
+            write_strips(self.path("contig%d.tif" % rows_per_strip), data_in.transpose(1, 2, 0), rows_per_strip)
+            files.append((self.path("contig%d.tif" % rows_per_strip), data_in.transpose(1, 2, 0)))
+            write_strips(self.path("gray%d.tif" % rows_per_strip), data_in[0], rows_per_strip)
+            files.append((self.path("gray%d.tif" % rows_per_strip), data_in[0]))
+        for path, expected in files:
+            with tifffile.TiffFile(path) as tif:
+                page = tif.pages[0]
+                serial = page.asarray(maxworkers=1)
+                self.assertTrue(numpy.array_equal(serial, expected), path)
+                for maxworkers in (2, 3, 4):
+                    self.assertTrue(numpy.array_equal(page.asarray(maxworkers=maxworkers), serial), path)
+
+    def test_decode_packbits_and_lzw(self):
+        # the example of the TIFF 6.0 specification, with a no-op 0x80 header
+        encoded = b"\xfe\xaa\x02\x80\x00\x2a\x80\xfd\xaa\x03\x80\x00\x2a\x22\xf7\xaa"
+        decoded = b"\xaa\xaa\xaa\x80\x00\x2a\xaa\xaa\xaa\xaa\x80\x00\x2a\x22" + b"\xaa" * 10
+        self.assertEqual(tifffile.decode_packbits(encoded), decoded)
+        # truncated runs decode as far as they go
+        self.assertEqual(tifffile.decode_packbits(encoded[:5]), decoded[:5])
+        encoded = (b"\x80\x1c\xcc'\x91\x01\xa0\xc2m6\x99NB\x03\xc9\xbe\x0b\x07\x84\xc2\xcd\xa68|\"\x14 3"
+                   b"\xc3\xa0\xd1c\x94\x02\x02\x80")
+        decoded = b"say hammer yo hammer mc hammer go hammer"
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            self.assertEqual(tifffile.decode_lzw(encoded), decoded)
+        with self.assertWarns(UserWarning):
+            truncated = tifffile.decode_lzw(encoded[:-4])
+        self.assertTrue(decoded.startswith(truncated) and len(truncated) < len(decoded))
+        with self.assertRaises(ValueError):
+            tifffile.decode_lzw(b"\x00" + encoded[1:])
+
+    def test_region_matches_slicing_full_image(self):
+        data_in = numpy.random.randint(0, 60000, (5, 70, 90)).astype(numpy.uint16)
+        rgb_in = numpy.random.randint(0, 255, (70, 90, 3)).astype(numpy.uint8)
+        files = list()
+        for compress in (0, 6):
+            tifffile.imsave(self.path("stack%d.tif" % compress), data_in, compress=compress)
+            files.append(self.path("stack%d.tif" % compress))
+            tifffile.imsave(self.path("tiled%d.tif" % compress), data_in, compress=compress, tile=(32, 16))
+            files.append(self.path("tiled%d.tif" % compress))
+            tifffile.imsave(self.path("rgb%d.tif" % compress), rgb_in, compress=compress, photometric="rgb")
+            files.append(self.path("rgb%d.tif" % compress))
+        write_strips(self.path("strips.tif"), data_in[0], 16)
+        files.append(self.path("strips.tif"))
+        regions = ((0, 70, 0, 90), (10, 20, 30, 40), (31, 33, 15, 17), (60, 70, 0, 1), (-20, None, -30, None))
+        for path in files:
+            with tifffile.TiffFile(path) as tif:
+                page = tif.pages[0]
+                full = tif.asarray()
+                full_page = page.asarray()
+                # the image axes are followed by the samples of rgb images
+                key = (Ellipsis, ) if page.axes[-1] == "X" else (Ellipsis, slice(None))
+                for y0, y1, x0, x1 in regions:
+                    expected = full[key[:1] + (slice(y0, y1), slice(x0, x1)) + key[1:]]
+                    for memmap in (False, True):
+                        data_out = tif.asarray(region=(y0, y1, x0, x1), memmap=memmap)
+                        self.assertTrue(numpy.array_equal(data_out, expected), (path, y0, y1, x0, x1))
+                    expected = full_page[key[:1] + (slice(y0, y1), slice(x0, x1)) + key[1:]]
+                    for maxworkers in (1, 2):
+                        data_out = page.asarray(region=(y0, y1, x0, x1), maxworkers=maxworkers)
+                        self.assertTrue(numpy.array_equal(data_out, expected), (path, y0, y1, x0, x1))
+                with self.assertRaises(ValueError):
+                    tif.asarray(region=(10, 10, 0, 90))
+
+    def test_tag_values_read_in_bulk_and_decoded_lazily(self):
+        data_in = numpy.random.randint(0, 60000, (5, 8, 9)).astype(numpy.uint16)
+        values = {65100: ("H", [7]), 65101: ("H", [1, 2]), 65102: ("H", [1, 2, 3]), 65103: ("I", [70000]),
+                  65104: ("I", [70000, 80000]), 65105: ("d", [1.5, -2.5]), 65106: ("B", [1, 2, 3, 4, 5]),
+                  65107: ("Q", [2**40]), 65108: ("b", [-1, 2, -3, 4, -5, 6, -7, 8, -9])}
+        extratags = [(code, dtype, len(value), value, False) for code, (dtype, value) in values.items()]
+        extratags.append((65109, "s", 0, "a description", False))
+        for bigtiff in (False, True):
+            for byteorder in ("<", ">"):
+                tifffile.imsave(self.path(), data_in, compress=6, bigtiff=bigtiff, byteorder=byteorder,
+                                resolution=(2.5, 4.0), extratags=extratags)
+                with tifffile.TiffFile(self.path()) as tif:
+                    self.assertEqual(len(tif.pages), 5)
+                    tags = [page.tags for page in tif.pages]
+                    self.assertTrue(numpy.array_equal(tif.asarray(), data_in))
+                # values stored outside the tag structures are read from the closed file on first access
+                for page_tags in tags:
+                    for code, (dtype, value) in values.items():
+                        self.assertEqual(numpy.ravel(page_tags[str(code)].value).tolist(), value, (code, bigtiff, byteorder))
+                    self.assertEqual(page_tags["65109"].value, b"a description")
+                    self.assertEqual(page_tags["image_width"].value, 9)
+                    self.assertEqual(page_tags["image_length"].value, 8)
+                    self.assertEqual(page_tags["x_resolution"].value, (5, 2))
+                    self.assertEqual(page_tags["y_resolution"].value, (4, 1))
+                    self.assertEqual(page_tags["compression"].value, 32946)  # deflate
+                    self.assertEqual(len(page_tags["strip_offsets"].value), 1)
+
+    def test_header_cache_reuses_pages_until_file_changes(self):
+        data_in = numpy.random.randint(0, 60000, (7, 40, 50)).astype(numpy.uint16)
+        cache = header_cache.HeaderCache(self.path("cache"))
+        extratags = [(65100, "d", 2, (1.5, -2.5), False), (65101, "s", 0, "a description", False)]
+        tifffile.imsave(self.path(), data_in, compress=6, resolution=(2.5, 4.0), extratags=extratags)
+
+        def read(**kwargs):
+            with tifffile.TiffFile(self.path(), **kwargs) as tif:
+                tags = [dict((name, numpy.ravel(tag.value).tolist()) for name, tag in page.tags.items()) for page in tif.pages]
+                return len(tif.pages), tags, tif.asarray()
+
+        expected = read()
+        for hits in (0, 1, 2):
+            pages, tags, data_out = read(cache=cache)
+            self.assertEqual((cache.hits, cache.misses), (hits, 1))
+            self.assertEqual(pages, expected[0])
+            self.assertEqual(tags, expected[1])
+            self.assertTrue(numpy.array_equal(data_out, data_in))
+        # a file of another size
+        tifffile.imsave(self.path(), data_in[:5])
+        size = os.path.getsize(self.path())
+        pages, tags, data_out = read(cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        self.assertEqual(data_out.shape, (5, 40, 50))
+        self.assertTrue(numpy.array_equal(data_out, data_in[:5]))
+        # a file of the same size that was modified
+        tifffile.imsave(self.path(), data_in[2:7])
+        os.utime(self.path(), ns=(0, 0))
+        self.assertEqual(os.path.getsize(self.path()), size)
+        pages, tags, data_out = read(cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+        self.assertTrue(numpy.array_equal(data_out, data_in[2:7]))
+
+    def test_page_index_reads_match_reading_the_ifd_chain(self):
+        data_in = numpy.random.randint(0, 60000, (30, 40, 50)).astype(numpy.uint16)
+        cache = header_cache.HeaderCache(self.path("cache"))
+        files = list()
+        for name, kwargs in (("strips.tif", dict(compress=6)), ("tiles.tif", dict(compress=6, tile=(16, 16))),
+                             ("contiguous.tif", dict()), ("imagej.tif", dict(imagej=True))):
+            tifffile.imsave(self.path(name), data_in, **kwargs)
+            files.append(self.path(name))
+        for i, path in enumerate(files):
+            with tifffile.TiffFile(path) as tif:
+                chain = [page.asarray() for page in tif.pages]
+                series = tif.asarray()
+            for hits in (i, i + 1):
+                with tifffile.TiffFile(path, index=cache) as tif:
+                    self.assertEqual((cache.hits, cache.misses), (hits, i + 1))
+                    self.assertEqual(len(tif.pages), len(chain))
+                    # read pages out of order, the last one first
+                    for index in (-1, len(chain) // 2, 0):
+                        self.assertTrue(numpy.array_equal(tif.pages[index].asarray(), chain[index]), (path, index))
+                    self.assertTrue(numpy.array_equal(tif.pages[-1].asarray(region=(5, 25, 10, 30)),
+                                                      chain[-1][..., 5:25, 10:30]), path)
+                    self.assertTrue(numpy.array_equal(tif.asarray(), series), path)
+                    self.assertTrue(numpy.array_equal(series, data_in), path)
+
+    def test_sequence_threaded_read_matches_serial_read(self):
+        data_in = numpy.random.randint(0, 60000, (2, 12, 20, 30)).astype(numpy.uint16)
+        for c in range(2):
+            for t in range(12):
+                tifffile.imsave(self.path("image_c%d_t%03d.tif" % (c + 1, t)), data_in[c, t], compress=(t % 2) * 6)
+        with tifffile.TiffSequence(self.path("image_*.tif")) as sequence:
+            self.assertEqual((sequence.axes, sequence.shape), ("CT", (2, 12)))
+            serial = sequence.asarray()
+            self.assertTrue(numpy.array_equal(serial, data_in))
+            for maxworkers in (2, 5):
+                self.assertTrue(numpy.array_equal(sequence.asarray(maxworkers=maxworkers), serial))
+            data_out = sequence.asarray(memmap=True, tempdir=self.directory.name, maxworkers=3)
+            self.assertIsInstance(data_out, numpy.memmap)
+            self.assertTrue(numpy.array_equal(data_out, serial))
+            del data_out
+        # an image of another shape, which also leaves t012 of c1 missing
+        tifffile.imsave(self.path("image_c2_t012.tif"), data_in[0, 0, :10])
+        with self.assertWarns(UserWarning):
+            sequence = tifffile.TiffSequence(self.path("image_*.tif"))
+        with self.assertRaises(ValueError):
+            sequence.asarray(maxworkers=4)
+
+    def test_decode_into_out_and_stack_pages(self):
+        data_in = numpy.random.randint(0, 60000, (6, 37, 53)).astype(numpy.uint16)
+        rgb_in = numpy.random.randint(0, 255, (37, 53, 3)).astype(numpy.uint8)
+        files = list()
+        for name, data, kwargs in (("contiguous.tif", data_in[0], dict()), ("strips.tif", data_in, dict(compress=6)),
+                                   ("tiles.tif", data_in, dict(compress=6, tile=(16, 32))),
+                                   ("rgb.tif", rgb_in, dict(compress=6, photometric="rgb"))):
+            tifffile.imsave(self.path(name), data, **kwargs)
+            files.append(self.path(name))
+        write_strips(self.path("planar.tif"), data_in[:3], 5, planar=True)
+        files.append(self.path("planar.tif"))
+        for path in files:
+            with tifffile.TiffFile(path) as tif:
+                for page in tif.pages:
+                    expected = page.asarray()
+                    out = numpy.zeros_like(expected)
+                    self.assertIs(page.asarray(out=out), out)
+                    self.assertTrue(numpy.array_equal(out, expected), path)
+                    # out that is not C contiguous is filled by a copy
+                    out = numpy.zeros(expected.shape[:-1] + (2 * expected.shape[-1], ), expected.dtype)[..., ::2]
+                    self.assertIs(page.asarray(out=out), out)
+                    self.assertTrue(numpy.array_equal(out, expected), path)
+                    out = numpy.zeros_like(expected[..., 5:25, 10:30, :] if page.axes[-1] == "S" else expected[..., 5:25, 10:30])
+                    self.assertIs(page.asarray(region=(5, 25, 10, 30), out=out), out)
+                    self.assertTrue(numpy.array_equal(out, page.asarray(region=(5, 25, 10, 30))), path)
+        stack_pages_flush_size = tifffile.stack_pages_flush_size
+        tifffile.stack_pages_flush_size = 3 * data_in[0].nbytes  # flush every third page
+        try:
+            for path in files[1:3]:
+                with tifffile.TiffFile(path) as tif:
+                    for memmap in (False, True):
+                        data_out = tifffile.stack_pages(tif.pages, memmap=memmap, tempdir=self.directory.name)
+                        self.assertEqual(isinstance(data_out, numpy.memmap), memmap)
+                        self.assertTrue(numpy.array_equal(data_out, data_in), path)
+                        del data_out
+        finally:
+            tifffile.stack_pages_flush_size = stack_pages_flush_size
+        # uncompressed data end at the end of the file, so cut them short
+        with open(self.path("contiguous.tif"), "rb") as f:
+            truncated = f.read()[:-1000]
+        with open(self.path("truncated.tif"), "wb") as f:
+            f.write(truncated)
+        with tifffile.TiffFile(self.path("truncated.tif")) as tif:
+            with self.assertRaises(IOError):
+                tif.pages[0].asarray(out=numpy.zeros_like(data_in[0]))
+
+    def test_predictors_round_trip(self):
+        for dtype in (numpy.uint8, numpy.uint16, numpy.int16, numpy.uint32):
+            for data_in, kwargs in ((numpy.random.randint(0, 100, (4, 37, 53)).astype(dtype), dict()),
+                                    (numpy.random.randint(0, 100, (37, 53, 3)).astype(dtype), dict(photometric="rgb")),
+                                    (numpy.random.randint(0, 100, (4, 37, 53)).astype(dtype), dict(tile=(16, 32)))):
+                tifffile.imsave(self.path(), data_in, compress=6, predictor="horizontal", **kwargs)
+                with tifffile.TiffFile(self.path()) as tif:
+                    self.assertEqual(tif.pages[0].predictor, "horizontal")
+                    self.assertTrue(numpy.array_equal(tif.asarray(), data_in), (dtype, kwargs))
+                    self.assertTrue(numpy.array_equal(tif.pages[-1].asarray(maxworkers=2), tif.pages[-1].asarray()))
+        for dtype in (numpy.float16, numpy.float32, numpy.float64):
+            for data_in, kwargs in ((numpy.random.randn(4, 37, 53).astype(dtype), dict()),
+                                    (numpy.random.randn(37, 53, 3).astype(dtype), dict(photometric="rgb"))):
+                for byteorder in ("<", ">"):
+                    tifffile.imsave(self.path(), data_in, compress=6, predictor="float", byteorder=byteorder, **kwargs)
+                    with tifffile.TiffFile(self.path()) as tif:
+                        self.assertEqual(tif.pages[0].predictor, "float")
+                        self.assertTrue(numpy.array_equal(tif.asarray(), data_in), (dtype, kwargs, byteorder))
+                encoded = tifffile.encode_floats(data_in.reshape(data_in.shape[-3:] if kwargs else data_in.shape + (1, )))
+                self.assertEqual(encoded.dtype, data_in.dtype)
+                self.assertTrue(numpy.array_equal(tifffile.decode_floats(encoded), data_in.reshape(encoded.shape)))
+        for data_in, kwargs in ((numpy.zeros((8, 8), numpy.uint16), dict(predictor="horizontal")),
+                                (numpy.zeros((8, 8), numpy.float32), dict(predictor="horizontal", compress=6)),
+                                (numpy.zeros((8, 8), numpy.uint16), dict(predictor="float", compress=6)),
+                                (numpy.zeros((8, 8), numpy.float32), dict(predictor="float", compress=6, tile=(16, 16))),
+                                (numpy.zeros((8, 8), numpy.uint16), dict(predictor="other", compress=6))):
+            with self.assertRaises(ValueError):
+                tifffile.imsave(self.path(), data_in, **kwargs)
+
+    def test_encode_packbits_and_lzw_round_trip(self):
+        noise = numpy.random.randint(0, 255, 100000).astype(numpy.uint8).tobytes()
+        runs = bytes(numpy.repeat(numpy.arange(1000) % 7, numpy.arange(1000) % 300).astype(numpy.uint8))
+        for data in (b"", b"a", b"ab", b"aaa", b"a" * 129, b"a" * 1000 + b"ab" * 200, noise, runs, noise + runs):
+            encoded = tifffile.encode_packbits(data)
+            self.assertEqual(tifffile.decode_packbits(encoded), data)
+            if data == noise:
+                # at most one header per 128 literal bytes
+                self.assertLessEqual(len(encoded), len(data) + len(data) // 128 + 1)
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                # noise fills the table, so it is cleared and code widths reset
+                self.assertEqual(tifffile.decode_lzw(tifffile.encode_lzw(data)), data)
+
+    def test_codecs_round_trip(self):
+        data_in = numpy.random.randint(0, 100, (5, 37, 53)).astype(numpy.uint16)
+        names = [name for name, codec in tifffile.TIFF_CODECS.items() if codec.encode is not None]
+        self.assertTrue({"deflate", "adobe_deflate", "packbits", "lzw"} <= set(names))
+        for name in names:
+            codec = tifffile.TIFF_CODECS[name]
+            self.assertEqual(tifffile.TIFF_COMPESSIONS[codec.code], name)
+            # empty strips or tiles must read back
+            self.assertEqual(codec.decode(codec.encode(numpy.zeros((1, 0, 5, 1), numpy.uint8), codec.level)), b"")
+            compress = [name] if codec.level is None else [name, (name, 1)]
+            for compress in compress:
+                for kwargs in (dict(), dict(tile=(16, 32)), dict(predictor="horizontal")):
+                    tifffile.imsave(self.path(), data_in, compress=compress, **kwargs)
+                    with tifffile.TiffFile(self.path()) as tif:
+                        self.assertEqual(tif.pages[0].compression, name)
+                        self.assertTrue(numpy.array_equal(tif.asarray(), data_in), (compress, kwargs))
+                        self.assertTrue(numpy.array_equal(tif.pages[-1].asarray(maxworkers=2), data_in[-1]), (compress, kwargs))
+        with self.assertRaises(ValueError):
+            tifffile.imsave(self.path(), data_in, compress="unknown")
+        for compress in (10, -1, ("deflate", 10), ("deflate", -1), ("deflate", 6.5), ("deflate", "6"), ("deflate", True)):
+            with self.assertRaises(ValueError):
+                tifffile.imsave(self.path(), data_in, compress=compress)
+
+    def test_register_codec_replaces_codecs(self):
+        registries = (tifffile.TIFF_CODECS, tifffile.TIFF_DECOMPESSORS, tifffile.TIFF_COMPESSIONS)
+        saved = [dict(registry) for registry in registries]
+        data_in = numpy.random.randint(0, 100, (5, 37, 53)).astype(numpy.uint16)
+        try:
+            tifffile.register_codec(65001, "inverted", lambda x: bytes(255 - b for b in x),
+                                    lambda data, level: bytes(255 - b for b in data.tobytes()))
+            tifffile.imsave(self.path(), data_in, compress="inverted")
+            with tifffile.TiffFile(self.path()) as tif:
+                self.assertEqual(tif.pages[0].compression, "inverted")
+                self.assertTrue(numpy.array_equal(tif.asarray(), data_in))
+            # the same code under a new name
+            codec = tifffile.register_codec(65001, "negated", lambda x: bytes(255 - b for b in x))
+            self.assertIs(tifffile.TIFF_CODECS["negated"], codec)
+            self.assertNotIn("inverted", tifffile.TIFF_CODECS)
+            self.assertNotIn("inverted", tifffile.TIFF_DECOMPESSORS)
+            with tifffile.TiffFile(self.path()) as tif:
+                self.assertEqual(tif.pages[0].compression, "negated")
+                self.assertTrue(numpy.array_equal(tif.asarray(), data_in))
+            with self.assertRaises(ValueError):
+                tifffile.imsave(self.path(), data_in, compress="negated")  # decode only
+            # the same name under a new code
+            tifffile.register_codec(65002, "negated", lambda x: x)
+            self.assertNotIn(65001, tifffile.TIFF_COMPESSIONS)
+            self.assertEqual(tifffile.TIFF_CODECS["negated"].code, 65002)
+            # only codecs releasing the GIL are decoded on threads
+            for releases_gil in (False, True):
+                threads = set()
+
+                def decode(x):
+                    threads.add(threading.get_ident())
+                    return zlib.decompress(x)
+                tifffile.register_codec(65003, "threads", decode, tifffile.TIFF_CODECS["deflate"].encode, 6, releases_gil)
+                tifffile.imsave(self.path(), data_in, compress="threads", tile=(16, 16))
+                with tifffile.TiffFile(self.path()) as tif:
+                    self.assertTrue(numpy.array_equal(tif.pages[0].asarray(maxworkers=4), data_in[0]))
+                self.assertEqual(threads == {threading.get_ident()}, not releases_gil)
+        finally:
+            for registry, items in zip(registries, saved):
+                registry.clear()
+                registry.update(items)
+
+
+if __name__ == "__main__":
+    unittest.main()